@@ -0,0 +1,110 @@
+"""
+Benchmark comparing the thread and asyncio engines of the train location poller.
+
+Serves a local mock of the CTA train positions API with a skewed response time
+distribution, then runs many simulated invocations of each engine and reports the
+latency percentiles and CPU time of fetching all train lines. Billed Lambda duration
+follows the invocation latency, so the p99 and CPU columns are the ones to compare.
+
+Run from the root of the repository with `python -m benchmarks.bench_fetch_engines`.
+"""
+
+import http.server
+import json
+import random
+import statistics
+import threading
+import time
+import urllib.parse
+from unittest.mock import patch
+
+from lambdas.train_location_fetch import main as train_location_fetch
+from lambdas.train_location_fetch.main import aiohttp, fetch_all_lines
+
+# Number of simulated invocations per engine
+INVOCATIONS = 200
+
+# Median and 1-in-50 slow response time of the mock API in seconds
+MEDIAN_LATENCY_SECONDS = 0.05
+SLOW_LATENCY_SECONDS = 0.4
+
+
+class MockApiRequestHandler(http.server.BaseHTTPRequestHandler):
+    """Responds like the CTA API after a randomized delay."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        params = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        if random.random() < 0.02:
+            time.sleep(SLOW_LATENCY_SECONDS)
+        else:
+            time.sleep(random.lognormvariate(0, 0.3) * MEDIAN_LATENCY_SECONDS)
+        body = json.dumps({"ctatt": {"route": [{"@name": params["rt"][0]}]}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockApiServer(http.server.ThreadingHTTPServer):
+    """Threaded mock API server accepting every line's connection at once."""
+
+    daemon_threads = True
+    request_queue_size = 64
+
+
+def time_invocations(engine: str) -> tuple[list[float], float]:
+    """
+    Time simulated invocations of one engine.
+
+    Args:
+        engine: The fetch engine name.
+
+    Returns:
+        Tuple of the wall time of each invocation in seconds, and the mean CPU time of
+        the client per invocation in seconds (including the mock server's threads).
+    """
+    timings = []
+    cpu_start = time.process_time()
+    for _ in range(INVOCATIONS):
+        start = time.perf_counter()
+        fetch_all_lines(api_key="benchmark", engine=engine)
+        timings.append(time.perf_counter() - start)
+    return timings, (time.process_time() - cpu_start) / INVOCATIONS
+
+
+def main():
+    server = MockApiServer(("127.0.0.1", 0), MockApiRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/api/1.0/ttpositions.aspx"
+    train_location_fetch.logger.disabled = True
+
+    print(f"{INVOCATIONS} invocations per engine against a local mock API")
+    print(f"{'engine':<10}{'mean':>10}{'p50':>10}{'p99':>10}{'max':>10}{'CPU':>10}")
+    with patch.object(train_location_fetch, "API_BASE_URL", url):
+        for engine in ["threads", "asyncio"]:
+            if engine == "asyncio" and aiohttp is None:
+                print(f"{engine:<10}{'skipped':>10}  (aiohttp not installed)")
+                continue
+            timings, cpu_time = time_invocations(engine)
+            timings.sort()
+            p99 = timings[int(len(timings) * 0.99) - 1]
+            print(
+                f"{engine:<10}{statistics.mean(timings) * 1000:>8.1f}ms"
+                f"{statistics.median(timings) * 1000:>8.1f}ms{p99 * 1000:>8.1f}ms"
+                f"{timings[-1] * 1000:>8.1f}ms{cpu_time * 1000:>8.1f}ms"
+            )
+    if train_location_fetch._async_http_session is not None:
+        train_location_fetch.get_event_loop().run_until_complete(
+            train_location_fetch._async_http_session.close()
+        )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
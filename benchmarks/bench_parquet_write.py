@@ -0,0 +1,161 @@
+"""
+Benchmark for writing processed train locations to Parquet.
+
+Builds several synthetic days of train locations and times the original local CSV dump
+and the DuckDB Parquet writer, either opening a new connection for every write or
+reusing one connection. Each variant runs in its own process so its peak resident
+memory can be reported. Output is written to a temporary local directory, so S3
+transfer and httpfs setup time are not included.
+
+Run from the root of the repository with `python -m benchmarks.bench_parquet_write`.
+"""
+
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+import duckdb
+import pandas as pd
+
+from benchmarks.bench_snapshot_parsing import build_synthetic_day, parse_with_backend
+from lambdas.process_raw_cta_data.main import (
+    TRAIN_LOCATIONS_PARTITION_COLUMNS,
+    TRAIN_LOCATIONS_SORT_COLUMNS,
+    get_service_date,
+    write_df_to_parquet,
+)
+
+# Number of synthetic days of locations written per run
+DAYS = 7
+
+# Number of writes timed per variant
+WRITES = 3
+
+
+def build_locations(days: int) -> pd.DataFrame:
+    """
+    Build synthetic train locations with a service_date column.
+
+    Args:
+        days: Number of synthetic days to generate.
+
+    Returns:
+        pandas DataFrame of train locations.
+    """
+    frames = [
+        parse_with_backend(build_synthetic_day(seed=day), "json") for day in range(days)
+    ]
+    for day, frame in enumerate(frames):
+        for column in [
+            "current_timestamp",
+            "prediction_timestamp",
+            "predicted_arrival",
+        ]:
+            frame[column] += pd.Timedelta(days=day)
+    df = pd.concat(frames, ignore_index=True)
+    return df.assign(service_date=get_service_date(df["current_timestamp"]))
+
+
+def write_csv(df, output_dir: str, write: int):
+    """Write locations the way the handler originally did."""
+    df.to_csv(os.path.join(output_dir, f"output_{write}.csv"), index=False)
+
+
+def write_parquet_new_connection(df, output_dir: str, write: int):
+    """Write locations to partitioned Parquet through a new connection each time."""
+    con = duckdb.connect(database=":memory:")
+    write_df_to_parquet(
+        con=con,
+        df=df,
+        output_path=os.path.join(output_dir, f"run_{write}"),
+        partition_by=TRAIN_LOCATIONS_PARTITION_COLUMNS,
+        order_by=TRAIN_LOCATIONS_SORT_COLUMNS,
+    )
+    con.close()
+
+
+_connection = None
+
+
+def write_parquet_reused_connection(df, output_dir: str, write: int):
+    """Write locations to partitioned Parquet through one reused connection."""
+    global _connection
+    if _connection is None:
+        _connection = duckdb.connect(database=":memory:")
+    write_df_to_parquet(
+        con=_connection,
+        df=df,
+        output_path=os.path.join(output_dir, f"run_{write}"),
+        partition_by=TRAIN_LOCATIONS_PARTITION_COLUMNS,
+        order_by=TRAIN_LOCATIONS_SORT_COLUMNS,
+    )
+
+
+def write_parquet_arrow(df, output_dir: str, write: int):
+    """Write locations converted to an Arrow table through one reused connection."""
+    import pyarrow as pa
+
+    write_parquet_reused_connection(
+        pa.Table.from_pandas(df, preserve_index=False), output_dir, write
+    )
+
+
+VARIANTS = {
+    "csv (original)": write_csv,
+    "parquet, new connection": write_parquet_new_connection,
+    "parquet, reused connection": write_parquet_reused_connection,
+    "parquet, arrow table": write_parquet_arrow,
+}
+
+
+def run_variant(name: str) -> tuple[float, float, float, int]:
+    """
+    Time one variant in the current process.
+
+    Args:
+        name: The variant name in VARIANTS.
+
+    Returns:
+        Tuple of the fastest write in seconds, the peak resident memory in MB before and
+        after writing, and the average number of bytes written per write.
+    """
+    df = build_locations(DAYS)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    best = float("inf")
+    with tempfile.TemporaryDirectory() as output_dir:
+        for write in range(WRITES):
+            start = time.perf_counter()
+            VARIANTS[name](df, output_dir, write)
+            best = min(best, time.perf_counter() - start)
+        output_bytes = sum(
+            os.path.getsize(os.path.join(root, file))
+            for root, _, files in os.walk(output_dir)
+            for file in files
+        )
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return best, rss_before, rss_after, output_bytes // WRITES
+
+
+def main():
+    print(f"Writing {DAYS} synthetic days of train locations, best of {WRITES}")
+    print(f"{'variant':<30}{'time':>9}{'peak RSS':>12}{'RSS growth':>12}{'size':>10}")
+    context = multiprocessing.get_context("spawn")
+    for name in VARIANTS:
+        with context.Pool(processes=1) as pool:
+            try:
+                best, rss_before, rss_after, output_bytes = pool.apply(
+                    run_variant, (name,)
+                )
+            except ImportError as e:
+                print(f"{name:<30}{'skipped':>9}  ({e.name} not installed)")
+                continue
+        print(
+            f"{name:<30}{best:>8.3f}s{rss_after:>9.0f} MB{rss_after - rss_before:>9.0f} MB"
+            f"{output_bytes / 1024 / 1024:>7.1f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+Microbenchmark comparing JSON parser backends for raw train location snapshots.
+
+Builds a synthetic day of 1-minute polls across all 8 train lines and times the original
+parser (stdlib json.loads, one dict per train and pd.DataFrame) against each installed
+backend feeding the columnar record builder.
+
+Run from the root of the repository with `python -m benchmarks.bench_snapshot_parsing`.
+"""
+
+import datetime
+import functools
+import json
+import random
+import time
+
+import pandas as pd
+
+from lambdas.process_raw_cta_data.main import TrainRecordColumns, get_snapshot_parser
+
+# Approximate number of trains in service per line at a time
+TRAINS_PER_ROUTE = {
+    "red": 24,
+    "blue": 22,
+    "brn": 14,
+    "g": 14,
+    "org": 10,
+    "p": 6,
+    "pink": 8,
+    "y": 2,
+}
+POLLS_PER_DAY = 24 * 60
+STATIONS = [f"Station {i}" for i in range(40)]
+
+
+def build_synthetic_day(seed: int = 0) -> list[bytes]:
+    """
+    Build a synthetic day of raw Firehose lines.
+
+    Args:
+        seed: Seed for the random number generator.
+
+    Returns:
+        List of encoded NDJSON lines, one per poll.
+    """
+    rng = random.Random(seed)
+    start = datetime.datetime(2026, 2, 27)
+    lines = []
+    for poll in range(POLLS_PER_DAY):
+        poll_time = start + datetime.timedelta(minutes=poll)
+        data = []
+        for route_name, train_count in TRAINS_PER_ROUTE.items():
+            trains = [
+                {
+                    "rn": str(100 + run),
+                    "destSt": "30173",
+                    "destNm": rng.choice(STATIONS),
+                    "trDr": rng.choice(["1", "5"]),
+                    "nextStaId": str(40000 + rng.randrange(40)),
+                    "nextStpId": str(30000 + rng.randrange(300)),
+                    "nextStaNm": rng.choice(STATIONS),
+                    "prdt": poll_time.isoformat(),
+                    "arrT": (
+                        poll_time + datetime.timedelta(seconds=rng.randrange(600))
+                    ).isoformat(),
+                    "isApp": rng.choice(["0", "1"]),
+                    "isDly": "0",
+                    "flags": None,
+                    "lat": "41.97",
+                    "lon": "-87.66",
+                    "heading": "89",
+                }
+                for run in range(train_count)
+            ]
+            data.append(
+                {
+                    "ctatt": {
+                        "tmst": poll_time.isoformat(),
+                        "errCd": "0",
+                        "errNm": None,
+                        "route": [{"@name": route_name, "train": trains}],
+                    }
+                }
+            )
+        snapshot = {"timestamp": poll_time.isoformat() + "+00:00", "data": data}
+        lines.append(json.dumps(snapshot).encode("utf-8"))
+    return lines
+
+
+def parse_with_original_parser(lines: list[bytes]) -> pd.DataFrame:
+    """
+    Parse lines the way extract_cta_data_from_s3 originally did.
+
+    Args:
+        lines: Encoded NDJSON lines.
+
+    Returns:
+        pandas DataFrame built from one dictionary per train.
+    """
+    records = []
+    for line in lines:
+        json_data = json.loads(line.decode("utf-8"))
+        ingestion_timestamp = json_data.get("timestamp")
+        for data_item in json_data.get("data", []):
+            ctatt = data_item.get("ctatt", {})
+            for route in ctatt.get("route", []):
+                for train in route.get("train", []):
+                    records.append(
+                        {
+                            "ingestion_timestamp": ingestion_timestamp,
+                            "current_timestamp": ctatt.get("tmst"),
+                            "error_code": ctatt.get("errCd"),
+                            "error_number": ctatt.get("errNm"),
+                            "route_name": route.get("@name"),
+                            "run_number": train.get("rn"),
+                            "destination_station_id": train.get("destSt"),
+                            "destination_station_name": train.get("destNm"),
+                            "train_direction": train.get("trDr"),
+                            "next_station_id": train.get("nextStaId"),
+                            "next_stop_id": train.get("nextStpId"),
+                            "next_station_name": train.get("nextStaNm"),
+                            "prediction_timestamp": train.get("prdt"),
+                            "predicted_arrival": train.get("arrT"),
+                            "is_approaching": train.get("isApp"),
+                            "is_delayed": train.get("isDly"),
+                        }
+                    )
+    return pd.DataFrame(records)
+
+
+def parse_with_backend(lines: list[bytes], backend: str) -> pd.DataFrame:
+    """
+    Parse lines with a parser backend and the columnar record builder.
+
+    Args:
+        lines: Encoded NDJSON lines.
+        backend: The parser backend name.
+
+    Returns:
+        pandas DataFrame built by the columnar record builder.
+    """
+    parser = get_snapshot_parser(backend)
+    columns = TrainRecordColumns()
+    for line in lines:
+        columns.append_snapshot(parser.decode(line))
+    return columns.to_dataframe()
+
+
+def decode_only(lines: list[bytes], backend: str) -> list:
+    """
+    Decode lines with a parser backend without building any records.
+
+    Args:
+        lines: Encoded NDJSON lines.
+        backend: The parser backend name.
+
+    Returns:
+        List of decoded snapshots.
+    """
+    decode = get_snapshot_parser(backend).decode
+    return [decode(line) for line in lines]
+
+
+def time_best_of(func, repeat: int = 3) -> tuple[float, object]:
+    """
+    Time a function, keeping the fastest of several runs.
+
+    Args:
+        func: Zero-argument callable to time.
+        repeat: Number of runs.
+
+    Returns:
+        Tuple of the fastest wall time in seconds and the value returned.
+    """
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    lines = build_synthetic_day()
+    total_mb = sum(len(line) for line in lines) / 1024 / 1024
+    print(f"Synthetic day: {len(lines)} polls, {total_mb:.1f} MB of NDJSON")
+
+    baseline, df = time_best_of(lambda: parse_with_original_parser(lines))
+    print(f"{'original (json + dicts)':<28}{baseline:>8.3f}s  {len(df)} rows")
+
+    for backend in ["json", "orjson", "msgspec"]:
+        try:
+            get_snapshot_parser(backend)
+        except ValueError:
+            print(f"{backend:<28}{'not installed':>9}")
+            continue
+        decode_elapsed, _ = time_best_of(functools.partial(decode_only, lines, backend))
+        elapsed, df = time_best_of(
+            functools.partial(parse_with_backend, lines, backend)
+        )
+        print(
+            f"{backend + ' + columns':<28}{elapsed:>8.3f}s  {len(df)} rows  "
+            f"{baseline / elapsed:.1f}x  (decode only {decode_elapsed:.3f}s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -141,7 +141,9 @@ data "aws_iam_policy_document" "gtfs_data_fetch_lambda_policy_document" {
     effect = "Allow"
 
     actions = [
-      "s3:PutObject"
+      "s3:PutObject",
+      "s3:GetObject",
+      "s3:AbortMultipartUpload"
     ]
 
     resources = [
@@ -178,8 +180,13 @@ resource "aws_lambda_function" "gtfs_data_fetch_lambda" {
   runtime                        = "python3.13"
   filename                       = "../../lambdas/gtfs_data_fetch/deployment_package.zip"
   source_code_hash               = filebase64sha256("../../lambdas/gtfs_data_fetch/deployment_package.zip")
-  timeout                        = 60
+  timeout                        = 180
   memory_size                    = 1024
+  # /tmp holds the streamed zip plus one extracted table at a time, the largest being
+  # stop_times.txt, which alone outgrows the 512 MB default
+  ephemeral_storage {
+    size = 2048
+  }
   environment {
     variables = {
       ACCOUNT_NUMBER = local.account_id
@@ -217,6 +224,25 @@ data "aws_iam_policy_document" "gtfs_expected_schedule_lambda_policy_document" {
     ]
   }
 
+  # Listing is needed to find the expected schedules summarized by the metrics backfill
+  statement {
+    effect = "Allow"
+
+    actions = [
+      "s3:ListBucket"
+    ]
+
+    resources = [
+      "arn:aws:s3:::${local.account_id}-cta-analytics-project"
+    ]
+
+    condition {
+      test     = "StringLike"
+      variable = "s3:prefix"
+      values   = ["gtfs_expected_cta_schedule/*"]
+    }
+  }
+
   statement {
     effect = "Allow"
 
@@ -352,7 +378,8 @@ resource "aws_sfn_state_machine" "gtfs_lambda_orchestrator" {
           "Type": "Task",
           "Resource": "arn:aws:states:::lambda:invoke",
           "Parameters": {
-            "FunctionName": "${aws_lambda_function.gtfs_expected_schedule_lambda.arn}"
+            "FunctionName": "${aws_lambda_function.gtfs_expected_schedule_lambda.arn}",
+            "Payload.$": "$.Payload"
           },
           "Catch": [{
             "ErrorEquals": ["States.ALL"],
@@ -524,7 +551,7 @@ data "aws_iam_policy_document" "cta_get_train_locations_lambda_policy_document"
     effect = "Allow"
 
     actions = [
-      "firehose:PutRecord"
+      "firehose:PutRecordBatch"
     ]
 
     resources = [
@@ -766,7 +793,37 @@ data "aws_iam_policy_document" "cta_process_train_locations_lambda_policy_docume
     ]
 
     resources = [
-      "arn:aws:s3:::${local.account_id}-cta-analytics-project/raw/*"
+      "arn:aws:s3:::${local.account_id}-cta-analytics-project/raw/*",
+      "arn:aws:s3:::${local.account_id}-cta-analytics-project/train_locations/*",
+      "arn:aws:s3:::${local.account_id}-cta-analytics-project/actual_arrivals/*",
+      "arn:aws:s3:::${local.account_id}-cta-analytics-project/processing_state/*"
+    ]
+  }
+
+  statement {
+    effect = "Allow"
+
+    actions = [
+      "s3:GetObject"
+    ]
+
+    resources = [
+      "arn:aws:s3:::${local.account_id}-cta-analytics-project/raw-api-data/*",
+      "arn:aws:s3:::${local.account_id}-cta-analytics-project/processing_state/*"
+    ]
+  }
+
+  # Listing is needed to read raw partitions, and so a missing state object is reported
+  # as NoSuchKey on the first incremental run rather than AccessDenied
+  statement {
+    effect = "Allow"
+
+    actions = [
+      "s3:ListBucket"
+    ]
+
+    resources = [
+      "arn:aws:s3:::${local.account_id}-cta-analytics-project"
     ]
   }
 
@@ -3,11 +3,12 @@ Lambda function to fetch GTFS data from the CTA and store it in S3.
 
 This function is triggered by an EventBridge rule every night at midnight CST.
 It fetches CTA's GTFS data from https://www.transitchicago.com/downloads/sch_data/ and
-uploads all files from the zip to an S3 bucket
+uploads all files from the zip to an S3 bucket, along with typed Parquet copies of the
+GTFS tables used downstream
 """
 
 import datetime
-import io
+import json
 import logging
 import os
 import sys
@@ -17,7 +18,15 @@ import boto3
 import botocore.exceptions
 import dotenv
 import requests
+from s3transfer.manager import TransferConfig, TransferManager
+from s3transfer.subscribers import BaseSubscriber
 
+from lambdas.shared.duckdb_connection import get_db_connection
+from lambdas.shared.gtfs_schema import (
+    GTFS_PARQUET_PREFIX,
+    GTFS_TABLE_SCHEMAS,
+    build_gtfs_select_list,
+)
 
 logger = logging.getLogger(__name__)
 stream_handler = logging.StreamHandler(sys.stdout)
@@ -27,6 +36,47 @@ stream_handler.setFormatter(formatter)
 logger.addHandler(stream_handler)
 logger.setLevel(logging.DEBUG)
 
+# URL of CTA's GTFS feed
+GTFS_ZIP_URL = "https://www.transitchicago.com/downloads/sch_data/google_transit.zip"
+
+# Path the GTFS zip is streamed to, /tmp is the only writable directory in Lambda
+GTFS_ZIP_PATH = "/tmp/google_transit.zip"
+
+# Directory GTFS text files are extracted to for conversion to Parquet
+GTFS_EXTRACT_DIRECTORY = "/tmp/gtfs"
+
+# Key of the manifest of the GTFS zip members last uploaded to S3
+GTFS_MANIFEST_KEY = "processing_state/gtfs_manifest.json"
+
+# Size of the chunks the GTFS zip is downloaded in
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+
+# Connect and read timeouts for the GTFS feed request in seconds
+REQUEST_TIMEOUT_SECONDS = (10, 60)
+
+# Size of each part of a multipart upload, members smaller than this use a single PUT
+MULTIPART_CHUNK_BYTES = 16 * 1024 * 1024
+
+# Maximum bytes of decompressed parts held in memory across all member uploads. Each
+# member being decompressed can hold one more part while it waits, so the peak is this
+# plus MEMBER_UPLOAD_CONCURRENCY parts, well within the 1024 MB Lambda memory size
+MAX_BYTES_IN_FLIGHT = 256 * 1024 * 1024
+
+# Number of zip members decompressed and uploaded at the same time
+MEMBER_UPLOAD_CONCURRENCY = 4
+
+# Number of concurrent S3 requests (single PUTs and upload parts) across all members
+UPLOAD_REQUEST_CONCURRENCY = 16
+
+# Transfer configuration for uploading zip members, streamed from the zip in parts
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=MULTIPART_CHUNK_BYTES,
+    multipart_chunksize=MULTIPART_CHUNK_BYTES,
+    max_request_concurrency=UPLOAD_REQUEST_CONCURRENCY,
+    max_submission_concurrency=MEMBER_UPLOAD_CONCURRENCY,
+    max_in_memory_upload_chunks=MAX_BYTES_IN_FLIGHT // MULTIPART_CHUNK_BYTES,
+)
+
 
 def get_last_modified_time() -> str:
     """
@@ -69,45 +119,254 @@ def update_last_modified_time(last_modified_time: str):
         raise e
 
 
-def upload_gtfs_zip_to_s3(bucket_name: str, response: requests.Response):
+def format_http_date(timestamp: datetime.datetime) -> str:
+    """
+    Format a UTC timestamp as an HTTP date, as used by the If-Modified-Since header.
+
+    Args:
+        timestamp (datetime.datetime): The naive UTC timestamp to format.
+
+    Returns:
+        str: The timestamp as an HTTP date, e.g. "Mon, 23 Feb 2026 15:00:00 GMT".
+    """
+    return timestamp.strftime("%a, %d %b %Y %H:%M:%S GMT")
+
+
+def download_gtfs_zip(response: requests.Response, zip_path: str) -> int:
+    """
+    Stream the body of the GTFS zip response to a file in chunks.
+
+    Args:
+        response (requests.Response): The streamed HTTP response for the GTFS zip.
+        zip_path (str): The path to write the GTFS zip file to.
+
+    Returns:
+        int: The number of bytes written.
+    """
+    bytes_written = 0
+    with open(zip_path, "wb") as zip_file:
+        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_BYTES):
+            zip_file.write(chunk)
+            bytes_written += len(chunk)
+    logger.info("Downloaded %d bytes of GTFS data to %s", bytes_written, zip_path)
+    return bytes_written
+
+
+class MemberSizeSubscriber(BaseSubscriber):
+    """
+    Provides the uncompressed size of a zip member to its upload.
+
+    Without a known size the upload seeks to the end of the member to measure it, which
+    for a compressed member means decompressing it twice.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+
+    def on_queued(self, future, **kwargs):
+        future.meta.provide_transfer_size(self.size)
+
+
+def get_gtfs_table_name(filename: str) -> str:
+    """
+    Get the GTFS table name of a zip member, e.g. stop_times for stop_times.txt.
+
+    Args:
+        filename (str): The file name of the zip member.
+
+    Returns:
+        str: The GTFS table name.
+    """
+    return os.path.splitext(os.path.basename(filename))[0]
+
+
+def build_gtfs_manifest(zip_path: str) -> dict[str, dict[str, int]]:
+    """
+    Build the manifest of the members of the GTFS zip file from its directory.
+
+    The CRC-32 and size of each member are stored in the zip directory, so no member is
+    decompressed to hash it.
+
+    Args:
+        zip_path (str): The path of the downloaded GTFS zip file.
+
+    Returns:
+        dict: The CRC-32 and uncompressed size of each member, by file name.
+    """
+    with zipfile.ZipFile(zip_path) as zip_ref:
+        return {
+            file_info.filename: {"crc": file_info.CRC, "size": file_info.file_size}
+            for file_info in zip_ref.infolist()
+            if not file_info.is_dir()
+        }
+
+
+def load_gtfs_manifest(bucket_name: str) -> dict[str, dict[str, int]]:
+    """
+    Load the manifest of the GTFS zip members last uploaded to S3.
+
+    Args:
+        bucket_name (str): The name of the S3 bucket.
+
+    Returns:
+        dict: The CRC-32 and uncompressed size of each member, by file name. Empty if
+            no manifest has been saved yet.
+    """
+    s3_client = boto3.client("s3")
+    try:
+        response = s3_client.get_object(Bucket=bucket_name, Key=GTFS_MANIFEST_KEY)
+    except botocore.exceptions.ClientError as e:
+        if e.response["Error"]["Code"] != "NoSuchKey":
+            raise
+        logger.info("No GTFS manifest found, all files will be uploaded.")
+        return {}
+    return json.loads(response["Body"].read())
+
+
+def save_gtfs_manifest(bucket_name: str, manifest: dict[str, dict[str, int]]):
+    """
+    Save the manifest of the GTFS zip members uploaded to S3.
+
+    Args:
+        bucket_name (str): The name of the S3 bucket.
+        manifest (dict): The CRC-32 and uncompressed size of each member, by file name.
+    """
+    s3_client = boto3.client("s3")
+    s3_client.put_object(
+        Bucket=bucket_name, Key=GTFS_MANIFEST_KEY, Body=json.dumps(manifest)
+    )
+    logger.info("Saved GTFS manifest of %d files.", len(manifest))
+
+
+def upload_gtfs_zip_to_s3(
+    bucket_name: str, zip_path: str, filenames: set[str] | None = None
+) -> list[str]:
     """
     Upload the contents of the GTFS zip file to S3.
 
     Args:
         bucket_name (str): The name of the S3 bucket to upload files to.
-        response (requests.Response): The HTTP response containing the raw GTFS zip file data.
+        zip_path (str): The path of the downloaded GTFS zip file.
+        filenames (set[str] | None): The members to upload, or None to upload all.
+
+    Returns:
+        list[str]: The file names of the members successfully uploaded.
     """
     s3_client = boto3.client("s3")
+    uploaded_filenames = []
 
-    # Use BytesIO to handle the stream in memory
-    with zipfile.ZipFile(io.BytesIO(response.content)) as zip_ref:
+    # Members are read from the file on disk and decompressed straight into their
+    # uploads, several at a time, so neither the zip nor a whole member is held in memory
+    with (
+        zipfile.ZipFile(zip_path) as zip_ref,
+        TransferManager(s3_client, config=TRANSFER_CONFIG) as transfer_manager,
+    ):
+        uploads = []
         for file_info in zip_ref.infolist():
             logger.info("Processing file: %s", file_info.filename)
             # Skip directories
             if file_info.is_dir():
                 logger.info("%s is a directory, skipping...", file_info.filename)
                 continue
+            if filenames is not None and file_info.filename not in filenames:
+                logger.info("%s has not changed, skipping...", file_info.filename)
+                continue
+
+            s3_key = f"gtfs_data/{file_info.filename}"
+            logger.info(
+                "Uploading %s to s3://%s/%s",
+                file_info.filename,
+                bucket_name,
+                s3_key,
+            )
+            file_content = zip_ref.open(file_info)
+            future = transfer_manager.upload(
+                fileobj=file_content,
+                bucket=bucket_name,
+                key=s3_key,
+                subscribers=[MemberSizeSubscriber(file_info.file_size)],
+            )
+            uploads.append((file_info, file_content, future))
+
+        for file_info, file_content, future in uploads:
+            try:
+                future.result()
+            except botocore.exceptions.ClientError as e:
+                logger.error("Error uploading %s to S3: %s", file_info.filename, str(e))
+                continue
+            finally:
+                file_content.close()
+            uploaded_filenames.append(file_info.filename)
+    return uploaded_filenames
+
+
+def write_gtfs_table_to_parquet(con, table: str, csv_path: str, output_path: str):
+    """
+    Write a GTFS text file as zstd-compressed Parquet with its declared schema.
 
-            # Read the file content from the zip and upload to S3
-            with zip_ref.open(file_info) as file_content:
-                s3_key = f"gtfs_data/{file_info.filename}"
-                logger.info(
-                    "Uploading %s to s3://%s/%s",
-                    file_info.filename,
-                    bucket_name,
-                    s3_key,
+    Args:
+        con (duckdb.DuckDBPyConnection): The DuckDB connection.
+        table (str): The GTFS table name, a key of GTFS_TABLE_SCHEMAS.
+        csv_path (str): The path of the GTFS text file.
+        output_path (str): The path to write the Parquet file to.
+    """
+    # Every column is read as text and cast explicitly, so no types are sniffed
+    source = f"read_csv('{csv_path}', header = true, all_varchar = true)"
+    source_columns = [
+        row[0] for row in con.execute(f"DESCRIBE SELECT * FROM {source}").fetchall()
+    ]
+    missing_columns = GTFS_TABLE_SCHEMAS[table].keys() - set(source_columns)
+    if missing_columns:
+        logger.warning(
+            "%s is missing columns %s, writing them as NULL",
+            table,
+            sorted(missing_columns),
+        )
+    select_list = build_gtfs_select_list(table=table, source_columns=source_columns)
+    con.execute(
+        f"COPY (SELECT {select_list} FROM {source}) TO '{output_path}' "
+        "(FORMAT PARQUET, COMPRESSION ZSTD)"
+    )
+
+
+def convert_gtfs_zip_to_parquet(
+    bucket_name: str, zip_path: str, tables: set[str] | None = None
+) -> list[str]:
+    """
+    Convert the GTFS tables with a declared schema in the zip file to Parquet in S3.
+
+    Args:
+        bucket_name (str): The name of the S3 bucket to write Parquet files to.
+        zip_path (str): The path of the downloaded GTFS zip file.
+        tables (set[str] | None): The GTFS tables to convert, or None to convert all.
+
+    Returns:
+        list[str]: The names of the converted GTFS tables.
+    """
+    con = get_db_connection()
+    converted_tables = []
+    with zipfile.ZipFile(zip_path) as zip_ref:
+        for file_info in zip_ref.infolist():
+            table = get_gtfs_table_name(file_info.filename)
+            if (
+                not file_info.filename.endswith(".txt")
+                or table not in GTFS_TABLE_SCHEMAS
+                or (tables is not None and table not in tables)
+            ):
+                continue
+
+            output_path = f"s3://{bucket_name}/{GTFS_PARQUET_PREFIX}/{table}.parquet"
+            logger.info("Converting %s to %s", file_info.filename, output_path)
+            csv_path = zip_ref.extract(file_info, GTFS_EXTRACT_DIRECTORY)
+            try:
+                write_gtfs_table_to_parquet(
+                    con=con, table=table, csv_path=csv_path, output_path=output_path
                 )
-                try:
-                    s3_client.upload_fileobj(
-                        Fileobj=file_content,
-                        Bucket=bucket_name,
-                        Key=s3_key,
-                    )
-                except botocore.exceptions.ClientError as e:
-                    logger.error(
-                        "Error uploading %s to S3: %s", file_info.filename, str(e)
-                    )
-                    continue
+            finally:
+                # Only one extracted table is kept next to the zip in /tmp at a time
+                os.remove(csv_path)
+            converted_tables.append(table)
+    return converted_tables
 
 
 def handler(event, context) -> dict[str, str]:
@@ -130,45 +389,111 @@ def handler(event, context) -> dict[str, str]:
 
     bucket_name = f"{os.environ['ACCOUNT_NUMBER']}-cta-analytics-project"
 
+    # Only ask for the feed if it has changed since the last stored modified time
+    stored_last_modified = get_last_modified_time()
+    stored_last_modified_dt = datetime.datetime.strptime(
+        stored_last_modified, "%Y-%m-%dT%H:%M:%S"
+    )
+
     logger.info("Making request to fetch GTFS data from CTA.")
     response = requests.get(
-        "https://www.transitchicago.com/downloads/sch_data/google_transit.zip"
-    )
-    response.raise_for_status()
-    logger.info("Successfully fetched GTFS data from CTA.")
-
-    # Get the last modified date and check if it has been updated since last fetch
-    last_modified = response.headers.get("Last-Modified")
-    if not last_modified:
-        logger.error("Last-Modified header not found in the response")
-        raise ValueError("Last-Modified header not found in the response")
-    last_modified_dt = datetime.datetime.strptime(
-        last_modified, "%a, %d %b %Y %H:%M:%S %Z"
+        GTFS_ZIP_URL,
+        headers={"If-Modified-Since": format_http_date(stored_last_modified_dt)},
+        stream=True,
+        timeout=REQUEST_TIMEOUT_SECONDS,
     )
-    stored_last_modified = get_last_modified_time()
+    try:
+        if response.status_code == 304:
+            logger.info(
+                "GTFS data has not been updated since last fetch. No action taken."
+            )
+            return {
+                "status": "no_update",
+                "message": "GTFS data has not been updated since last fetch.",
+            }
+        response.raise_for_status()
+        logger.info("Successfully fetched GTFS data headers from CTA.")
 
-    # If updated, write the GTFS data to S3 and update the last modified time in Parameter Store
-    if (
-        datetime.datetime.strptime(stored_last_modified, "%Y-%m-%dT%H:%M:%S")
-        >= last_modified_dt
-    ):
-        logger.info("GTFS data has not been updated since last fetch. No action taken.")
-        return {
-            "status": "no_update",
-            "message": "GTFS data has not been updated since last fetch.",
+        # Get the last modified date and check if it has been updated since last fetch,
+        # in case the server ignored the conditional request. The body is only read if
+        # the data has been updated
+        last_modified = response.headers.get("Last-Modified")
+        if not last_modified:
+            logger.error("Last-Modified header not found in the response")
+            raise ValueError("Last-Modified header not found in the response")
+        last_modified_dt = datetime.datetime.strptime(
+            last_modified, "%a, %d %b %Y %H:%M:%S %Z"
+        )
+        if stored_last_modified_dt >= last_modified_dt:
+            logger.info(
+                "GTFS data has not been updated since last fetch. No action taken."
+            )
+            return {
+                "status": "no_update",
+                "message": "GTFS data has not been updated since last fetch.",
+            }
+        download_gtfs_zip(response=response, zip_path=GTFS_ZIP_PATH)
+    finally:
+        response.close()
+
+    # If updated, write the changed GTFS files to S3 and update the last modified time
+    # and manifest. CTA often republishes the zip with most files unchanged
+    logger.info(
+        "GTFS data has been updated since last fetch. Writing updated GTFS data to S3."
+    )
+    try:
+        manifest = build_gtfs_manifest(zip_path=GTFS_ZIP_PATH)
+        stored_manifest = load_gtfs_manifest(bucket_name=bucket_name)
+        changed_filenames = {
+            filename
+            for filename, entry in manifest.items()
+            if stored_manifest.get(filename) != entry
         }
-    else:
-        logger.info(
-            "GTFS data has been updated since last fetch. Writing updated GTFS data to S3."
+        logger.info("Changed GTFS files: %s", sorted(changed_filenames))
+        uploaded_filenames = upload_gtfs_zip_to_s3(
+            bucket_name=bucket_name,
+            zip_path=GTFS_ZIP_PATH,
+            filenames=changed_filenames,
         )
-        upload_gtfs_zip_to_s3(bucket_name=bucket_name, response=response)
-        logger.info("Successfully wrote updated GTFS data to S3.")
+        failed_filenames = changed_filenames - set(uploaded_filenames)
+        # Tables whose raw file failed to upload are left for the next run
+        changed_tables = sorted(
+            get_gtfs_table_name(filename) for filename in uploaded_filenames
+        )
+        converted_tables = convert_gtfs_zip_to_parquet(
+            bucket_name=bucket_name,
+            zip_path=GTFS_ZIP_PATH,
+            tables=set(changed_tables),
+        )
+        logger.info("Converted GTFS tables to Parquet: %s", converted_tables)
+    finally:
+        # Free /tmp space, which persists across invocations in a warm container
+        os.remove(GTFS_ZIP_PATH)
+    logger.info("Successfully wrote updated GTFS data to S3.")
+
+    # Files that failed to upload keep their old manifest entry, and the last
+    # modified time is not advanced, so the next run refetches the zip and
+    # retries them instead of receiving a 304
+    for filename in failed_filenames:
+        if filename in stored_manifest:
+            manifest[filename] = stored_manifest[filename]
+        else:
+            del manifest[filename]
+    save_gtfs_manifest(bucket_name=bucket_name, manifest=manifest)
+    if failed_filenames:
+        logger.warning(
+            "Failed to upload GTFS files %s. Leaving the last modified time "
+            "unchanged so they are retried on the next run.",
+            sorted(failed_filenames),
+        )
+    else:
         logger.info("Updating GTFS data last modified time in Parameter Store.")
         update_last_modified_time(last_modified_dt.strftime("%Y-%m-%dT%H:%M:%S"))
         logger.info(
             "Successfully updated GTFS data last modified time in Parameter Store."
         )
-        return {
-            "status": "updated",
-            "message": "GTFS data has been updated and stored in S3.",
-        }
+    return {
+        "status": "updated",
+        "message": "GTFS data has been updated and stored in S3.",
+        "changed_tables": changed_tables,
+    }
@@ -7,9 +7,17 @@ import logging
 import os
 import sys
 
-import duckdb
 from dotenv import load_dotenv
 
+from lambdas.shared.duckdb_connection import get_db_connection
+from lambdas.shared.gtfs_schema import (
+    GTFS_PARQUET_PREFIX,
+    GTFS_TABLE_SCHEMAS,
+    GTFS_TIME,
+    gtfs_time_to_seconds_sql,
+    seconds_to_gtfs_time_sql,
+)
+
 logger = logging.getLogger(__name__)
 stream_handler = logging.StreamHandler(sys.stdout)
 stream_handler.setLevel(logging.INFO)
@@ -18,68 +26,136 @@ stream_handler.setFormatter(formatter)
 logger.addHandler(stream_handler)
 logger.setLevel(logging.DEBUG)
 
+# Long names of the CTA train routes in the expected schedule
+TRAIN_ROUTE_NAMES = [
+    "Red Line",
+    "Purple Line",
+    "Yellow Line",
+    "Blue Line",
+    "Pink Line",
+    "Green Line",
+    "Orange Line",
+    "Brown Line",
+]
+
+# Range of the stop IDs of train platforms, bus stops and parent stations are outside it
+TRAIN_STOP_ID_MIN = 30000
+TRAIN_STOP_ID_MAX = 39999
+
+# Columns read from each GTFS table the expected schedule is built from, with their
+# types taken from GTFS_TABLE_SCHEMAS. Nothing else is read from the Parquet files
+GTFS_TABLE_COLUMNS = {
+    "calendar": [
+        "service_id",
+        "monday",
+        "tuesday",
+        "wednesday",
+        "thursday",
+        "friday",
+        "saturday",
+        "sunday",
+        "start_date",
+        "end_date",
+    ],
+    "routes": ["route_id", "route_long_name", "route_color"],
+    "stops": ["stop_id", "stop_name"],
+    "stop_times": [
+        "trip_id",
+        "arrival_time",
+        "departure_time",
+        "stop_id",
+        "stop_sequence",
+    ],
+    "trips": ["route_id", "service_id", "trip_id", "direction", "direction_id"],
+}
+
+# Filters applied to GTFS tables in the Parquet scan, before they are joined. Bus stop
+# times are most of stop_times, so this keeps the join a fraction of its unfiltered size
+GTFS_TABLE_FILTERS = {
+    "routes": "route_long_name IN ({})".format(
+        ", ".join(f"'{route_name}'" for route_name in TRAIN_ROUTE_NAMES)
+    ),
+    "stops": f"stop_id BETWEEN {TRAIN_STOP_ID_MIN} AND {TRAIN_STOP_ID_MAX}",
+    "stop_times": f"stop_id BETWEEN {TRAIN_STOP_ID_MIN} AND {TRAIN_STOP_ID_MAX}",
+}
+
+# GTFS tables the expected schedule is built from
+GTFS_TABLES = list(GTFS_TABLE_COLUMNS)
+
+# Bits of the service_pattern column, set if a trip runs on any weekday, on Saturday or
+# on Sunday
+SERVICE_PATTERN_WEEKDAY = 1
+SERVICE_PATTERN_SATURDAY = 2
+SERVICE_PATTERN_SUNDAY = 4
+
+# Prefix of the expected schedules in the S3 bucket
+EXPECTED_SCHEDULE_PREFIX = "gtfs_expected_cta_schedule"
+
+# Prefix of the summary tables of each expected schedule in the S3 bucket, one folder
+# per table with one file per effective date
+SCHEDULE_METRICS_PREFIX = "gtfs_schedule_metrics"
+
 # Only needed for local testing, will do nothing in Lambda environment
 load_dotenv()
 
 
-def get_db_connection() -> duckdb.DuckDBPyConnection:
+def build_gtfs_view_query(table: str, path: str) -> str:
     """
-    Create DuckDB connection to S3.
+    Build the query reading the required columns of a GTFS table with explicit types.
+
+    Args:
+        table: The GTFS table name, a key of GTFS_TABLE_COLUMNS.
+        path: The path of the Parquet file of the table.
 
     Returns:
-        duckdb.DuckDBPyConnection: The DuckDB connection
+        str: The query, with the table's filter applied if it has one.
     """
-    con = duckdb.connect(database=":memory:")
+    select_list = []
+    for column in GTFS_TABLE_COLUMNS[table]:
+        column_type = GTFS_TABLE_SCHEMAS[table][column]
+        if column_type == GTFS_TIME:
+            column_type = "INTEGER"
+        select_list.append(f'CAST("{column}" AS {column_type}) AS "{column}"')
+    query = f"SELECT {', '.join(select_list)} FROM read_parquet('{path}')"
+    if table in GTFS_TABLE_FILTERS:
+        query += f" WHERE {GTFS_TABLE_FILTERS[table]}"
+    return query
 
-    # Set the home directory to /tmp, which is writable in Lambda
-    con.execute("SET home_directory='/tmp';")
 
-    # Explicitly set paths for extensions and secrets
-    con.execute("SET extension_directory='/tmp/duckdb_extensions';")
-    con.execute("SET secret_directory='/tmp/duckdb_secrets';")
-
-    # Explicitly install and load httpfs
-    con.execute("INSTALL httpfs;")
-    con.execute("LOAD httpfs;")
-
-    # Register the credential chain. This automatically looks for ~/.aws/credentials (local)
-    # or IAM user credentials (Streamlit)
-    con.execute("""
-        CREATE OR REPLACE SECRET s3_creds (
-            TYPE S3, 
-            PROVIDER CREDENTIAL_CHAIN
-        );
-    """)
-    return con
-
-
-def handler(event, context):
+def build_service_pattern_sql(calendar: str = "") -> str:
     """
-    Lambda handler function to fetch GTFS data and store it in S3.
+    Build SQL computing the service_pattern bitmask from the calendar day columns.
 
     Args:
-        event: The event data that triggered the Lambda function.
-        context: The context in which the Lambda function is running.
+        calendar: Qualifier of the calendar day columns, e.g. "c." for alias c.
+
+    Returns:
+        str: SQL expression of the service pattern as TINYINT.
     """
-    logger.info("Starting GTFS expected schedule Lambda execution.")
-    logger.info("Event data: %s", event)
-    logger.info("Context data: %s", context)
+    weekdays = " + ".join(
+        f"{calendar}{day}"
+        for day in ["monday", "tuesday", "wednesday", "thursday", "friday"]
+    )
+    return f"""CAST(
+        (CASE WHEN {weekdays} > 0 THEN {SERVICE_PATTERN_WEEKDAY} ELSE 0 END)
+        | (CASE WHEN {calendar}saturday > 0 THEN {SERVICE_PATTERN_SATURDAY} ELSE 0 END)
+        | (CASE WHEN {calendar}sunday > 0 THEN {SERVICE_PATTERN_SUNDAY} ELSE 0 END)
+        AS TINYINT
+    )"""
 
-    con = get_db_connection()
-    bucket = f"{os.environ['ACCOUNT_NUMBER']}-cta-analytics-project"
-    prefix = f"s3://{bucket}/gtfs_data/"
 
-    # Read all input files
-    files = ["calendar", "routes", "stops", "stop_times", "trips"]
-    for f in files:
-        logger.info("Reading %s.txt", f)
-        con.execute(
-            f"CREATE VIEW {f} AS SELECT * FROM read_csv_auto('{prefix}{f}.txt')"
-        )
-        logger.info("Successfully read %s.txt as view %s", f, f)
+def build_expected_schedule_query() -> str:
+    """
+    Build the query joining the GTFS views into the expected schedule.
 
-    # Query to join all data together
-    query = """
+    Returns:
+        str: The query.
+    """
+    # Query to join all data together, with times formatted back to GTFS text. The
+    # views are already filtered, so the join only sees train trips and platforms.
+    # Times are also kept as seconds since midnight with the hour of the service day
+    # (24 and later after midnight), so readers never parse the time text
+    return f"""
         SELECT
             r.route_id,
             r.route_long_name,
@@ -97,8 +173,12 @@ def handler(event, context):
             c.sunday,
             c.start_date,
             c.end_date,
-            st.arrival_time,
-            st.departure_time,
+            {seconds_to_gtfs_time_sql("st.arrival_time")} AS arrival_time,
+            {seconds_to_gtfs_time_sql("st.departure_time")} AS departure_time,
+            st.arrival_time AS arrival_seconds,
+            st.departure_time AS departure_seconds,
+            st.arrival_time // 3600 AS hour,
+            {build_service_pattern_sql(calendar="c.")} AS service_pattern,
             st.stop_id,
             st.stop_sequence,
             s.stop_name
@@ -107,18 +187,225 @@ def handler(event, context):
         JOIN calendar c ON t.service_id = c.service_id
         JOIN stop_times st ON t.trip_id = st.trip_id
         JOIN stops s ON st.stop_id = s.stop_id
-        WHERE r.route_long_name IN (
-            'Red Line',
-            'Purple Line',
-            'Yellow Line',
-            'Blue Line', 
-            'Pink Line',
-            'Green Line',
-            'Orange Line',
-            'Brown Line'
+    """
+
+
+def build_schedule_metrics_queries(source: str, effective_date: int) -> dict[str, str]:
+    """
+    Build the queries of the summary tables of an expected schedule shown on the
+    dashboard, keyed by route, service pattern and hour.
+
+    Each summary is computed separately for weekday, Saturday and Sunday service, so
+    its service_pattern is a single bit. A trip running on several day types is counted
+    in each of them.
+
+    Args:
+        source: The relation with the expected schedule, with the time and service
+            pattern columns.
+        effective_date: The effective date of the expected schedule.
+
+    Returns:
+        dict: The query of each summary table, by table name.
+    """
+    schedule = f"""
+        SELECT
+            s.route_long_name,
+            s.route_color,
+            s.trip_id,
+            s.stop_id,
+            s.start_date,
+            s.arrival_seconds,
+            s.hour,
+            p.service_pattern
+        FROM {source} s
+        JOIN (
+            SELECT unnest([
+                {SERVICE_PATTERN_WEEKDAY},
+                {SERVICE_PATTERN_SATURDAY},
+                {SERVICE_PATTERN_SUNDAY}
+            ])::TINYINT AS service_pattern
+        ) p ON s.service_pattern & p.service_pattern > 0
+    """
+    return {
+        # Trips started per hour of the service day, by the hour of their first stop
+        "trains_per_hour": f"""
+            WITH trip_starts AS (
+                SELECT
+                    route_long_name,
+                    service_pattern,
+                    trip_id,
+                    arg_min(hour, arrival_seconds) AS hour
+                FROM ({schedule})
+                GROUP BY route_long_name, service_pattern, trip_id
+            )
+            SELECT
+                {effective_date} AS effective_date,
+                route_long_name,
+                service_pattern,
+                hour,
+                COUNT(trip_id) AS new_trips_started
+            FROM trip_starts
+            GROUP BY ALL
+            ORDER BY ALL
+        """,
+        # Average minutes between consecutive arrivals at a stop, per hour of the day
+        "headway": f"""
+            WITH lagged_data AS (
+                SELECT
+                    route_long_name,
+                    service_pattern,
+                    hour,
+                    arrival_seconds,
+                    LAG(arrival_seconds) OVER (
+                        PARTITION BY route_long_name, service_pattern, stop_id
+                        ORDER BY arrival_seconds
+                    ) AS prev_seconds
+                FROM ({schedule})
+            )
+            SELECT
+                {effective_date} AS effective_date,
+                route_long_name,
+                service_pattern,
+                hour % 24 AS hour,
+                AVG((arrival_seconds - prev_seconds) / 60.0) AS avg_headway,
+                format('{{:02d}}:{{:02d}}',
+                    (round(AVG((arrival_seconds - prev_seconds) / 60.0) * 60) / 60)::INTEGER,
+                    (round(AVG((arrival_seconds - prev_seconds) / 60.0) * 60) % 60)::INTEGER
+                ) AS avg_headway_mmss
+            FROM lagged_data
+            WHERE prev_seconds IS NOT NULL
+            GROUP BY ALL
+            ORDER BY ALL
+        """,
+        # Distinct trips scheduled per calendar start date
+        "scheduled_runs": f"""
+            SELECT
+                {effective_date} AS effective_date,
+                route_long_name,
+                route_color,
+                service_pattern,
+                start_date,
+                COUNT(DISTINCT trip_id) AS scheduled_runs
+            FROM ({schedule})
+            GROUP BY ALL
+            ORDER BY ALL
+        """,
+    }
+
+
+def write_schedule_metrics(con, source: str, effective_date: int, bucket: str):
+    """
+    Write the summary tables of an expected schedule to S3.
+
+    Args:
+        con (duckdb.DuckDBPyConnection): The DuckDB connection.
+        source: The relation with the expected schedule, with the time and service
+            pattern columns.
+        effective_date: The effective date of the expected schedule.
+        bucket: The name of the S3 bucket.
+    """
+    queries = build_schedule_metrics_queries(
+        source=source, effective_date=effective_date
+    )
+    for table, query in queries.items():
+        output_path = (
+            f"s3://{bucket}/{SCHEDULE_METRICS_PREFIX}/{table}/{effective_date}.parquet"
+        )
+        con.execute(
+            f"COPY ({query}) TO '{output_path}' (FORMAT PARQUET, COMPRESSION ZSTD)"
+        )
+        logger.info("Successfully wrote %s summary to %s", table, output_path)
+
+
+def backfill_schedule_metrics(con, bucket: str) -> list[int]:
+    """
+    Write the summary tables of every expected schedule already in S3.
+
+    Expected schedules written before the time and service pattern columns existed are
+    supported, as those columns are derived from the text times and calendar days.
+
+    Args:
+        con (duckdb.DuckDBPyConnection): The DuckDB connection.
+        bucket: The name of the S3 bucket.
+
+    Returns:
+        list[int]: The effective dates of the expected schedules summarized.
+    """
+    files = [
+        row[0]
+        for row in con.execute(
+            f"SELECT file FROM glob('s3://{bucket}/{EXPECTED_SCHEDULE_PREFIX}/*.parquet')"
+        ).fetchall()
+    ]
+    effective_dates = []
+    for file in files:
+        effective_date = int(os.path.splitext(os.path.basename(file))[0])
+        arrival_seconds = gtfs_time_to_seconds_sql("arrival_time")
+        source = f"""(
+            SELECT
+                route_long_name,
+                route_color,
+                trip_id,
+                stop_id,
+                start_date,
+                {arrival_seconds} AS arrival_seconds,
+                {arrival_seconds} // 3600 AS hour,
+                {build_service_pattern_sql()} AS service_pattern
+            FROM read_parquet('{file}')
+        )"""
+        write_schedule_metrics(
+            con=con, source=source, effective_date=effective_date, bucket=bucket
         )
-        AND s.stop_id >= 30000 AND s.stop_id < 40000
+        effective_dates.append(effective_date)
+    return effective_dates
+
+
+def handler(event, context):
+    """
+    Lambda handler function to fetch GTFS data and store it in S3.
+
+    Args:
+        event: The event data that triggered the Lambda function.
+        context: The context in which the Lambda function is running.
     """
+    logger.info("Starting GTFS expected schedule Lambda execution.")
+    logger.info("Event data: %s", event)
+    logger.info("Context data: %s", context)
+
+    # Summarize the expected schedules written before the summary tables existed
+    if event.get("backfill_metrics"):
+        effective_dates = backfill_schedule_metrics(
+            con=get_db_connection(),
+            bucket=f"{os.environ['ACCOUNT_NUMBER']}-cta-analytics-project",
+        )
+        return {"status": "success", "effective_dates": effective_dates}
+
+    # Skip the rebuild if the GTFS data fetch reports that none of the input tables
+    # changed, e.g. when only shapes.txt was republished
+    changed_tables = event.get("changed_tables")
+    if changed_tables is not None and not set(changed_tables) & set(GTFS_TABLES):
+        logger.info(
+            "None of the GTFS tables %s changed, skipping expected schedule rebuild.",
+            GTFS_TABLES,
+        )
+        return {"status": "skipped", "changed_tables": changed_tables}
+
+    con = get_db_connection()
+    bucket = f"{os.environ['ACCOUNT_NUMBER']}-cta-analytics-project"
+    prefix = f"s3://{bucket}/{GTFS_PARQUET_PREFIX}/"
+
+    # Read the required columns of all input files, typed Parquet written by the GTFS
+    # data fetch, filtered to train routes and platforms
+    for f in GTFS_TABLES:
+        logger.info("Reading %s.parquet", f)
+        con.execute(
+            f"CREATE OR REPLACE VIEW {f} AS "
+            f"{build_gtfs_view_query(table=f, path=f'{prefix}{f}.parquet')}"
+        )
+        logger.info("Successfully read %s.parquet as view %s", f, f)
+
+    # Query to join all data together
+    query = build_expected_schedule_query()
 
     # Query to get effective date
     result = con.execute("SELECT MIN(start_date) FROM calendar").fetchone()
@@ -126,9 +413,23 @@ def handler(event, context):
         raise ValueError("No start_date found")
     effective_date = result[0]
 
-    # Write output as Parquet to S3
-    output_path = f"s3://{bucket}/gtfs_expected_cta_schedule/{effective_date}.parquet"
-    con.execute(f"COPY ({query}) TO '{output_path}' (FORMAT PARQUET)")
-    logger.info("Successfully wrote output parquet file to S3")
+    # Build the expected schedule once, then write it and its summary tables as
+    # Parquet to S3
+    con.execute(f"CREATE OR REPLACE TEMP TABLE expected_schedule AS {query}")
+    try:
+        output_path = (
+            f"s3://{bucket}/{EXPECTED_SCHEDULE_PREFIX}/{effective_date}.parquet"
+        )
+        con.execute(f"COPY expected_schedule TO '{output_path}' (FORMAT PARQUET)")
+        logger.info("Successfully wrote output parquet file to S3")
+        write_schedule_metrics(
+            con=con,
+            source="expected_schedule",
+            effective_date=effective_date,
+            bucket=bucket,
+        )
+    finally:
+        # Free the memory of the connection reused by the next invocation
+        con.execute("DROP TABLE IF EXISTS expected_schedule")
 
     return {"status": "success", "effective_date": effective_date}
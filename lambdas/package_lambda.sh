@@ -13,6 +13,12 @@ fi
 # Copy the Dockerfile from the root of the lambdas directory
 cp ../Dockerfile .
 
+# Copy the shared code so it is packaged as the lambdas.shared package
+rm -rf lambdas
+mkdir lambdas
+cp ../__init__.py lambdas/
+cp -r ../shared lambdas/
+
 # Remove any stale containers/images
 docker rm -f temp-step-fn-lambda-packager 2>/dev/null || true
 docker rmi -f step-fn-lambda-packager:latest 2>/dev/null || true
@@ -25,5 +31,6 @@ docker create --name temp-step-fn-lambda-packager step-fn-lambda-packager
 docker cp temp-step-fn-lambda-packager:/app/deployment_package.zip ./deployment_package.zip
 docker rm temp-step-fn-lambda-packager
 
-# Remove the copied Dockerfile
+# Remove the copied Dockerfile and shared code
 rm Dockerfile
+rm -rf lambdas
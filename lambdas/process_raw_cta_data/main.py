@@ -1,17 +1,46 @@
+import collections
+import concurrent.futures
+import contextlib
 import datetime
 import gzip
 import json
 import logging
+import operator
 import os
+import re
 import sys
+from array import array
+from collections.abc import Callable, Iterable, Iterator
 from io import BytesIO
+from typing import Any, BinaryIO, NamedTuple
 
 import boto3
+import botocore.client
+import botocore.config
 import botocore.exceptions
 import dotenv
 import duckdb
+import numpy as np
 import pandas as pd
 
+from lambdas.shared.duckdb_connection import get_db_connection
+from lambdas.shared.snapshot_encoding import SnapshotDecoder
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
 dotenv.load_dotenv()
 
 logger = logging.getLogger(__name__)
@@ -22,212 +51,1450 @@ stream_handler.setFormatter(formatter)
 logger.addHandler(stream_handler)
 logger.setLevel(logging.DEBUG)
 
+# Concurrency and read-ahead limits for downloading raw partition files from S3
+S3_DOWNLOAD_WORKERS = int(os.environ.get("S3_DOWNLOAD_WORKERS", "8"))
+S3_MAX_IN_FLIGHT_BYTES = int(
+    os.environ.get("S3_MAX_IN_FLIGHT_BYTES", str(64 * 1024 * 1024))
+)
+
+# JSON parser backend for raw Firehose lines: 'auto', 'msgspec', 'orjson' or 'json'
+JSON_PARSER_BACKEND = os.environ.get("JSON_PARSER_BACKEND", "auto")
+
+# Delta-encoded snapshots carry this key and are rebuilt into full snapshots before they
+# are parsed, see lambdas.shared.snapshot_encoding
+DELTA_ENCODING_MARKER = b'"encoding"'
+
+# Hour (local time) at which one service day ends and the next begins, so trips running
+# past midnight are attributed to the service day they started on
+SERVICE_DAY_START_HOUR = 4
+
+# 'full' recomputes arrivals for the previous service day from two days of raw data,
+# 'incremental' processes only files added since the last invocation
+PROCESSING_MODE = os.environ.get("PROCESSING_MODE", "full")
+
+# Location of the incremental processing watermark and carried-over run state
+PROCESSING_STATE_KEY = "processing_state/process_raw_cta_data.json"
+
+# Location of the last keyframe of each delta-encoded stream, carried over between
+# incremental invocations, and how long a stream can go without a keyframe before it is
+# considered finished
+SNAPSHOT_DECODER_STATE_KEY = "processing_state/snapshot_decoder.json"
+KEYFRAME_TTL = datetime.timedelta(hours=1)
+
+# How long a run can go unseen before its last station is treated as its final arrival
+RUN_STATE_TTL = pd.Timedelta(minutes=30)
+
+# Columns of the pending arrival carried over for each run between incremental invocations
+RUN_STATE_COLUMNS = [
+    "route_name",
+    "run_number",
+    "train_direction",
+    "stop_id",
+    "station_name",
+    "arrival_time",
+    "ingestion_timestamp",
+]
 
-def read_s3_partition(bucket_name: str, partition_path: str) -> list[BytesIO]:
+# Processed train locations are written as Parquet partitioned by service day and route,
+# sorted within each file so row group statistics on run_number are selective
+TRAIN_LOCATIONS_PREFIX = "train_locations"
+TRAIN_LOCATIONS_PARTITION_COLUMNS = ["service_date", "route_name"]
+TRAIN_LOCATIONS_SORT_COLUMNS = ["run_number", "ingestion_timestamp"]
+
+# Rows per Parquet row group; a route's service day is roughly 20k-60k locations, so
+# each file holds a few row groups covering contiguous ranges of runs
+PARQUET_ROW_GROUP_SIZE = int(os.environ.get("PARQUET_ROW_GROUP_SIZE", "16384"))
+
+# Name of the view a frame is registered under while it is written to Parquet
+WRITE_INPUT_VIEW = "write_input"
+
+# Columns of the inferred actual arrivals at each station
+ACTUAL_ARRIVAL_COLUMNS = [
+    "service_date",
+    "route_name",
+    "run_number",
+    "train_direction",
+    "stop_id",
+    "station_name",
+    "arrival_time",
+]
+
+# Output columns kept for each train, mapped to the type each is converted to
+TRAIN_RECORD_SCHEMA: dict[str, str] = {
+    "ingestion_timestamp": "timestamp",
+    "current_timestamp": "timestamp",
+    "error_code": "integer",
+    "error_number": "category",
+    "route_name": "category",
+    "run_number": "integer",
+    "destination_station_id": "integer",
+    "destination_station_name": "category",
+    "train_direction": "integer",
+    "next_station_id": "integer",
+    "next_stop_id": "integer",
+    "next_station_name": "category",
+    "prediction_timestamp": "timestamp",
+    "predicted_arrival": "timestamp",
+    "is_approaching": "boolean",
+    "is_delayed": "boolean",
+}
+
+# Output columns populated from each train object, mapped to the CTA API field name
+TRAIN_FIELDS: dict[str, str] = {
+    "run_number": "rn",
+    "destination_station_id": "destSt",
+    "destination_station_name": "destNm",
+    "train_direction": "trDr",
+    "next_station_id": "nextStaId",
+    "next_stop_id": "nextStpId",
+    "next_station_name": "nextStaNm",
+    "prediction_timestamp": "prdt",
+    "predicted_arrival": "arrT",
+    "is_approaching": "isApp",
+    "is_delayed": "isDly",
+}
+
+
+def build_partition_path(partition_date: datetime.date) -> str:
     """
-    Read all files from a specific partition path in S3.
+    Build the S3 partition path Firehose writes raw API data to for a given day.
 
     Args:
+        partition_date: The day of the partition.
+
+    Returns:
+        str: The partition path (e.g., 'raw-api-data/success/year=2026/month=02/day=07/')
+    """
+    return (
+        f"raw-api-data/success/year={partition_date.year}"
+        f"/month={partition_date.month:02d}/day={partition_date.day:02d}/"
+    )
+
+
+def list_s3_partition(
+    s3_client: botocore.client.BaseClient,
+    bucket_name: str,
+    partition_path: str,
+    start_after: str | None = None,
+    raise_errors: bool = False,
+) -> list[dict]:
+    """
+    List all objects in a specific partition path in S3, following continuation tokens.
+
+    Args:
+        s3_client: The boto3 S3 client to list objects with.
         bucket_name: The name of the S3 bucket.
         partition_path: The full partition path (e.g., 'cta-data/year=2026/month=02/day=27/')
+        start_after: If set, only list objects with keys after this key.
+        raise_errors: If set, raise listing errors instead of logging them and returning
+            an empty listing.
 
     Returns:
-        List of BytesIO objects containing file contents of each file in the partition.
-    """
-    s3_client = boto3.client("s3")
-    file_objects = []
+        List of object summaries from the listing, ordered by key.
 
+    Raises:
+        botocore.exceptions.ClientError: If the listing fails and raise_errors is set.
+    """
+    objects = []
+    paginator = s3_client.get_paginator("list_objects_v2")
+    pagination_args = {"Bucket": bucket_name, "Prefix": partition_path}
+    if start_after:
+        pagination_args["StartAfter"] = start_after
     try:
-        response = s3_client.list_objects_v2(Bucket=bucket_name, Prefix=partition_path)
+        for page in paginator.paginate(**pagination_args):
+            objects.extend(page.get("Contents", []))
     except botocore.exceptions.ClientError as e:
         logger.error(f"Error listing files in S3 bucket: {e}")
-        return file_objects
+        if raise_errors:
+            raise
+        return []
 
-    if "Contents" not in response:
-        logger.info(f"No files found in partition path: {partition_path}")
-        return file_objects
+    return objects
 
-    total_available_files = len(response["Contents"])
 
-    logger.info(
-        f"Found {total_available_files} files in partition path: {partition_path}"
+def list_s3_partitions(
+    s3_client: botocore.client.BaseClient,
+    bucket_name: str,
+    partition_paths: list[str],
+    max_workers: int = S3_DOWNLOAD_WORKERS,
+    start_after: str | None = None,
+    raise_errors: bool = False,
+) -> list[dict]:
+    """
+    List several partition paths in S3 concurrently and merge them into one manifest.
+
+    Args:
+        s3_client: The boto3 S3 client to list objects with.
+        bucket_name: The name of the S3 bucket.
+        partition_paths: The full partition paths to list.
+        max_workers: Number of partition paths to list concurrently.
+        start_after: If set, only list objects with keys after this key.
+        raise_errors: If set, raise listing errors instead of leaving the partition path
+            out of the manifest.
+
+    Returns:
+        List of object summaries from all partition paths, de-duplicated and ordered by key.
+
+    Raises:
+        botocore.exceptions.ClientError: If a listing fails and raise_errors is set.
+    """
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=max(min(max_workers, len(partition_paths)), 1)
+    ) as executor:
+        listings = executor.map(
+            lambda partition_path: list_s3_partition(
+                s3_client=s3_client,
+                bucket_name=bucket_name,
+                partition_path=partition_path,
+                start_after=start_after,
+                raise_errors=raise_errors,
+            ),
+            partition_paths,
+        )
+        objects_by_key = {obj["Key"]: obj for listing in listings for obj in listing}
+
+    return [objects_by_key[key] for key in sorted(objects_by_key)]
+
+
+def download_s3_object(
+    s3_client: botocore.client.BaseClient, bucket_name: str, key: str
+) -> BytesIO:
+    """
+    Download a single S3 object fully into memory.
+
+    Args:
+        s3_client: The boto3 S3 client to download the object with.
+        bucket_name: The name of the S3 bucket.
+        key: The key of the object in S3.
+
+    Returns:
+        BytesIO object containing the file contents.
+    """
+    response = s3_client.get_object(Bucket=bucket_name, Key=key)
+    return BytesIO(response["Body"].read())
+
+
+def get_s3_client(max_workers: int = S3_DOWNLOAD_WORKERS) -> botocore.client.BaseClient:
+    """
+    Create an S3 client with a connection pool large enough for concurrent downloads.
+
+    Args:
+        max_workers: Number of threads that will share the client.
+
+    Returns:
+        The boto3 S3 client.
+    """
+    return boto3.client(
+        "s3", config=botocore.config.Config(max_pool_connections=max(max_workers, 1))
+    )
+
+
+def read_s3_partition(
+    bucket_name: str,
+    partition_path: str | list[str],
+    max_workers: int = S3_DOWNLOAD_WORKERS,
+    max_in_flight_bytes: int = S3_MAX_IN_FLIGHT_BYTES,
+) -> Iterator[tuple[str, BinaryIO]]:
+    """
+    Lazily open all files from one or more partition paths in S3, in key order.
+
+    All partition paths are listed up front in a single concurrent listing phase. With
+    a single worker, objects are then yielded one at a time as unread streaming bodies.
+    With more workers, objects are downloaded concurrently ahead of the consumer on one
+    shared, connection-pooled client. Read-ahead stops once the listed sizes of the files
+    downloaded but not yet consumed reach max_in_flight_bytes, so memory stays bounded.
+
+    Args:
+        bucket_name: The name of the S3 bucket.
+        partition_path: The full partition path (e.g., 'cta-data/year=2026/month=02/day=27/'),
+            or a list of partition paths to read together.
+        max_workers: Number of objects to download concurrently.
+        max_in_flight_bytes: Maximum number of bytes downloaded ahead of the consumer.
+
+    Yields:
+        Tuples of the S3 key and a file-like object for each file in the partition.
+    """
+    partition_paths = (
+        [partition_path] if isinstance(partition_path, str) else partition_path
+    )
+    s3_client = get_s3_client(max_workers=max_workers)
+
+    objects = list_s3_partitions(
+        s3_client=s3_client,
+        bucket_name=bucket_name,
+        partition_paths=partition_paths,
+        max_workers=max_workers,
+    )
+    if not objects:
+        logger.info(f"No files found in partition paths: {partition_paths}")
+        return
+
+    logger.info(f"Found {len(objects)} files in partition paths: {partition_paths}")
+
+    yield from read_s3_objects(
+        s3_client=s3_client,
+        bucket_name=bucket_name,
+        objects=objects,
+        max_workers=max_workers,
+        max_in_flight_bytes=max_in_flight_bytes,
     )
 
-    for obj in response["Contents"]:
+
+def read_s3_objects(
+    s3_client: botocore.client.BaseClient,
+    bucket_name: str,
+    objects: list[dict],
+    max_workers: int = S3_DOWNLOAD_WORKERS,
+    max_in_flight_bytes: int = S3_MAX_IN_FLIGHT_BYTES,
+    stop_on_error: bool = False,
+) -> Iterator[tuple[str, BinaryIO]]:
+    """
+    Lazily open a listed set of S3 objects, in the order given.
+
+    Args:
+        s3_client: The boto3 S3 client to download objects with.
+        bucket_name: The name of the S3 bucket.
+        objects: Object summaries from list_s3_partitions.
+        max_workers: Number of objects to download concurrently.
+        max_in_flight_bytes: Maximum number of bytes downloaded ahead of the consumer.
+        stop_on_error: If set, stop at the first object that cannot be downloaded instead
+            of skipping it, so the objects yielded are always a prefix of the listing.
+
+    Yields:
+        Tuples of the S3 key and a file-like object for each object.
+    """
+    if max_workers > 1:
+        files = _download_s3_objects_concurrently(
+            s3_client=s3_client,
+            bucket_name=bucket_name,
+            objects=objects,
+            max_workers=max_workers,
+            max_in_flight_bytes=max_in_flight_bytes,
+            stop_on_error=stop_on_error,
+        )
+    else:
+        files = _open_s3_objects(
+            s3_client=s3_client,
+            bucket_name=bucket_name,
+            objects=objects,
+            stop_on_error=stop_on_error,
+        )
+
+    opened_files = 0
+    with contextlib.closing(files):
+        for file_key, body in files:
+            opened_files += 1
+            try:
+                yield file_key, body
+            finally:
+                body.close()
+
+    logger.info(f"Successfully opened {opened_files} of {len(objects)} files")
+
+
+def _open_s3_objects(
+    s3_client: botocore.client.BaseClient,
+    bucket_name: str,
+    objects: list[dict],
+    stop_on_error: bool = False,
+) -> Iterator[tuple[str, BinaryIO]]:
+    for obj in objects:
         file_key = obj["Key"]
-        logger.info(f"Downloading file: {file_key}")
+        logger.info(f"Opening file: {file_key}")
         try:
             response = s3_client.get_object(Bucket=bucket_name, Key=file_key)
-            file_content = response["Body"].read()
-            file_objects.append(BytesIO(file_content))
-            logger.info(f"Successfully downloaded: {file_key}")
         except botocore.exceptions.ClientError as e:
             logger.error(f"Error downloading {file_key}: {e}")
+            if stop_on_error:
+                logger.warning(f"Stopping before {file_key}")
+                return
             continue
+        yield file_key, response["Body"]
 
-    logger.info(
-        f"Successfully downloaded {len(file_objects)} of {total_available_files} files"
-    )
-    return file_objects
+
+def _download_s3_objects_concurrently(
+    s3_client: botocore.client.BaseClient,
+    bucket_name: str,
+    objects: list[dict],
+    max_workers: int,
+    max_in_flight_bytes: int,
+    stop_on_error: bool = False,
+) -> Iterator[tuple[str, BinaryIO]]:
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    pending: collections.deque = collections.deque()
+    in_flight_bytes = 0
+    next_index = 0
+    try:
+        while next_index < len(objects) or pending:
+            # Always keep at least one download queued so oversized files still progress
+            while next_index < len(objects) and (
+                not pending
+                or in_flight_bytes + objects[next_index].get("Size", 0)
+                <= max_in_flight_bytes
+            ):
+                obj = objects[next_index]
+                logger.info(f"Downloading file: {obj['Key']}")
+                future = executor.submit(
+                    download_s3_object, s3_client, bucket_name, obj["Key"]
+                )
+                pending.append((obj["Key"], obj.get("Size", 0), future))
+                in_flight_bytes += obj.get("Size", 0)
+                next_index += 1
+
+            file_key, size, future = pending.popleft()
+            try:
+                body = future.result()
+            except botocore.exceptions.ClientError as e:
+                logger.error(f"Error downloading {file_key}: {e}")
+                if stop_on_error:
+                    logger.warning(f"Stopping before {file_key}")
+                    return
+                in_flight_bytes -= size
+                continue
+
+            try:
+                yield file_key, body
+            finally:
+                in_flight_bytes -= size
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
 
 
-def get_db_connection() -> duckdb.DuckDBPyConnection:
+def iter_decompressed_lines(file_obj: BinaryIO) -> Iterator[bytes]:
     """
-    Create DuckDB connection to S3.
+    Incrementally decompress a gzipped file and yield its non-empty lines.
 
-    Returns:
-        duckdb.DuckDBPyConnection: The DuckDB connection
+    The gzip stream is decoded in small chunks as lines are consumed, so memory use is
+    bounded by the length of the longest line rather than by the size of the file. Lines
+    are left as UTF-8 bytes, which every JSON parser backend decodes directly.
+
+    Args:
+        file_obj: A readable binary file-like object containing gzipped text.
+
+    Yields:
+        Each stripped line of the decompressed file, or empty bytes for blank lines.
     """
-    con = duckdb.connect(database=":memory:")
+    with gzip.GzipFile(fileobj=file_obj, mode="rb") as gz_file:
+        for line in gz_file:
+            yield line.strip()
 
-    # Set the home directory to /tmp, which is writable in Lambda
-    con.execute("SET home_directory='/tmp';")
 
-    # Explicitly set paths for extensions and secrets
-    con.execute("SET extension_directory='/tmp/duckdb_extensions';")
-    con.execute("SET secret_directory='/tmp/duckdb_secrets';")
+class SnapshotParser(NamedTuple):
+    """
+    A JSON decoding backend for raw Firehose lines.
 
-    # Explicitly install and load httpfs
-    con.execute("INSTALL httpfs;")
-    con.execute("LOAD httpfs;")
+    Attributes:
+        name: The name of the backend.
+        decode: Callable decoding one line into a snapshot. The msgspec backend returns a
+            typed Snapshot struct, all other backends return a dict.
+        errors: Exception types raised by decode for malformed lines.
+    """
 
-    # Register the credential chain. This automatically looks for ~/.aws/credentials
-    con.execute("""
-        CREATE OR REPLACE SECRET s3_creds (
-            TYPE S3, 
-            PROVIDER CREDENTIAL_CHAIN
-        );
-    """)
-    return con
+    name: str
+    decode: Callable[[bytes], Any]
+    errors: tuple[type[Exception], ...]
 
 
-def write_df_to_s3(df: pd.DataFrame, bucket_name: str, key: str):
+if msgspec is not None:
+
+    class Train(msgspec.Struct, rename=TRAIN_FIELDS):
+        """A train in the API response, decoded straight into the output columns kept."""
+
+        run_number: str | None = None
+        destination_station_id: str | None = None
+        destination_station_name: str | None = None
+        train_direction: str | None = None
+        next_station_id: str | None = None
+        next_stop_id: str | None = None
+        next_station_name: str | None = None
+        prediction_timestamp: str | None = None
+        predicted_arrival: str | None = None
+        is_approaching: str | None = None
+        is_delayed: str | None = None
+
+    class Route(msgspec.Struct, rename={"route_name": "@name"}):
+        """A route in the API response. A single train may be returned as a bare object."""
+
+        route_name: str | None = None
+        train: list[Train] | Train = msgspec.field(default_factory=list)
+
+    class Ctatt(
+        msgspec.Struct,
+        rename={
+            "current_timestamp": "tmst",
+            "error_code": "errCd",
+            "error_number": "errNm",
+        },
+    ):
+        """The body of a single train line API response."""
+
+        current_timestamp: str | None = None
+        error_code: str | None = None
+        error_number: str | None = None
+        route: list[Route] | Route = msgspec.field(default_factory=list)
+
+    class RouteResponse(msgspec.Struct):
+        """The API response for a single train line."""
+
+        ctatt: Ctatt = msgspec.field(default_factory=Ctatt)
+
+    class Snapshot(msgspec.Struct, rename={"ingestion_timestamp": "timestamp"}):
+        """A single polled snapshot of every train line, as written by Firehose."""
+
+        ingestion_timestamp: str | None = None
+        data: list[RouteResponse] = msgspec.field(default_factory=list)
+
+
+def get_snapshot_parser(backend: str = "auto") -> SnapshotParser:
     """
-    Write a Pandas dataframe to S3 as Parquet using DuckDB.
+    Get the JSON decoding backend used to parse raw Firehose lines.
 
     Args:
-        df: The pandas DataFrame to write to S3.
-        bucket_name: The name of the S3 bucket.
-        key: The key for the object in S3.
+        backend: One of 'msgspec' (typed structs), 'orjson', 'json' (standard library), or
+            'auto' to use the fastest backend that is installed.
+
+    Returns:
+        SnapshotParser: The requested parser backend.
+
+    Raises:
+        ValueError: If the backend is unknown or its package is not installed.
     """
-    output_path = f"s3://{bucket_name}/{key}"
-    con = get_db_connection()
-    con.execute(f"COPY ({df}) TO '{output_path}' (FORMAT PARQUET)")
-    logger.info(f"Successfully wrote output parquet file to S3: {output_path}")
+    if backend == "auto":
+        if msgspec is not None:
+            backend = "msgspec"
+        elif orjson is not None:
+            backend = "orjson"
+        else:
+            backend = "json"
+
+    if backend == "msgspec":
+        if msgspec is None:
+            raise ValueError("msgspec is not installed")
+        return SnapshotParser(
+            name="msgspec",
+            decode=msgspec.json.Decoder(Snapshot).decode,
+            errors=(msgspec.DecodeError,),
+        )
+    if backend == "orjson":
+        if orjson is None:
+            raise ValueError("orjson is not installed")
+        return SnapshotParser(
+            name="orjson", decode=orjson.loads, errors=(orjson.JSONDecodeError,)
+        )
+    if backend == "json":
+        return SnapshotParser(
+            name="json",
+            decode=json.loads,
+            errors=(json.JSONDecodeError, UnicodeDecodeError),
+        )
+    raise ValueError(f"Unsupported JSON parser backend: {backend}")
 
 
-def extract_cta_data_from_s3(bucket_name: str, partition_path: str) -> pd.DataFrame:
+class _DictionaryCodes(dict):
+    """Mapping of distinct values to dense codes, assigning the next code on lookup."""
+
+    __slots__ = ()
+
+    def __missing__(self, value: str) -> int:
+        # None is pre-seeded with the null code, so codes start at len(self) - 1
+        code = self[value] = len(self) - 1
+        return code
+
+
+class DictionaryColumn:
     """
-    Extract CTA train data from all gzipped JSON files in an S3 partition path.
+    Append-only column buffer that dictionary-encodes raw API values.
+
+    Each appended value is stored as an int32 code into a dictionary of distinct values,
+    so repeated strings (route names, stations, run numbers, poll timestamps) cost four
+    bytes per row. Distinct values are converted to their final type once when the
+    column is materialized, rather than once per row.
+    """
+
+    __slots__ = ("codes", "dictionary")
+
+    def __init__(self):
+        self.codes = array("i")
+        self.dictionary = _DictionaryCodes({None: -1})
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def extend(self, values: Iterable[str | None]):
+        """
+        Append a batch of raw values to the column, encoding None as a null.
+
+        The batch is encoded with a single map over the dictionary, so Python code only
+        runs for values that have not been seen before.
+
+        Args:
+            values: The raw values from the API response.
+        """
+        self.codes.extend(map(self.dictionary.__getitem__, values))
+
+    def truncate(self, length: int):
+        """
+        Drop any values appended after the given length.
+
+        Args:
+            length: The number of values to keep.
+        """
+        del self.codes[length:]
+
+    def to_array(self, kind: str) -> pd.api.extensions.ExtensionArray:
+        """
+        Materialize the column as a typed pandas array.
+
+        Args:
+            kind: The target type, one of 'category', 'integer', 'timestamp' or 'boolean'.
+
+        Returns:
+            A pandas array with one typed value per appended row.
+        """
+        codes = np.frombuffer(self.codes, dtype=np.int32)
+        # Skip the pre-seeded None, so each value's position is its code
+        values = pd.Index(list(self.dictionary)[1:], dtype=object)
+
+        if kind == "category":
+            return pd.Categorical.from_codes(codes, categories=values)
+        if kind == "integer":
+            typed_values = pd.array(
+                pd.to_numeric(values, errors="coerce"), dtype="Int32"
+            )
+        elif kind == "timestamp":
+            typed_values = pd.to_datetime(
+                values, format="ISO8601", errors="coerce"
+            ).array
+        elif kind == "boolean":
+            typed_values = pd.array(
+                [{"1": True, "0": False}.get(value) for value in values],
+                dtype="boolean",
+            )
+        else:
+            raise ValueError(f"Unsupported column type: {kind}")
+
+        return pd.api.extensions.take(typed_values, codes, allow_fill=True)
+
+
+class TrainRecordColumns:
+    """
+    Columnar accumulator for flattened train records.
+
+    Parsed snapshots are appended field by field directly into typed column buffers,
+    avoiding a per-train dictionary and the row-to-column pivot in pd.DataFrame.
+    """
+
+    def __init__(self):
+        self.columns = {name: DictionaryColumn() for name in TRAIN_RECORD_SCHEMA}
+        self._train_columns = [
+            (self.columns[column], field) for column, field in TRAIN_FIELDS.items()
+        ]
+        self._get_typed_train_values = operator.attrgetter(*TRAIN_FIELDS)
+
+    def __len__(self) -> int:
+        return len(self.columns["run_number"])
+
+    def append_snapshot(self, json_data: "dict | Snapshot") -> int:
+        """
+        Append every train in a single polled snapshot to the column buffers.
+
+        If the snapshot is malformed, any rows already appended from it are rolled back
+        so the columns stay aligned.
+
+        Args:
+            json_data: A parsed line from the raw Firehose output, containing the ingestion
+                timestamp and the API response for each train line. Either a dict or a
+                typed Snapshot struct from the msgspec parser backend.
+
+        Returns:
+            int: The number of train records appended.
+        """
+        start_length = len(self)
+        try:
+            if isinstance(json_data, dict):
+                self._append_dict_snapshot(json_data)
+            else:
+                self._append_typed_snapshot(json_data)
+        except Exception:
+            for column in self.columns.values():
+                column.truncate(start_length)
+            raise
+        return len(self) - start_length
+
+    def _extend_response_columns(
+        self,
+        ingestion_timestamp: str | None,
+        responses: list[tuple[str | None, str | None, str | None, str | None, int]],
+    ):
+        """
+        Append the snapshot and API response fields shared by each train.
+
+        Args:
+            ingestion_timestamp: The ingestion timestamp of the snapshot.
+            responses: Tuples of the current timestamp, error code, error number and
+                route name of each route in the snapshot, and its number of trains.
+        """
+        row_count = sum(response[-1] for response in responses)
+        self.columns["ingestion_timestamp"].extend([ingestion_timestamp] * row_count)
+        for position, column in enumerate(
+            ["current_timestamp", "error_code", "error_number", "route_name"]
+        ):
+            values = []
+            for response in responses:
+                values += [response[position]] * response[-1]
+            self.columns[column].extend(values)
+
+    def _append_dict_snapshot(self, json_data: dict):
+        """
+        Append every train in a snapshot decoded as dictionaries.
+
+        Trains are gathered from every route first, then each column is extended once
+        with all of the snapshot's values.
+
+        Args:
+            json_data: A parsed line from the raw Firehose output.
+        """
+        responses = []
+        trains = []
+        for data_item in json_data.get("data", []):
+            ctatt = data_item.get("ctatt", {})
+            current_timestamp = ctatt.get("tmst")
+            error_code = ctatt.get("errCd")
+            error_number = ctatt.get("errNm")
+
+            routes = ctatt.get("route", [])
+            # The API returns a bare object instead of a list when there is only one
+            if isinstance(routes, dict):
+                routes = [routes]
+            for route in routes:
+                route_trains = route.get("train", [])
+                if isinstance(route_trains, dict):
+                    route_trains = [route_trains]
+                trains += route_trains
+                responses.append(
+                    (
+                        current_timestamp,
+                        error_code,
+                        error_number,
+                        route.get("@name"),
+                        len(route_trains),
+                    )
+                )
+
+        self._extend_response_columns(json_data.get("timestamp"), responses)
+        for column, field in self._train_columns:
+            column.extend([train.get(field) for train in trains])
+
+    def _append_typed_snapshot(self, snapshot: "Snapshot"):
+        """
+        Append every train in a snapshot decoded as typed msgspec structs.
+
+        Trains are gathered from every route first, then each column is extended once
+        with all of the snapshot's values.
+
+        Args:
+            snapshot: A parsed line from the raw Firehose output.
+        """
+        responses = []
+        trains = []
+        for data_item in snapshot.data:
+            ctatt = data_item.ctatt
+            routes = ctatt.route
+            if not isinstance(routes, list):
+                routes = [routes]
+            for route in routes:
+                route_trains = route.train
+                if not isinstance(route_trains, list):
+                    route_trains = [route_trains]
+                trains += route_trains
+                responses.append(
+                    (
+                        ctatt.current_timestamp,
+                        ctatt.error_code,
+                        ctatt.error_number,
+                        route.route_name,
+                        len(route_trains),
+                    )
+                )
+
+        self._extend_response_columns(snapshot.ingestion_timestamp, responses)
+        if not trains:
+            return
+        train_values = zip(*map(self._get_typed_train_values, trains))
+        for (column, _), values in zip(self._train_columns, train_values):
+            column.extend(values)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        Materialize the accumulated columns as a typed DataFrame.
+
+        Returns:
+            pandas DataFrame with one row per appended train record.
+        """
+        return pd.DataFrame(
+            {
+                name: self.columns[name].to_array(kind)
+                for name, kind in TRAIN_RECORD_SCHEMA.items()
+            }
+        )
+
+
+def iter_partition_snapshots(
+    bucket_name: str,
+    partition_path: str | list[str],
+    parser: SnapshotParser | None = None,
+) -> Iterator["dict | Snapshot"]:
+    """
+    Stream parsed snapshots from every gzipped JSON file in an S3 partition path.
+
+    Each file is downloaded, decompressed and parsed incrementally, so peak memory stays
+    constant regardless of how many files the partition contains. Lines or files that
+    cannot be parsed are logged and skipped.
 
     Args:
         bucket_name: The name of the S3 bucket.
-        partition_path: The full partition path (e.g., 'cta-data/year=2026/month=02/day=27/')
+        partition_path: The full partition path (e.g., 'cta-data/year=2026/month=02/day=27/'),
+            or a list of partition paths to read together.
+        parser: The JSON parser backend to decode lines with. Defaults to the backend set
+            by the JSON_PARSER_BACKEND environment variable.
 
-    Returns:
-        pandas DataFrame with flattened data from all files
+    Yields:
+        The parsed snapshot for each polled line.
     """
-    file_objects = read_s3_partition(
-        bucket_name=bucket_name, partition_path=partition_path
+    yield from iter_file_snapshots(
+        files=read_s3_partition(bucket_name=bucket_name, partition_path=partition_path),
+        parser=parser,
     )
-    if not file_objects:
-        logger.info("No files to process")
-        return pd.DataFrame()
 
-    all_records = []
+
+def iter_file_snapshots(
+    files: Iterable[tuple[str, BinaryIO]],
+    parser: SnapshotParser | None = None,
+    decoder: SnapshotDecoder | None = None,
+) -> Iterator["dict | Snapshot"]:
+    """
+    Stream parsed snapshots from gzipped JSON files.
+
+    Args:
+        files: Tuples of the S3 key and a file-like object for each file to parse.
+        parser: The JSON parser backend to decode lines with. Defaults to the backend set
+            by the JSON_PARSER_BACKEND environment variable.
+        decoder: The decoder to rebuild delta-encoded snapshots with, holding any
+            keyframes carried over from earlier files. Defaults to a new decoder.
+
+    Yields:
+        The parsed snapshot for each polled line.
+    """
+    parser = parser or get_snapshot_parser(JSON_PARSER_BACKEND)
+    if decoder is None:
+        decoder = SnapshotDecoder()
+    # Delta snapshots are rebuilt as plain dictionaries before being appended
+    dict_parser = get_snapshot_parser("orjson" if orjson is not None else "json")
+    logger.info(f"Parsing snapshots with the {parser.name} JSON parser backend")
     total_processed_lines = 0
     total_skipped_lines = 0
     files_processed = 0
 
-    for file_idx, file_obj in enumerate(file_objects, 1):
-        logger.info(f"Processing file {file_idx}/{len(file_objects)}...")
+    for file_idx, (file_key, file_obj) in enumerate(files, 1):
+        logger.info(f"Processing file {file_idx}: {file_key}...")
+        processed_lines = 0
+        skipped_lines = 0
         try:
-            # Reset file pointer to beginning
-            file_obj.seek(0)
-            with gzip.GzipFile(fileobj=file_obj, mode="rb") as gz_file:
-                content = gz_file.read().decode("utf-8")
-                records = []
-                processed_lines = 0
-                skipped_lines = 0
-
-                for line_num, line in enumerate(content.splitlines(), 1):
-                    line = line.strip()
-                    if not line:
-                        skipped_lines += 1
-                        continue
+            for line_num, line in enumerate(iter_decompressed_lines(file_obj), 1):
+                if not line:
+                    skipped_lines += 1
+                    continue
 
+                if DELTA_ENCODING_MARKER in line:
                     try:
-                        json_data = json.loads(line)
-                        ingestion_timestamp = json_data.get("timestamp")
-                        data_list = json_data.get("data", [])
-
-                        for data_item in data_list:
-                            ctatt = data_item.get("ctatt", {})
-                            current_timestamp = ctatt.get("tmst")
-                            error_code = ctatt.get("errCd")
-                            error_number = ctatt.get("errNm")
-
-                            routes = ctatt.get("route", [])
-                            for route in routes:
-                                route_name = route.get("@name")
-                                trains = route.get("train", [])
-                                for train in trains:
-                                    record = {
-                                        "ingestion_timestamp": ingestion_timestamp,
-                                        "current_timestamp": current_timestamp,
-                                        "error_code": error_code,
-                                        "error_number": error_number,
-                                        "route_name": route_name,
-                                        "run_number": train.get("rn"),
-                                        "destination_station_id": train.get("destSt"),
-                                        "destination_station_name": train.get("destNm"),
-                                        "train_direction": train.get("trDr"),
-                                        "next_station_id": train.get("nextStaId"),
-                                        "next_stop_id": train.get("nextStpId"),
-                                        "next_station_name": train.get("nextStaNm"),
-                                        "prediction_timestamp": train.get("prdt"),
-                                        "predicted_arrival": train.get("arrT"),
-                                        "is_approaching": train.get("isApp"),
-                                        "is_delayed": train.get("isDly"),
-                                    }
-                                    records.append(record)
-                                    processed_lines += 1
-
-                    except json.JSONDecodeError as e:
-                        logger.error(f"Error parsing line {line_num}: {e}")
+                        json_data = decoder.decode(dict_parser.decode(line))
+                    except (
+                        *dict_parser.errors,
+                        TypeError,
+                        AttributeError,
+                        KeyError,
+                    ) as e:
+                        logger.error(f"Error decoding line {line_num}: {e}")
                         skipped_lines += 1
                         continue
-                    except Exception as e:
-                        logger.error(f"Error processing line {line_num}: {e}")
+                    if json_data is None:
+                        logger.warning(
+                            f"Skipping line {line_num}: delta snapshot without its keyframe"
+                        )
+                        skipped_lines += 1
+                        continue
+                else:
+                    try:
+                        json_data = parser.decode(line)
+                    except parser.errors as e:
+                        logger.error(f"Error parsing line {line_num}: {e}")
                         skipped_lines += 1
                         continue
 
-                logger.info(
-                    f"File {file_idx}: Processed {processed_lines} out of {processed_lines + skipped_lines} records."
-                )
-                if skipped_lines > 0:
-                    logger.info(
-                        f"File {file_idx}: Skipped {skipped_lines} lines due to errors"
-                    )
-
-                all_records.extend(records)
-                total_processed_lines += processed_lines
-                total_skipped_lines += skipped_lines
-                files_processed += 1
+                yield json_data
+                processed_lines += 1
 
         except Exception as e:
             logger.error(f"Error processing file {file_idx}: {e}")
             continue
 
         finally:
-            file_obj.close()
+            total_processed_lines += processed_lines
+            total_skipped_lines += skipped_lines
 
-    logger.info(f"Files processed: {files_processed}/{len(file_objects)}")
-    logger.info(f"Total records processed: {total_processed_lines}")
+        logger.info(
+            f"File {file_idx}: Processed {processed_lines} out of {processed_lines + skipped_lines} lines."
+        )
+        if skipped_lines > 0:
+            logger.info(f"File {file_idx}: Skipped {skipped_lines} lines due to errors")
+        files_processed += 1
+
+    logger.info(f"Files processed: {files_processed}")
+    logger.info(f"Total lines processed: {total_processed_lines}")
     if total_skipped_lines > 0:
         logger.info(f"Total lines skipped: {total_skipped_lines}")
 
-    return pd.DataFrame(all_records)
+
+def write_df_to_parquet(
+    con: duckdb.DuckDBPyConnection,
+    df: "pd.DataFrame | pa.Table",
+    output_path: str,
+    partition_by: list[str] | None = None,
+    order_by: list[str] | None = None,
+):
+    """
+    Write a Pandas dataframe or Arrow table to zstd-compressed Parquet using DuckDB.
+
+    The input is registered as a view over its existing buffers rather than copied into
+    DuckDB, so the numeric and Arrow columns are scanned in place and streamed to the
+    Parquet writer.
+
+    Args:
+        con: The DuckDB connection to write with.
+        df: The pandas DataFrame or pyarrow Table to write.
+        output_path: The Parquet file to write, or the root directory of the
+            Hive-partitioned dataset if partition_by is given.
+        partition_by: Columns to partition the output by, one directory level each.
+        order_by: Columns to sort the rows by within each output file.
+    """
+    options = [
+        "FORMAT PARQUET",
+        "COMPRESSION ZSTD",
+        f"ROW_GROUP_SIZE {PARQUET_ROW_GROUP_SIZE}",
+    ]
+    if partition_by:
+        # Fixed file names so that rerunning a day replaces its files rather than
+        # adding to them
+        options += [
+            f"PARTITION_BY ({', '.join(partition_by)})",
+            "OVERWRITE_OR_IGNORE",
+            "FILENAME_PATTERN 'data_{i}'",
+        ]
+    query = f"SELECT * FROM {WRITE_INPUT_VIEW}"
+    if order_by:
+        query += f" ORDER BY {', '.join(order_by)}"
+    con.register(WRITE_INPUT_VIEW, df)
+    try:
+        con.execute(f"COPY ({query}) TO '{output_path}' ({', '.join(options)})")
+    finally:
+        # Drop the view so the reused connection does not keep the input alive
+        con.unregister(WRITE_INPUT_VIEW)
+
+
+def write_df_to_s3(
+    df: "pd.DataFrame | pa.Table",
+    bucket_name: str,
+    key: str,
+    partition_by: list[str] | None = None,
+    order_by: list[str] | None = None,
+):
+    """
+    Write a Pandas dataframe or Arrow table to S3 as Parquet using DuckDB.
+
+    Args:
+        df: The pandas DataFrame or pyarrow Table to write to S3.
+        bucket_name: The name of the S3 bucket.
+        key: The key for the object in S3, or the key prefix of the Hive-partitioned
+            dataset if partition_by is given.
+        partition_by: Columns to partition the output by, one directory level each.
+        order_by: Columns to sort the rows by within each output file.
+    """
+    output_path = f"s3://{bucket_name}/{key}"
+    write_df_to_parquet(
+        con=get_db_connection(),
+        df=df,
+        output_path=output_path,
+        partition_by=partition_by,
+        order_by=order_by,
+    )
+    logger.info(f"Successfully wrote output parquet file to S3: {output_path}")
+
+
+def write_train_locations_to_s3(df: pd.DataFrame, bucket_name: str):
+    """
+    Write flattened train locations to S3 as Parquet partitioned by service day and route.
+
+    Args:
+        df: Flattened train locations.
+        bucket_name: The name of the S3 bucket.
+    """
+    write_df_to_s3(
+        df=df.assign(service_date=get_service_date(df["current_timestamp"])),
+        bucket_name=bucket_name,
+        key=TRAIN_LOCATIONS_PREFIX,
+        partition_by=TRAIN_LOCATIONS_PARTITION_COLUMNS,
+        order_by=TRAIN_LOCATIONS_SORT_COLUMNS,
+    )
+
+
+def build_train_locations(snapshots: Iterable["dict | Snapshot"]) -> pd.DataFrame:
+    """
+    Flatten parsed snapshots into a typed DataFrame of train locations.
+
+    Args:
+        snapshots: Parsed snapshots, as yielded by iter_file_snapshots.
+
+    Returns:
+        pandas DataFrame with one row per train per snapshot.
+    """
+    columns = TrainRecordColumns()
+    skipped_snapshots = 0
+    for snapshot_num, json_data in enumerate(snapshots, 1):
+        try:
+            columns.append_snapshot(json_data)
+        except Exception as e:
+            logger.error(f"Error processing snapshot {snapshot_num}: {e}")
+            skipped_snapshots += 1
+
+    logger.info(f"Total records processed: {len(columns)}")
+    if skipped_snapshots > 0:
+        logger.info(f"Total snapshots skipped: {skipped_snapshots}")
+    if not len(columns):
+        logger.info("No records to process")
+
+    return columns.to_dataframe()
+
+
+def extract_cta_data_from_s3(
+    bucket_name: str, partition_path: str | list[str]
+) -> pd.DataFrame:
+    """
+    Extract CTA train data from all gzipped JSON files in an S3 partition path.
+
+    Args:
+        bucket_name: The name of the S3 bucket.
+        partition_path: The full partition path (e.g., 'cta-data/year=2026/month=02/day=27/'),
+            or a list of partition paths to read together.
+
+    Returns:
+        pandas DataFrame with flattened data from all files
+    """
+    return build_train_locations(
+        iter_partition_snapshots(bucket_name=bucket_name, partition_path=partition_path)
+    )
+
+
+def extract_new_cta_data_from_s3(
+    bucket_name: str,
+    partition_paths: list[str],
+    watermark: str | None,
+    decoder: SnapshotDecoder | None = None,
+) -> tuple[pd.DataFrame, str | None]:
+    """
+    Extract CTA train data from the files added to S3 partition paths since a watermark.
+
+    Args:
+        bucket_name: The name of the S3 bucket.
+        partition_paths: The full partition paths to read.
+        watermark: The key of the last file already processed, or None to read all files.
+        decoder: The decoder to rebuild delta-encoded snapshots with, holding the
+            keyframes of files before the watermark. Defaults to a new decoder.
+
+    Returns:
+        Tuple of a pandas DataFrame with flattened data from the new files, and the key of
+        the last new file read to use as the next watermark. Reading stops at the first
+        file that cannot be downloaded, so it is retried by the next invocation.
+
+    Raises:
+        botocore.exceptions.ClientError: If a partition path cannot be listed, as files
+            missing from the listing would otherwise be skipped by the next watermark.
+    """
+    s3_client = get_s3_client()
+    objects = list_s3_partitions(
+        s3_client=s3_client,
+        bucket_name=bucket_name,
+        partition_paths=partition_paths,
+        start_after=watermark,
+        raise_errors=True,
+    )
+    logger.info(f"Found {len(objects)} new files after watermark: {watermark}")
+    if not objects:
+        return build_train_locations([]), watermark
+
+    opened_keys = []
+
+    def record_opened_keys(
+        files: Iterable[tuple[str, BinaryIO]],
+    ) -> Iterator[tuple[str, BinaryIO]]:
+        for file_key, body in files:
+            opened_keys.append(file_key)
+            yield file_key, body
+
+    files = read_s3_objects(
+        s3_client=s3_client,
+        bucket_name=bucket_name,
+        objects=objects,
+        stop_on_error=True,
+    )
+    df = build_train_locations(
+        iter_file_snapshots(files=record_opened_keys(files), decoder=decoder)
+    )
+    return df, opened_keys[-1] if opened_keys else watermark
+
+
+def get_service_date(timestamps: pd.Series) -> pd.Series:
+    """
+    Get the service day each local timestamp belongs to.
+
+    Args:
+        timestamps: Local (Chicago) timestamps reported by the CTA API.
+
+    Returns:
+        pandas Series of service dates, where times before SERVICE_DAY_START_HOUR belong
+        to the previous day.
+    """
+    return (timestamps - pd.Timedelta(hours=SERVICE_DAY_START_HOUR)).dt.date
+
+
+def _scan_station_transitions(df: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Find the snapshots at which each train arrives at its next station.
+
+    Args:
+        df: Flattened train locations.
+
+    Returns:
+        Tuple of the positions in df of each arrival snapshot, and a boolean array flagging
+        which of those is the final snapshot of its run.
+    """
+    route_codes = df["route_name"].astype("category").cat.codes.to_numpy()
+    run_numbers = df["run_number"].to_numpy(dtype="int64", na_value=-1)
+    ingestion_times = pd.DatetimeIndex(df["ingestion_timestamp"]).asi8
+    station_codes = df["next_station_name"].astype("category").cat.codes.to_numpy()
+
+    order = np.lexsort((ingestion_times, run_numbers, route_codes))
+    route_codes = route_codes[order]
+    run_numbers = run_numbers[order]
+    station_codes = station_codes[order]
+
+    # Station of the chronologically following snapshot for the same run, or -1 (null)
+    # for the final snapshot of each run
+    same_run_as_next = (route_codes[1:] == route_codes[:-1]) & (
+        run_numbers[1:] == run_numbers[:-1]
+    )
+    is_last = np.ones(len(order), dtype=bool)
+    is_last[:-1] = ~same_run_as_next
+    following_station_codes = np.where(is_last, -1, np.roll(station_codes, -1)).astype(
+        station_codes.dtype
+    )
+
+    is_arrival = (following_station_codes == -1) | (
+        (station_codes != following_station_codes) & (station_codes != -1)
+    )
+    return order[is_arrival], is_last[is_arrival]
+
+
+def _build_arrivals(snapshots: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert arrival snapshots to actual arrival rows.
+
+    Args:
+        snapshots: The flattened train locations at which each arrival was detected.
+
+    Returns:
+        pandas DataFrame with the columns in ACTUAL_ARRIVAL_COLUMNS, ordered by route, run
+        and arrival time.
+    """
+    arrivals = pd.DataFrame(
+        {
+            "service_date": get_service_date(snapshots["predicted_arrival"]),
+            "route_name": snapshots["route_name"],
+            "run_number": snapshots["run_number"],
+            "train_direction": snapshots["train_direction"],
+            "stop_id": snapshots["next_stop_id"],
+            "station_name": snapshots["next_station_name"],
+            "arrival_time": snapshots["predicted_arrival"],
+        },
+        columns=ACTUAL_ARRIVAL_COLUMNS,
+    )
+    return arrivals.sort_values(
+        ["route_name", "run_number", "arrival_time"], kind="stable"
+    ).reset_index(drop=True)
+
+
+def infer_actual_arrivals(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Infer the actual arrival time of each train at each station from polled locations.
+
+    Snapshots are ordered by ingestion time within each (route_name, run_number) group.
+    A train is considered to have arrived at its next station in the last snapshot before
+    its next station changes, and at the final station seen for the run. The predicted
+    arrival time from that snapshot is used as the actual arrival time.
+
+    The detection runs as a single vectorized scan: rows are sorted once with a lexsort
+    on integer keys, and each row is compared with the following row using NumPy arrays,
+    so run time scales linearly with the number of snapshots after the sort.
+
+    Args:
+        df: Flattened train locations, as returned by extract_cta_data_from_s3.
+
+    Returns:
+        pandas DataFrame with one row per inferred station arrival, with the columns in
+        ACTUAL_ARRIVAL_COLUMNS, ordered by route, run and arrival time.
+    """
+    if df.empty:
+        return _build_arrivals(TrainRecordColumns().to_dataframe())
+
+    positions, _ = _scan_station_transitions(df)
+    return _build_arrivals(df.iloc[positions])
+
+
+def infer_actual_arrivals_incremental(
+    df: pd.DataFrame,
+    run_state: pd.DataFrame,
+    run_state_ttl: pd.Timedelta = RUN_STATE_TTL,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Infer actual arrivals from newly polled locations, resuming from carried-over state.
+
+    The last snapshot seen for each run cannot be confirmed as an arrival until a later
+    snapshot shows the train heading to a different station. Those pending arrivals are
+    carried between invocations in run_state and prepended to the new snapshots, so the
+    result matches infer_actual_arrivals over the full history. A pending arrival for a
+    run that has not been seen for run_state_ttl is confirmed as the final station of
+    the run.
+
+    Args:
+        df: Flattened train locations polled since the last invocation.
+        run_state: The pending arrival per (route_name, run_number) from the last
+            invocation, with the columns in RUN_STATE_COLUMNS.
+        run_state_ttl: How long a run can go unseen before its pending arrival is final.
+
+    Returns:
+        Tuple of the confirmed arrivals, with the columns in ACTUAL_ARRIVAL_COLUMNS, and
+        the new run state to carry into the next invocation.
+    """
+    carried = pd.DataFrame(
+        {
+            "ingestion_timestamp": run_state["ingestion_timestamp"],
+            "route_name": run_state["route_name"],
+            "run_number": run_state["run_number"],
+            "train_direction": run_state["train_direction"],
+            "next_stop_id": run_state["stop_id"],
+            "next_station_name": run_state["station_name"],
+            "predicted_arrival": run_state["arrival_time"],
+        }
+    )
+    frames = [frame for frame in [carried, df[carried.columns]] if not frame.empty]
+    if not frames:
+        empty_arrivals = _build_arrivals(TrainRecordColumns().to_dataframe())
+        return empty_arrivals, pd.DataFrame(columns=RUN_STATE_COLUMNS)
+    combined = pd.concat(frames, ignore_index=True)
+
+    positions, is_last = _scan_station_transitions(combined)
+    last_snapshots = combined.iloc[positions[is_last]]
+    is_expired = (
+        last_snapshots["ingestion_timestamp"]
+        < combined["ingestion_timestamp"].max() - run_state_ttl
+    ).to_numpy()
+
+    arrivals = _build_arrivals(
+        combined.iloc[
+            np.concatenate([positions[~is_last], positions[is_last][is_expired]])
+        ]
+    )
+    pending = last_snapshots[~is_expired]
+    new_run_state = pd.DataFrame(
+        {
+            "route_name": pending["route_name"],
+            "run_number": pending["run_number"],
+            "train_direction": pending["train_direction"],
+            "stop_id": pending["next_stop_id"],
+            "station_name": pending["next_station_name"],
+            "arrival_time": pending["predicted_arrival"],
+            "ingestion_timestamp": pending["ingestion_timestamp"],
+        },
+        columns=RUN_STATE_COLUMNS,
+    ).reset_index(drop=True)
+    return arrivals, new_run_state
+
+
+def load_processing_state(bucket_name: str) -> tuple[str | None, pd.DataFrame]:
+    """
+    Load the incremental processing watermark and run state from S3.
+
+    Args:
+        bucket_name: The name of the S3 bucket.
+
+    Returns:
+        Tuple of the key of the last raw file processed (None if nothing has been
+        processed yet) and the pending arrival per run, with the columns in
+        RUN_STATE_COLUMNS.
+    """
+    s3_client = boto3.client("s3")
+    try:
+        response = s3_client.get_object(Bucket=bucket_name, Key=PROCESSING_STATE_KEY)
+    except botocore.exceptions.ClientError as e:
+        if e.response["Error"]["Code"] != "NoSuchKey":
+            raise
+        logger.info("No processing state found, starting from scratch")
+        return None, pd.DataFrame(columns=RUN_STATE_COLUMNS)
+
+    state = json.loads(response["Body"].read())
+    run_state = pd.DataFrame(state["runs"], columns=RUN_STATE_COLUMNS)
+    for column in ["run_number", "train_direction", "stop_id"]:
+        run_state[column] = run_state[column].astype("Int32")
+    run_state["arrival_time"] = pd.to_datetime(run_state["arrival_time"])
+    run_state["ingestion_timestamp"] = pd.to_datetime(
+        run_state["ingestion_timestamp"], utc=True
+    )
+    logger.info(
+        f"Loaded processing state with watermark {state['watermark']} "
+        f"and {len(run_state)} pending runs"
+    )
+    return state["watermark"], run_state
+
+
+def save_processing_state(
+    bucket_name: str, watermark: str | None, run_state: pd.DataFrame
+):
+    """
+    Save the incremental processing watermark and run state to S3.
+
+    Args:
+        bucket_name: The name of the S3 bucket.
+        watermark: The key of the last raw file processed.
+        run_state: The pending arrival per run, with the columns in RUN_STATE_COLUMNS.
+    """
+    runs = [
+        {column: None if pd.isna(value) else value for column, value in record.items()}
+        for record in run_state.astype(object).to_dict(orient="records")
+    ]
+    body = json.dumps({"watermark": watermark, "runs": runs}, default=str)
+    s3_client = boto3.client("s3")
+    s3_client.put_object(Bucket=bucket_name, Key=PROCESSING_STATE_KEY, Body=body)
+    logger.info(
+        f"Saved processing state with watermark {watermark} and {len(run_state)} pending runs"
+    )
+
+
+def load_snapshot_decoder(bucket_name: str) -> SnapshotDecoder:
+    """
+    Load the snapshot decoder with the keyframes carried over from the last invocation.
+
+    Args:
+        bucket_name: The name of the S3 bucket.
+
+    Returns:
+        SnapshotDecoder: The decoder, with no keyframes if none were saved.
+    """
+    s3_client = boto3.client("s3")
+    try:
+        response = s3_client.get_object(
+            Bucket=bucket_name, Key=SNAPSHOT_DECODER_STATE_KEY
+        )
+    except botocore.exceptions.ClientError as e:
+        if e.response["Error"]["Code"] != "NoSuchKey":
+            raise
+        return SnapshotDecoder()
+    keyframes = json.loads(response["Body"].read())
+    logger.info(f"Loaded {len(keyframes)} delta snapshot keyframes")
+    return SnapshotDecoder(keyframes=keyframes)
+
+
+def save_snapshot_decoder(bucket_name: str, decoder: SnapshotDecoder):
+    """
+    Save the keyframes of the active delta-encoded streams for the next invocation.
+
+    Args:
+        bucket_name: The name of the S3 bucket.
+        decoder: The decoder holding the last keyframe of each stream.
+    """
+    keyframes = decoder.get_keyframes(max_age=KEYFRAME_TTL)
+    s3_client = boto3.client("s3")
+    s3_client.put_object(
+        Bucket=bucket_name, Key=SNAPSHOT_DECODER_STATE_KEY, Body=json.dumps(keyframes)
+    )
+    logger.info(f"Saved {len(keyframes)} delta snapshot keyframes")
+
+
+def process_new_train_locations(bucket_name: str, today_date: datetime.date) -> dict:
+    """
+    Infer arrivals from only the raw files added since the last invocation.
+
+    Confirmed arrivals are written as one Parquet file per service day, named after the
+    new watermark so a retried invocation overwrites rather than duplicates its output.
+    The watermark, run state and delta snapshot keyframes are saved only after the
+    arrivals are written.
+
+    Args:
+        bucket_name: The name of the S3 bucket.
+        today_date: The current date, used as the last partition to read.
+
+    Returns:
+        dict: A response indicating the success of the operation.
+    """
+    watermark, run_state = load_processing_state(bucket_name=bucket_name)
+
+    # Resume from the day of the watermark, or from yesterday on the first run
+    start_date = today_date - datetime.timedelta(days=1)
+    if watermark:
+        match = re.search(r"year=(\d{4})/month=(\d{2})/day=(\d{2})/", watermark)
+        if match:
+            start_date = datetime.date(*(int(part) for part in match.groups()))
+    partition_paths = [
+        build_partition_path(start_date + datetime.timedelta(days=offset))
+        for offset in range((today_date - start_date).days + 1)
+    ]
+
+    logger.info("Extracting new CTA train data from S3...")
+    decoder = load_snapshot_decoder(bucket_name=bucket_name)
+    df, new_watermark = extract_new_cta_data_from_s3(
+        bucket_name=bucket_name,
+        partition_paths=partition_paths,
+        watermark=watermark,
+        decoder=decoder,
+    )
+    if new_watermark == watermark:
+        logger.info("No new files since the last watermark")
+        return {
+            "status": "success",
+            "message": "No new CTA data to process.",
+            "arrivals": 0,
+        }
+
+    logger.info("Inferring actual arrivals incrementally...")
+    df_arrivals, new_run_state = infer_actual_arrivals_incremental(
+        df=df.drop_duplicates(), run_state=run_state
+    )
+    batch_name = os.path.basename(new_watermark).split(".")[0]
+    for service_date, df_service_day in df_arrivals.groupby("service_date"):
+        write_df_to_s3(
+            df=df_service_day,
+            bucket_name=bucket_name,
+            key=f"actual_arrivals/service_date={service_date.isoformat()}/{batch_name}.parquet",
+        )
+    logger.info(f"Wrote {len(df_arrivals)} confirmed arrivals")
+
+    save_snapshot_decoder(bucket_name=bucket_name, decoder=decoder)
+    save_processing_state(
+        bucket_name=bucket_name, watermark=new_watermark, run_state=new_run_state
+    )
+    return {
+        "status": "success",
+        "message": "CTA data processing complete.",
+        "arrivals": len(df_arrivals),
+    }
 
 
 def handler(event, context):
@@ -253,31 +1520,47 @@ def handler(event, context):
     yesterday_date = today_date - datetime.timedelta(days=1)
 
     bucket_name = f"{os.environ['ACCOUNT_NUMBER']}-cta-analytics-project"
-    today_partition_path = f"raw-api-data/success/year={today_date.year}/month={'{:02d}'.format(today_date.month)}/day={today_date.day}/"
-    yesterday_partition_path = f"raw-api-data/success/year={yesterday_date.year}/month={'{:02d}'.format(yesterday_date.month)}/day={yesterday_date.day}/"
+
+    if event.get("mode", PROCESSING_MODE) == "incremental":
+        return process_new_train_locations(
+            bucket_name=bucket_name, today_date=today_date
+        )
+
+    partition_paths = [
+        build_partition_path(yesterday_date),
+        build_partition_path(today_date),
+    ]
 
     logger.info("Extracting CTA train data from S3...")
-    df_today = extract_cta_data_from_s3(
-        bucket_name=bucket_name, partition_path=today_partition_path
-    )
-    df_yesterday = extract_cta_data_from_s3(
-        bucket_name=bucket_name, partition_path=yesterday_partition_path
-    )
-    df_combined = pd.concat(
-        [df_today, df_yesterday], ignore_index=True
+    df_combined = extract_cta_data_from_s3(
+        bucket_name=bucket_name, partition_path=partition_paths
     ).drop_duplicates()
 
-    # Filter for only the previous day of data, using current_timestamp field
-    df_filtered = df_combined
-    logger.info("Writing df locally for testing...")
-    df_filtered.to_csv("output.csv", index=False)
+    # Only the previous service day is complete, so only it is (over)written
+    df_locations = df_combined[
+        get_service_date(df_combined["current_timestamp"]) == yesterday_date
+    ]
+    logger.info(
+        f"Writing {len(df_locations)} train locations for service day {yesterday_date}"
+    )
+    write_train_locations_to_s3(df=df_locations, bucket_name=bucket_name)
 
-    # logger.info("Writing CTA train data to S3...")
-    # write_df_to_s3(
-    #     df=df,
-    #     bucket_name=bucket_name,
-    #     key=f"raw/{today_date.strftime("%Y-%m-%d")}_cta_train_data.csv"
-    # )
+    logger.info("Inferring actual arrivals...")
+    df_arrivals = infer_actual_arrivals(df_combined)
+    df_arrivals = df_arrivals[df_arrivals["service_date"] == yesterday_date]
+    logger.info(
+        f"Inferred {len(df_arrivals)} arrivals for service day {yesterday_date}"
+    )
+    # An empty frame has no values to infer the service_date and category types from,
+    # so writing it would give a file whose schema differs from the other days
+    if df_arrivals.empty:
+        logger.info(f"No arrivals to write for service day {yesterday_date}")
+    else:
+        write_df_to_s3(
+            df=df_arrivals,
+            bucket_name=bucket_name,
+            key=f"actual_arrivals/service_date={yesterday_date.isoformat()}/actual_arrivals.parquet",
+        )
 
     return {
         "status": "success",
@@ -285,7 +1568,8 @@ def handler(event, context):
     }
 
 
-handler(
-    event={},
-    context={},
-)
+if __name__ == "__main__":
+    handler(
+        event={},
+        context={},
+    )
@@ -1,4 +1,6 @@
 -- Get actual arrival time at each station
+-- Implemented as infer_actual_arrivals in main.py, which writes the actual_arrivals
+-- Parquet dataset per service day. Kept here as the reference for its semantics.
 CREATE OR REPLACE VIEW actual_arrivals AS
 WITH station_transitions AS (
     SELECT 
@@ -0,0 +1,97 @@
+"""
+DuckDB connection to S3 shared by the Lambda functions that query data with DuckDB.
+
+The connection is created once per Lambda container and reused across invocations. If
+the deployment package contains a pre-installed httpfs extension it is loaded from
+there, so cold starts never download extensions.
+"""
+
+import logging
+import os
+import sys
+
+import duckdb
+
+logger = logging.getLogger(__name__)
+stream_handler = logging.StreamHandler(sys.stdout)
+stream_handler.setLevel(logging.INFO)
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+stream_handler.setFormatter(formatter)
+logger.addHandler(stream_handler)
+logger.setLevel(logging.DEBUG)
+
+# Directory the deployment package build pre-installs DuckDB extensions into, relative
+# to the Lambda task root (the root of the deployment package)
+BUNDLED_EXTENSION_DIRECTORY = os.path.join(
+    os.environ.get("LAMBDA_TASK_ROOT", os.getcwd()), "duckdb_extensions"
+)
+
+# Writable fallback directory extensions are downloaded into when none are bundled
+DOWNLOADED_EXTENSION_DIRECTORY = "/tmp/duckdb_extensions"
+
+# Connection reused across invocations in a warm Lambda container, see get_db_connection
+_db_connection: duckdb.DuckDBPyConnection | None = None
+
+
+def get_extension_directory() -> tuple[str, bool]:
+    """
+    Get the directory to load DuckDB extensions from.
+
+    Returns:
+        Tuple of the extension directory, and whether extensions in it are bundled with
+        the deployment package rather than needing to be installed.
+    """
+    bundled_directory = os.environ.get(
+        "DUCKDB_EXTENSION_DIRECTORY", BUNDLED_EXTENSION_DIRECTORY
+    )
+    if os.path.isdir(bundled_directory):
+        return bundled_directory, True
+    return DOWNLOADED_EXTENSION_DIRECTORY, False
+
+
+def create_db_connection() -> duckdb.DuckDBPyConnection:
+    """
+    Create DuckDB connection to S3.
+
+    Returns:
+        duckdb.DuckDBPyConnection: The DuckDB connection
+    """
+    con = duckdb.connect(database=":memory:")
+
+    # Set the home directory to /tmp, which is writable in Lambda
+    con.execute("SET home_directory='/tmp';")
+
+    # Explicitly set paths for extensions and secrets
+    extension_directory, is_bundled = get_extension_directory()
+    con.execute(f"SET extension_directory='{extension_directory}';")
+    con.execute("SET secret_directory='/tmp/duckdb_secrets';")
+
+    # Load httpfs, only installing it if it was not bundled in the deployment package
+    if is_bundled:
+        logger.info("Loading bundled DuckDB extensions from %s", extension_directory)
+    else:
+        con.execute("INSTALL httpfs;")
+    con.execute("LOAD httpfs;")
+
+    # Register the credential chain. This automatically looks for ~/.aws/credentials (local)
+    # or IAM user credentials (Streamlit)
+    con.execute("""
+        CREATE OR REPLACE SECRET s3_creds (
+            TYPE S3,
+            PROVIDER CREDENTIAL_CHAIN
+        );
+    """)
+    return con
+
+
+def get_db_connection() -> duckdb.DuckDBPyConnection:
+    """
+    Get the DuckDB connection to S3, creating it on first use.
+
+    Returns:
+        duckdb.DuckDBPyConnection: The DuckDB connection
+    """
+    global _db_connection
+    if _db_connection is None:
+        _db_connection = create_db_connection()
+    return _db_connection
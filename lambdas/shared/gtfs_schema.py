@@ -0,0 +1,139 @@
+"""
+Declared schema of the GTFS tables converted to Parquet at ingest.
+
+CTA's GTFS text files are read with every column as text and cast to the types declared
+here, so the Parquet copies are typed the same way on every run instead of by sniffing.
+Times are stored as seconds since midnight of the service day, which can pass 24 hours.
+"""
+
+# Type marker for GTFS times (HH:MM:SS), stored as INTEGER seconds since midnight
+GTFS_TIME = "GTFS_TIME"
+
+# Prefix of the Parquet copies of the GTFS tables in the S3 bucket
+GTFS_PARQUET_PREFIX = "gtfs_parquet"
+
+# Columns and types of each GTFS table converted to Parquet, in output column order
+GTFS_TABLE_SCHEMAS: dict[str, dict[str, str]] = {
+    "calendar": {
+        "service_id": "VARCHAR",
+        "monday": "TINYINT",
+        "tuesday": "TINYINT",
+        "wednesday": "TINYINT",
+        "thursday": "TINYINT",
+        "friday": "TINYINT",
+        "saturday": "TINYINT",
+        "sunday": "TINYINT",
+        "start_date": "INTEGER",
+        "end_date": "INTEGER",
+    },
+    "calendar_dates": {
+        "service_id": "VARCHAR",
+        "date": "INTEGER",
+        "exception_type": "TINYINT",
+    },
+    "routes": {
+        "route_id": "VARCHAR",
+        "route_short_name": "VARCHAR",
+        "route_long_name": "VARCHAR",
+        "route_type": "TINYINT",
+        "route_url": "VARCHAR",
+        "route_color": "VARCHAR",
+        "route_text_color": "VARCHAR",
+    },
+    "stops": {
+        "stop_id": "INTEGER",
+        "stop_code": "VARCHAR",
+        "stop_name": "VARCHAR",
+        "stop_desc": "VARCHAR",
+        "stop_lat": "DOUBLE",
+        "stop_lon": "DOUBLE",
+        "location_type": "TINYINT",
+        "parent_station": "INTEGER",
+        "wheelchair_boarding": "TINYINT",
+    },
+    "stop_times": {
+        "trip_id": "VARCHAR",
+        "arrival_time": GTFS_TIME,
+        "departure_time": GTFS_TIME,
+        "stop_id": "INTEGER",
+        "stop_sequence": "INTEGER",
+        "stop_headsign": "VARCHAR",
+        "pickup_type": "TINYINT",
+        "shape_dist_traveled": "DOUBLE",
+    },
+    "trips": {
+        "route_id": "VARCHAR",
+        "service_id": "VARCHAR",
+        "trip_id": "VARCHAR",
+        "direction_id": "TINYINT",
+        "block_id": "VARCHAR",
+        "shape_id": "VARCHAR",
+        "direction": "VARCHAR",
+        "wheelchair_accessible": "TINYINT",
+        "schd_trip_id": "VARCHAR",
+    },
+}
+
+
+def gtfs_time_to_seconds_sql(expression: str) -> str:
+    """
+    Build SQL parsing a GTFS time (H:MM:SS or HH:MM:SS) into seconds since midnight.
+
+    Args:
+        expression: SQL expression of the time as text.
+
+    Returns:
+        str: SQL expression of the time as INTEGER seconds since midnight.
+    """
+    time_text = f"trim({expression})"
+    return (
+        f"(split_part({time_text}, ':', 1)::INTEGER * 3600"
+        f" + split_part({time_text}, ':', 2)::INTEGER * 60"
+        f" + split_part({time_text}, ':', 3)::INTEGER)"
+    )
+
+
+def seconds_to_gtfs_time_sql(expression: str) -> str:
+    """
+    Build SQL formatting seconds since midnight as a zero-padded GTFS time (HH:MM:SS).
+
+    Args:
+        expression: SQL expression of the time as seconds since midnight.
+
+    Returns:
+        str: SQL expression of the time as text.
+    """
+    return (
+        f"printf('%02d:%02d:%02d', ({expression}) // 3600,"
+        f" ({expression}) // 60 % 60, ({expression}) % 60)"
+    )
+
+
+def build_gtfs_select_list(table: str, source_columns: list[str]) -> str:
+    """
+    Build the SQL select list casting a GTFS table read as text to its declared schema.
+
+    Declared columns missing from the source are selected as typed NULLs, and source
+    columns that are not declared are dropped.
+
+    Args:
+        table: The GTFS table name, a key of GTFS_TABLE_SCHEMAS.
+        source_columns: The column names of the table as read from the text file.
+
+    Returns:
+        str: The select list, one typed expression per declared column.
+    """
+    select_list = []
+    for column, column_type in GTFS_TABLE_SCHEMAS[table].items():
+        # Quote identifiers, as some GTFS column names such as date are SQL keywords
+        identifier = f'"{column}"'
+        if column not in source_columns:
+            output_type = "INTEGER" if column_type == GTFS_TIME else column_type
+            select_list.append(f"NULL::{output_type} AS {identifier}")
+        elif column_type == GTFS_TIME:
+            select_list.append(
+                f"{gtfs_time_to_seconds_sql(identifier)} AS {identifier}"
+            )
+        else:
+            select_list.append(f"CAST({identifier} AS {column_type}) AS {identifier}")
+    return ",\n".join(select_list)
@@ -0,0 +1,249 @@
+"""
+Delta encoding of train location snapshots, shared by the Lambda that polls the CTA API
+and the Lambda that processes the raw snapshots.
+
+A delta-encoded stream is a series of snapshots from one Lambda container. Keyframes
+are ordinary full snapshots with encoding metadata added, so they remain readable by
+code that ignores the encoding. Deltas replace each route's "train" list with a
+"trainDelta" list, which must be decoded against the keyframe named by "base".
+"""
+
+import datetime
+import uuid
+
+
+def iter_routes(response: dict) -> list[dict]:
+    """
+    Get the routes of an API response as a list.
+
+    The API returns a single object rather than a list when there is only one, and omits
+    the routes when the request failed.
+
+    Args:
+        response: The API response for one train line.
+
+    Returns:
+        list[dict]: The route objects.
+    """
+    routes = response.get("ctatt", {}).get("route") or []
+    return routes if isinstance(routes, list) else [routes]
+
+
+def get_route_trains(route: dict) -> list[dict]:
+    """
+    Get the trains of a route as a list.
+
+    Args:
+        route: The route object.
+
+    Returns:
+        list[dict]: The train objects.
+    """
+    trains = route.get("train") or []
+    return trains if isinstance(trains, list) else [trains]
+
+
+def index_route_trains(snapshot_data: list[dict]) -> dict[str, dict[str, dict]]:
+    """
+    Index the trains of a snapshot by route name and run number.
+
+    Args:
+        snapshot_data: The API responses of a snapshot.
+
+    Returns:
+        dict: The train objects of each route, keyed by run number.
+    """
+    return {
+        route.get("@name"): {
+            train.get("rn"): train for train in get_route_trains(route)
+        }
+        for response in snapshot_data
+        for route in iter_routes(response)
+    }
+
+
+class SnapshotDeltaEncoder:
+    """
+    Encodes snapshots as deltas against the last keyframe sent from this container.
+
+    Every keyframe_interval snapshots, and for the first snapshot after a cold start,
+    the snapshot is sent in full as a keyframe. Other snapshots replace each route's
+    "train" list with a "trainDelta" list holding, for each train in the same order, its
+    run number and only the fields that differ from that train in the keyframe. Encoded
+    snapshots carry the container's stream ID and a sequence number, and deltas name the
+    sequence number of their keyframe rather than of the previous snapshot, so that
+    SnapshotDecoder can rebuild them even if records from overlapping containers
+    interleave or arrive out of order.
+    """
+
+    def __init__(self, keyframe_interval: int = 10):
+        """
+        Args:
+            keyframe_interval: Snapshots per keyframe, including the keyframe itself.
+        """
+        self.keyframe_interval = keyframe_interval
+        self.stream_id = uuid.uuid4().hex
+        self.seq = 0
+        self.keyframe_seq: int | None = None
+        self.keyframe_routes: dict[str, dict[str, dict]] = {}
+
+    def encode(self, snapshot: dict) -> dict:
+        """
+        Encode a snapshot as a keyframe or as a delta against the last keyframe.
+
+        Args:
+            snapshot: The full snapshot, with the poll time and API responses.
+
+        Returns:
+            dict: The encoded snapshot.
+        """
+        seq = self.seq
+        self.seq += 1
+        header = {"encoding": "delta", "stream": self.stream_id, "seq": seq}
+        if (
+            self.keyframe_seq is None
+            or seq - self.keyframe_seq >= self.keyframe_interval
+        ):
+            self.keyframe_seq = seq
+            self.keyframe_routes = index_route_trains(snapshot["data"])
+            return {**snapshot, **header, "keyframe": True}
+
+        data = []
+        for response in snapshot["data"]:
+            if "ctatt" not in response:
+                data.append(response)
+                continue
+            routes = []
+            for route in iter_routes(response):
+                base_trains = self.keyframe_routes.get(route.get("@name"), {})
+                train_deltas = []
+                for train in get_route_trains(route):
+                    base = base_trains.get(train.get("rn"), {})
+                    delta = {
+                        key: value
+                        for key, value in train.items()
+                        if key == "rn" or base.get(key, KeyError) != value
+                    }
+                    # Fields the train no longer has are cleared
+                    delta.update({key: None for key in base.keys() - train.keys()})
+                    train_deltas.append(delta)
+                route = {key: value for key, value in route.items() if key != "train"}
+                routes.append({**route, "trainDelta": train_deltas})
+            data.append({**response, "ctatt": {**response["ctatt"], "route": routes}})
+        return {
+            "timestamp": snapshot["timestamp"],
+            "data": data,
+            **header,
+            "base": self.keyframe_seq,
+        }
+
+    def reset(self):
+        """Make the next snapshot a keyframe."""
+        self.keyframe_seq = None
+        self.keyframe_routes = {}
+
+
+class SnapshotDecoder:
+    """
+    Rebuilds full snapshots from the delta-encoded streams written by
+    SnapshotDeltaEncoder, holding the last few keyframes of each stream.
+
+    Keeping more than the newest keyframe lets a delta still decode when it is read
+    after a newer keyframe of its stream, as happens when records are delivered out of
+    order or a keyframe lands in an earlier file than the deltas based on it. A delta
+    whose keyframe is older than the last max_keyframes_per_stream keyframes of its
+    stream, or was never seen, cannot be decoded.
+    """
+
+    def __init__(
+        self, keyframes: list[dict] | None = None, max_keyframes_per_stream: int = 3
+    ):
+        """
+        Args:
+            keyframes: Keyframes carried over from an earlier decoder, as returned by
+                get_keyframes.
+            max_keyframes_per_stream: Number of the newest keyframes of each stream kept
+                to decode deltas against.
+        """
+        self.max_keyframes_per_stream = max_keyframes_per_stream
+        # Keyframes and their trains indexed by route, by stream ID and sequence number
+        self.keyframes: dict[str, dict[int, dict]] = {}
+        self.keyframe_routes: dict[str, dict[int, dict[str, dict[str, dict]]]] = {}
+        for keyframe in keyframes or []:
+            self.decode(keyframe)
+
+    def decode(self, snapshot: dict) -> dict | None:
+        """
+        Decode a delta-encoded snapshot.
+
+        Args:
+            snapshot: The encoded snapshot.
+
+        Returns:
+            dict: The full snapshot, or None if the keyframe the delta is based on is not
+            held by the decoder.
+        """
+        stream_id = snapshot["stream"]
+        if snapshot.get("keyframe"):
+            stream_keyframes = self.keyframes.setdefault(stream_id, {})
+            stream_routes = self.keyframe_routes.setdefault(stream_id, {})
+            seq = snapshot["seq"]
+            if seq not in stream_keyframes:
+                stream_keyframes[seq] = snapshot
+                stream_routes[seq] = index_route_trains(snapshot["data"])
+                # Drop the oldest keyframes, even if records arrive out of order
+                while len(stream_keyframes) > self.max_keyframes_per_stream:
+                    oldest_seq = min(stream_keyframes)
+                    del stream_keyframes[oldest_seq]
+                    del stream_routes[oldest_seq]
+            return snapshot
+
+        base_routes = self.keyframe_routes.get(stream_id, {}).get(snapshot["base"])
+        if base_routes is None:
+            return None
+        data = []
+        for response in snapshot["data"]:
+            if "ctatt" not in response:
+                data.append(response)
+                continue
+            routes = []
+            for route in iter_routes(response):
+                base_trains = base_routes.get(route.get("@name"), {})
+                trains = [
+                    {**base_trains.get(delta.get("rn"), {}), **delta}
+                    for delta in route.get("trainDelta", [])
+                ]
+                route = {
+                    key: value for key, value in route.items() if key != "trainDelta"
+                }
+                routes.append({**route, "train": trains})
+            data.append({**response, "ctatt": {**response["ctatt"], "route": routes}})
+        return {"timestamp": snapshot["timestamp"], "data": data}
+
+    def get_keyframes(self, max_age: datetime.timedelta) -> list[dict]:
+        """
+        Get the keyframes to carry over to a later decoder.
+
+        Args:
+            max_age: How much older than the newest keyframe a stream's newest keyframe
+                can be before the stream is considered finished and its keyframes are
+                dropped.
+
+        Returns:
+            list[dict]: The keyframes held for each active stream, oldest first.
+        """
+        if not self.keyframes:
+            return []
+        timestamps = {
+            stream_id: datetime.datetime.fromisoformat(
+                stream_keyframes[max(stream_keyframes)]["timestamp"]
+            )
+            for stream_id, stream_keyframes in self.keyframes.items()
+        }
+        newest = max(timestamps.values())
+        return [
+            stream_keyframes[seq]
+            for stream_id, stream_keyframes in self.keyframes.items()
+            if timestamps[stream_id] >= newest - max_age
+            for seq in sorted(stream_keyframes)
+        ]
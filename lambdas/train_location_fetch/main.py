@@ -3,19 +3,30 @@ Lambda function to fetch train location data for each CTA train line. The API re
 is sent to Firehose for batch loading to S3.
 """
 
+import asyncio
 import concurrent.futures
 import datetime
 import json
 import logging
 import os
+import random
 import sys
 import time
 
 import boto3
+import botocore.client
 import botocore.exceptions
 import requests
+import requests.adapters
 from dotenv import load_dotenv
 
+from lambdas.shared.snapshot_encoding import SnapshotDeltaEncoder
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
 load_dotenv()
 
 logger = logging.getLogger(__name__)
@@ -28,8 +39,138 @@ logger.setLevel(logging.DEBUG)
 
 API_BASE_URL = "http://lapi.transitchicago.com/api/1.0/ttpositions.aspx"
 
+# Train lines polled on each invocation, one request per line
+TRAIN_LINES = [
+    "blue",
+    "brn",
+    "g",
+    "org",
+    "p",
+    "pink",
+    "red",
+    "y",
+]
+
+# One worker, and one pooled keep-alive connection, per train line
+FETCH_WORKERS = len(TRAIN_LINES)
+
+# 'threads' fans the requests out over a thread pool, 'asyncio' over a single event loop
+FETCH_ENGINE = os.environ.get("FETCH_ENGINE", "threads")
+
+# Timeout in seconds for each request to the CTA API
+REQUEST_TIMEOUT_SECONDS = 5
+
+# Retry policy shared by both fetch engines: retries of a failed request, and the base
+# in seconds of the exponential backoff between attempts (1s, 2s, 4s, ...)
+FETCH_MAX_RETRIES = 2
+RETRY_BACKOFF_BASE_SECONDS = 1
+
+# Seconds between polls when one invocation polls repeatedly, and for how long it keeps
+# polling. An interval of 0 polls once per invocation.
+POLL_INTERVAL_SECONDS = float(os.environ.get("POLL_INTERVAL_SECONDS", "0"))
+POLL_DURATION_SECONDS = float(os.environ.get("POLL_DURATION_SECONDS", "55"))
+
+# Time reserved at the end of the invocation for the Firehose publish
+FIREHOSE_PUBLISH_MARGIN_MS = 5_000
+
+# Time that must be left in the invocation to start another poll, enough for one
+# attempt per line that times out plus the Firehose publish. Retries within a poll are
+# only made if they can finish before the publish margin, see poll_snapshots.
+POLL_DEADLINE_MARGIN_MS = REQUEST_TIMEOUT_SECONDS * 1000 + FIREHOSE_PUBLISH_MARGIN_MS
+
+# 'full' sends every snapshot in full, 'delta' sends periodic full keyframes and, in
+# between, only the train fields that differ from the last keyframe
+PAYLOAD_ENCODING = os.environ.get("PAYLOAD_ENCODING", "full")
+
+# Snapshots per keyframe when delta encoding, including the keyframe itself
+KEYFRAME_INTERVAL = int(os.environ.get("KEYFRAME_INTERVAL", "10"))
+
+# Firehose delivery stream the snapshots are sent to, and the limits of put_record_batch
+DELIVERY_STREAM_NAME = "cta-train-locations-stream"
+FIREHOSE_MAX_BATCH_RECORDS = 500
+FIREHOSE_MAX_BATCH_BYTES = 4 * 1024 * 1024
+FIREHOSE_MAX_RECORD_BYTES = 1000 * 1024
+
+# Attempts at putting each record before giving up on it
+FIREHOSE_MAX_ATTEMPTS = 3
 
-def fetch_cta_data(line: str, api_key: str, max_retries: int = 2) -> dict:
+# Delta encoder holding the last keyframe, reused across invocations in a warm Lambda
+# container, see get_delta_encoder
+_delta_encoder: "SnapshotDeltaEncoder | None" = None
+
+# Firehose client reused across invocations in a warm Lambda container
+_firehose_client: botocore.client.BaseClient | None = None
+
+# HTTP session reused across invocations in a warm Lambda container, see get_http_session
+_http_session: requests.Session | None = None
+
+# Event loop and HTTP session of the asyncio engine, reused across invocations in a warm
+# Lambda container so pooled connections survive between invocations
+_event_loop: asyncio.AbstractEventLoop | None = None
+_async_http_session: "aiohttp.ClientSession | None" = None
+
+
+def get_http_session() -> requests.Session:
+    """
+    Get the HTTP session for CTA API requests, creating it on first use.
+
+    The session keeps connections to the API alive between requests, and is kept at
+    module level so that warm invocations skip the TCP handshake. Its connection pool
+    holds one connection per fetch worker so that no worker waits for, or discards, a
+    connection.
+
+    Returns:
+        requests.Session: The pooled HTTP session.
+    """
+    global _http_session
+    if _http_session is None:
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=FETCH_WORKERS, pool_block=True
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _http_session = session
+    return _http_session
+
+
+def get_retry_wait_seconds(
+    attempt: int, max_retries: int, deadline: float | None = None
+) -> float | None:
+    """
+    Get the wait before retrying a failed request to the CTA API, if it is retried.
+
+    Waits are drawn with full jitter up to an exponential backoff, so lines failing
+    together do not retry in lockstep. A request is not retried once its retries are
+    used up, or when the retry could time out after the deadline.
+
+    Args:
+        attempt: The zero-based number of the attempt that failed.
+        max_retries: Maximum number of retry attempts for failed requests.
+        deadline: The time.monotonic() time by which any retry must have finished, or
+            None to retry regardless of time.
+
+    Returns:
+        float | None: The number of seconds to wait before the next attempt, or None if
+            the request should not be retried.
+    """
+    if attempt >= max_retries:
+        return None
+    wait_time = random.uniform(0, RETRY_BACKOFF_BASE_SECONDS * 2**attempt)
+    if (
+        deadline is not None
+        and time.monotonic() + wait_time + REQUEST_TIMEOUT_SECONDS > deadline
+    ):
+        return None
+    return wait_time
+
+
+def fetch_cta_data(
+    line: str,
+    api_key: str,
+    max_retries: int = FETCH_MAX_RETRIES,
+    deadline: float | None = None,
+) -> dict:
     """
     Function to fetch location data for a single train line with retry logic.
 
@@ -37,32 +178,44 @@ def fetch_cta_data(line: str, api_key: str, max_retries: int = 2) -> dict:
         line: The name of the train line for the API request.
         api_key: The CTA API key to use for authenticated API requests.
         max_retries: Maximum number of retry attempts for failed requests.
+        deadline: The time.monotonic() time by which any retry must have finished, or
+            None to retry regardless of time.
 
     Returns:
         dict: The JSON API response.
 
     Raises:
-        requests.RequestException: If all retry attempts fail.
+        requests.RequestException: If all retry attempts fail with a request error.
+        json.JSONDecodeError: If all retry attempts fail and the last response was not
+            valid JSON.
     """
+    session = get_http_session()
     for attempt in range(max_retries + 1):
+        start_time = time.perf_counter()
         try:
-            response = requests.get(
+            response = session.get(
                 url=API_BASE_URL,
                 params={
                     "rt": line,
                     "key": api_key,
                     "outputType": "JSON",
                 },
-                timeout=5,
+                timeout=REQUEST_TIMEOUT_SECONDS,
             )
             response.raise_for_status()
-            logger.info("Successfully fetched data for %s route", line)
+            logger.info(
+                "Successfully fetched data for %s route in %.1f ms",
+                line,
+                (time.perf_counter() - start_time) * 1000,
+            )
             return response.json()
-        except requests.exceptions.RequestException as e:
-            if attempt < max_retries:
-                wait_time = 2**attempt  # Exponential backoff: 1s, 2s, 4s
+        except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
+            wait_time = get_retry_wait_seconds(
+                attempt=attempt, max_retries=max_retries, deadline=deadline
+            )
+            if wait_time is not None:
                 logger.warning(
-                    "Request error occurred for %s route (attempt %d/%d): %s. Retrying in %d seconds...",
+                    "Request error occurred for %s route (attempt %d/%d): %s. Retrying in %.2f seconds...",
                     line,
                     attempt + 1,
                     max_retries + 1,
@@ -74,61 +227,163 @@ def fetch_cta_data(line: str, api_key: str, max_retries: int = 2) -> dict:
                 logger.error(
                     "Request error occurred for %s route after %d attempts: %s",
                     line,
-                    max_retries + 1,
+                    attempt + 1,
                     str(e),
                 )
                 raise
 
 
-def write_to_firehose(payload: str):
+async def get_async_http_session() -> "aiohttp.ClientSession":
     """
-    Writes a payload to Kinesis Data Firehose.
+    Get the aiohttp session for CTA API requests, creating it on first use.
 
-    Args:
-        payload: The payload to write to Kinesis Data Firehose.
+    Must be awaited on the event loop returned by get_event_loop, which the session is
+    bound to.
+
+    Returns:
+        aiohttp.ClientSession: The pooled HTTP session.
     """
-    firehose = boto3.client("firehose")
-    DELIVERY_STREAM_NAME = "cta-train-locations-stream"
-    try:
-        firehose.put_record(
-            DeliveryStreamName=DELIVERY_STREAM_NAME, Record={"Data": payload}
+    global _async_http_session
+    if _async_http_session is None or _async_http_session.closed:
+        _async_http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=FETCH_WORKERS),
+            timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT_SECONDS),
         )
-        logger.info("Successfully sent payload to Firehose")
-    except botocore.exceptions.ClientError as e:
-        logger.error("Error occurred sending payload to Firehose: %s", str(e))
-        raise
+    return _async_http_session
 
 
-def handler(event, context):
+def get_event_loop() -> asyncio.AbstractEventLoop:
     """
-    Lambda handler function to fetch GTFS data and store it in S3.
+    Get the event loop the asyncio engine runs on, creating it on first use.
+
+    Returns:
+        asyncio.AbstractEventLoop: The event loop.
+    """
+    global _event_loop
+    if _event_loop is None or _event_loop.is_closed():
+        _event_loop = asyncio.new_event_loop()
+    return _event_loop
+
+
+async def fetch_cta_data_async(
+    session: "aiohttp.ClientSession",
+    line: str,
+    api_key: str,
+    max_retries: int = FETCH_MAX_RETRIES,
+    deadline: float | None = None,
+) -> dict:
+    """
+    Function to fetch location data for a single train line with retry logic.
 
     Args:
-        event: The event data that triggered the Lambda function.
-        context: The context in which the Lambda function is running.
+        session: The aiohttp session to send the request with.
+        line: The name of the train line for the API request.
+        api_key: The CTA API key to use for authenticated API requests.
+        max_retries: Maximum number of retry attempts for failed requests.
+        deadline: The time.monotonic() time by which any retry must have finished, or
+            None to retry regardless of time.
+
+    Returns:
+        dict: The JSON API response.
+
+    Raises:
+        aiohttp.ClientError: If all retry attempts fail with a request error.
+        TimeoutError: If all retry attempts fail and the last one timed out.
+        json.JSONDecodeError: If all retry attempts fail and the last response was not
+            valid JSON.
     """
-    logger.info("Starting train location fetch Lambda execution.")
-    logger.info("Event data: %s", event)
-    logger.info("Context data: %s", context)
+    for attempt in range(max_retries + 1):
+        start_time = time.perf_counter()
+        try:
+            async with session.get(
+                API_BASE_URL,
+                params={
+                    "rt": line,
+                    "key": api_key,
+                    "outputType": "JSON",
+                },
+            ) as response:
+                response.raise_for_status()
+                # The API does not always label its JSON responses as application/json
+                data = await response.json(content_type=None)
+            logger.info(
+                "Successfully fetched data for %s route in %.1f ms",
+                line,
+                (time.perf_counter() - start_time) * 1000,
+            )
+            return data
+        except (aiohttp.ClientError, TimeoutError, json.JSONDecodeError) as e:
+            wait_time = get_retry_wait_seconds(
+                attempt=attempt, max_retries=max_retries, deadline=deadline
+            )
+            if wait_time is not None:
+                logger.warning(
+                    "Request error occurred for %s route (attempt %d/%d): %r. Retrying in %.2f seconds...",
+                    line,
+                    attempt + 1,
+                    max_retries + 1,
+                    e,
+                    wait_time,
+                )
+                await asyncio.sleep(wait_time)
+            else:
+                logger.error(
+                    "Request error occurred for %s route after %d attempts: %r",
+                    line,
+                    attempt + 1,
+                    e,
+                )
+                raise
 
-    train_lines = [
-        "blue",
-        "brn",
-        "g",
-        "org",
-        "p",
-        "pink",
-        "red",
-        "y",
-    ]
-    current_time = datetime.datetime.now(datetime.timezone.utc).isoformat()
 
+async def fetch_all_lines_async(
+    api_key: str, deadline: float | None = None
+) -> list[dict]:
+    """
+    Fetch location data for every train line concurrently on one event loop.
+
+    Args:
+        api_key: The CTA API key to use for authenticated API requests.
+        deadline: The time.monotonic() time by which any retry must have finished, or
+            None to retry regardless of time.
+
+    Returns:
+        list[dict]: The JSON API responses of the lines that were fetched successfully.
+    """
+    session = await get_async_http_session()
+    results = await asyncio.gather(
+        *(
+            fetch_cta_data_async(session, line, api_key, deadline=deadline)
+            for line in TRAIN_LINES
+        ),
+        return_exceptions=True,
+    )
     all_data = []
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error("Error occurred: %s", str(result))
+        else:
+            all_data.append(result)
+    return all_data
+
+
+def fetch_all_lines_threaded(api_key: str, deadline: float | None = None) -> list[dict]:
+    """
+    Fetch location data for every train line concurrently on a thread pool.
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+    Args:
+        api_key: The CTA API key to use for authenticated API requests.
+        deadline: The time.monotonic() time by which any retry must have finished, or
+            None to retry regardless of time.
+
+    Returns:
+        list[dict]: The JSON API responses of the lines that were fetched successfully.
+    """
+    all_data = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
         future_to_url = {
-            executor.submit(fetch_cta_data, line, os.environ["CTA_API_KEY"]): line
-            for line in train_lines
+            executor.submit(fetch_cta_data, line, api_key, deadline=deadline): line
+            for line in TRAIN_LINES
         }
 
         for future in concurrent.futures.as_completed(future_to_url):
@@ -137,15 +392,297 @@ def handler(event, context):
                 all_data.append(data)
             except Exception as exc:
                 logger.error("Error occurred: %s", str(exc))
+    return all_data
+
 
-    # Aggregate and send to Firehose as a single newline-delimited JSON record.
-    # Firehose requires sending as a single newline-delimited JSON record or a bundled object.
-    payload = json.dumps({"timestamp": current_time, "data": all_data}) + "\n"
+def fetch_all_lines(
+    api_key: str, engine: str = "threads", deadline: float | None = None
+) -> list[dict]:
+    """
+    Fetch location data for every train line with the selected engine.
+
+    Args:
+        api_key: The CTA API key to use for authenticated API requests.
+        engine: 'threads' or 'asyncio'.
+        deadline: The time.monotonic() time by which any retry must have finished, or
+            None to retry regardless of time.
+
+    Returns:
+        list[dict]: The JSON API responses of the lines that were fetched successfully.
+
+    Raises:
+        ValueError: If the engine is unknown, or is 'asyncio' and aiohttp is not
+            installed.
+    """
+    if engine == "threads":
+        return fetch_all_lines_threaded(api_key, deadline=deadline)
+    if engine == "asyncio":
+        if aiohttp is None:
+            raise ValueError("The asyncio fetch engine requires aiohttp")
+        return get_event_loop().run_until_complete(
+            fetch_all_lines_async(api_key, deadline=deadline)
+        )
+    raise ValueError(f"Unknown fetch engine: {engine}")
+
+
+def get_delta_encoder() -> SnapshotDeltaEncoder:
+    """
+    Get the snapshot delta encoder, creating it on first use.
+
+    Returns:
+        SnapshotDeltaEncoder: The delta encoder of this Lambda container.
+    """
+    global _delta_encoder
+    if _delta_encoder is None:
+        _delta_encoder = SnapshotDeltaEncoder(keyframe_interval=KEYFRAME_INTERVAL)
+    return _delta_encoder
+
+
+def poll_snapshot(api_key: str, engine: str, deadline: float | None = None) -> dict:
+    """
+    Fetch one snapshot of the locations of all trains.
+
+    Args:
+        api_key: The CTA API key to use for authenticated API requests.
+        engine: The fetch engine, see fetch_all_lines.
+        deadline: The time.monotonic() time by which any retry must have finished, or
+            None to retry regardless of time.
+
+    Returns:
+        dict: The snapshot, with the poll time and the API response of each line.
+    """
+    current_time = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    fetch_start_time = time.perf_counter()
+    all_data = fetch_all_lines(api_key=api_key, engine=engine, deadline=deadline)
+    logger.info(
+        "Fetched %d of %d train lines with the %s engine in %.1f ms",
+        len(all_data),
+        len(TRAIN_LINES),
+        engine,
+        (time.perf_counter() - fetch_start_time) * 1000,
+    )
+    return {"timestamp": current_time, "data": all_data}
+
+
+def poll_snapshots(
+    context,
+    api_key: str,
+    engine: str,
+    interval_seconds: float,
+    duration_seconds: float,
+) -> list[dict]:
+    """
+    Poll snapshots at a fixed cadence within a single invocation.
+
+    Polls are scheduled at fixed offsets from the first one, so time spent fetching does
+    not push later polls back. A poll that overruns its slot skips the slots it missed
+    rather than polling twice in a row. Polling stops once the duration has elapsed, or
+    when too little time is left in the invocation to finish another poll. Retries
+    within a poll are only made if they finish before the time reserved for publishing
+    the snapshots, so a poll never runs into the end of the invocation.
+
+    Args:
+        context: The Lambda context, used to read the remaining invocation time.
+        api_key: The CTA API key to use for authenticated API requests.
+        engine: The fetch engine, see fetch_all_lines.
+        interval_seconds: Seconds between the starts of consecutive polls.
+        duration_seconds: Seconds after the first poll within which polls may start.
+
+    Returns:
+        list[dict]: The snapshots, in the order they were polled.
+    """
+    snapshots = []
+    start_time = time.monotonic()
+    next_poll = 0
+    while True:
+        deadline = (
+            time.monotonic()
+            + (context.get_remaining_time_in_millis() - FIREHOSE_PUBLISH_MARGIN_MS)
+            / 1000
+        )
+        snapshots.append(
+            poll_snapshot(api_key=api_key, engine=engine, deadline=deadline)
+        )
+
+        # Next slot after the current time, skipping any missed while polling
+        elapsed = time.monotonic() - start_time
+        next_poll = max(next_poll + 1, int(elapsed // interval_seconds) + 1)
+        next_poll_offset = next_poll * interval_seconds
+        if next_poll_offset >= duration_seconds:
+            break
+        remaining_ms = context.get_remaining_time_in_millis()
+        wait_ms = (next_poll_offset - elapsed) * 1000
+        if remaining_ms - wait_ms < POLL_DEADLINE_MARGIN_MS:
+            logger.info(
+                "Stopping polling with %d ms left in the invocation", remaining_ms
+            )
+            break
+        time.sleep(next_poll_offset - elapsed)
+    return snapshots
+
+
+def get_firehose_client() -> botocore.client.BaseClient:
+    """
+    Get the Firehose client, creating it on first use.
+
+    Returns:
+        The boto3 Firehose client, reused across invocations in a warm Lambda container.
+    """
+    global _firehose_client
+    if _firehose_client is None:
+        _firehose_client = boto3.client("firehose")
+    return _firehose_client
+
+
+class FirehoseSink:
+    """
+    Buffers records and sends them to Firehose with as few put_record_batch calls as the
+    per-call limits allow.
+    """
+
+    def __init__(self, delivery_stream_name: str = DELIVERY_STREAM_NAME):
+        """
+        Args:
+            delivery_stream_name: The name of the Firehose delivery stream.
+        """
+        self.delivery_stream_name = delivery_stream_name
+        self.records: list[bytes] = []
+        self.buffered_bytes = 0
+
+    def add(self, record: str | bytes):
+        """
+        Buffer a record, first sending the buffer if the record would not fit in the
+        same batch.
+
+        Args:
+            record: The record data. Records are delivered to S3 as-is, so each should
+                end with a newline.
+
+        Raises:
+            ValueError: If the record is larger than Firehose accepts.
+        """
+        data = record.encode("utf-8") if isinstance(record, str) else record
+        if len(data) > FIREHOSE_MAX_RECORD_BYTES:
+            raise ValueError(
+                f"Record of {len(data)} bytes exceeds the Firehose limit of "
+                f"{FIREHOSE_MAX_RECORD_BYTES} bytes"
+            )
+        if (
+            len(self.records) == FIREHOSE_MAX_BATCH_RECORDS
+            or self.buffered_bytes + len(data) > FIREHOSE_MAX_BATCH_BYTES
+        ):
+            self.flush()
+        self.records.append(data)
+        self.buffered_bytes += len(data)
+
+    def flush(self):
+        """
+        Send the buffered records, resending only the records Firehose failed to put.
+
+        Raises:
+            botocore.exceptions.ClientError: If a put_record_batch call fails.
+            RuntimeError: If records still fail after FIREHOSE_MAX_ATTEMPTS attempts.
+        """
+        records, self.records, self.buffered_bytes = self.records, [], 0
+        firehose = get_firehose_client()
+        for attempt in range(FIREHOSE_MAX_ATTEMPTS):
+            if not records:
+                return
+            try:
+                response = firehose.put_record_batch(
+                    DeliveryStreamName=self.delivery_stream_name,
+                    Records=[{"Data": data} for data in records],
+                )
+            except botocore.exceptions.ClientError as e:
+                logger.error("Error occurred sending records to Firehose: %s", str(e))
+                raise
+            sent = len(records)
+            if response["FailedPutCount"] > 0:
+                # Responses are in the same order as the records sent
+                records = [
+                    data
+                    for data, result in zip(records, response["RequestResponses"])
+                    if "ErrorCode" in result
+                ]
+                logger.warning(
+                    "Firehose failed to put %d of %d records (attempt %d/%d)",
+                    len(records),
+                    sent,
+                    attempt + 1,
+                    FIREHOSE_MAX_ATTEMPTS,
+                )
+                if attempt + 1 < FIREHOSE_MAX_ATTEMPTS:
+                    time.sleep(random.uniform(0, 2**attempt))
+            else:
+                logger.info("Successfully sent %d records to Firehose", sent)
+                records = []
+        if records:
+            raise RuntimeError(
+                f"Firehose failed to put {len(records)} records after "
+                f"{FIREHOSE_MAX_ATTEMPTS} attempts"
+            )
+
+
+def write_to_firehose(payloads: list[str]):
+    """
+    Writes payloads to Kinesis Data Firehose, batching them into as few calls as possible.
+
+    Args:
+        payloads: The payloads to write to Kinesis Data Firehose.
+    """
+    sink = FirehoseSink()
+    for payload in payloads:
+        sink.add(payload)
+    sink.flush()
+
+
+def handler(event, context):
+    """
+    Lambda handler function to fetch GTFS data and store it in S3.
+
+    Args:
+        event: The event data that triggered the Lambda function.
+        context: The context in which the Lambda function is running.
+    """
+    logger.info("Starting train location fetch Lambda execution.")
+    logger.info("Event data: %s", event)
+    logger.info("Context data: %s", context)
+
+    engine = event.get("engine", FETCH_ENGINE)
+    interval_seconds = event.get("poll_interval_seconds", POLL_INTERVAL_SECONDS)
+    if interval_seconds > 0:
+        snapshots = poll_snapshots(
+            context=context,
+            api_key=os.environ["CTA_API_KEY"],
+            engine=engine,
+            interval_seconds=interval_seconds,
+            duration_seconds=event.get("poll_duration_seconds", POLL_DURATION_SECONDS),
+        )
+    else:
+        snapshots = [poll_snapshot(api_key=os.environ["CTA_API_KEY"], engine=engine)]
+
+    if event.get("payload_encoding", PAYLOAD_ENCODING) == "delta":
+        encoder = get_delta_encoder()
+        snapshots = [encoder.encode(snapshot) for snapshot in snapshots]
+
+    # Send each snapshot to Firehose as a newline-delimited JSON record, so that the
+    # records concatenated by Firehose form an NDJSON file
+    payloads = [json.dumps(snapshot) + "\n" for snapshot in snapshots]
 
     # Skip Firehose publish for test functions
     if not context.function_name.endswith("-test"):
-        write_to_firehose(payload=payload)
+        try:
+            write_to_firehose(payloads=payloads)
+        except Exception:
+            # Later deltas must not reference a keyframe that may not have been sent
+            if _delta_encoder is not None:
+                _delta_encoder.reset()
+            raise
     else:
         logger.info("Test function detected, skipping Firehose publish")
 
-    return {"status": "success", "count": len(all_data)}
+    return {
+        "status": "success",
+        "count": sum(len(snapshot["data"]) for snapshot in snapshots),
+        "snapshots": len(snapshots),
+    }
@@ -5,11 +5,20 @@ Streamlit app page displaying CTA expected schedule.
 import datetime
 
 import altair as alt
-import duckdb
 import pandas as pd
 import streamlit as st
 
-from pages.utils.utils import load_s3_parquet_data
+from pages.utils.utils import (
+    build_parquet_query,
+    load_s3_parquet_data,
+    load_s3_parquet_max,
+    mirror_s3_parquet,
+    run_query,
+)
+
+# Bit of the service_pattern column for each schedule type, as written by the
+# gtfs_expected_schedule Lambda
+SERVICE_PATTERN_BITS = {"Weekday": 1, "Saturday": 2, "Sunday": 4}
 
 
 # Reusable functions
@@ -126,15 +135,37 @@ def create_aggregate_scheduled_trains_bar_chart(df: pd.DataFrame) -> alt.LayerCh
 
 # Initial page setup and source data load
 st.title("Schedule")
-historical_schedule_data = load_s3_parquet_data(
-    s3_path=f"s3://{st.secrets['env']['ACCOUNT_NUMBER']}-cta-analytics-project/gtfs_expected_cta_schedule/*.parquet"
+schedule_metrics_path = f"s3://{st.secrets['env']['ACCOUNT_NUMBER']}-cta-analytics-project/gtfs_schedule_metrics"
+scheduled_runs_path = f"{schedule_metrics_path}/scheduled_runs/*.parquet"
+
+# The summaries only exist once the gtfs_expected_schedule Lambda has written or
+# backfilled them, so the page waits for all of them rather than failing to read them
+metrics_versions = [
+    mirror_s3_parquet(f"{schedule_metrics_path}/{table}/*.parquet")[1]
+    for table in ["scheduled_runs", "trains_per_hour", "headway"]
+]
+current_effective_date = (
+    load_s3_parquet_max(s3_path=scheduled_runs_path, column="effective_date")
+    if all(metrics_versions)
+    else None
 )
-current_effective_date = str(historical_schedule_data["start_date"].max())
+if current_effective_date is None:
+    st.info(
+        "Schedule metrics are not available yet. Check back once the expected "
+        "schedule has been summarized."
+    )
+    st.stop()
 formatted_current_effective_date = datetime.datetime.strptime(
-    current_effective_date, "%Y%m%d"
+    str(current_effective_date), "%Y%m%d"
 ).strftime("%m/%d/%Y")
 direction_filter = None
-train_lines = sorted(historical_schedule_data["route_long_name"].unique())
+train_lines = sorted(
+    load_s3_parquet_data(
+        s3_path=scheduled_runs_path,
+        columns=["route_long_name"],
+        filters={"effective_date": current_effective_date},
+    )["route_long_name"].unique()
+)
 
 col1, col2 = st.columns(2)
 with col1:
@@ -144,90 +175,81 @@ with col2:
         label="Schedule", options=["Weekday", "Saturday", "Sunday"]
     )
 
-# SQL queries and resulting dataframes
-filtered_schedules = """
-    SELECT
-        *,
-        CASE 
-            WHEN ? = 'Weekday' THEN monday + tuesday + wednesday + thursday + friday
-            WHEN ? = 'Saturday' THEN saturday
-            WHEN ? = 'Sunday' THEN sunday
-            ELSE 0 
-        END AS runs_calculation
-    FROM historical_schedule_data
-    WHERE runs_calculation > 0
-    AND route_long_name = ?
-    """
-df_filtered_schedules = duckdb.query(
-    query=filtered_schedules, params=[schedule_type, schedule_type, schedule_type, line]
-).df()
-duckdb.register("filtered_schedules", df_filtered_schedules)
-
-chart_color = f"#{df_filtered_schedules['route_color'].max()}"
-
-trains_per_hour = """
-    WITH trip_starts AS (
-        SELECT
-            trip_id,
-            MIN(arrival_time) AS first_arrival
-        FROM filtered_schedules
-        GROUP BY trip_id
-    )
+# SQL queries and resulting dataframes, read from the summaries pre-aggregated per
+# GTFS version by the gtfs_expected_schedule Lambda. Only the selected line and
+# schedule are read, and results are cached across sessions until the data changes.
+line_filters = {
+    "route_long_name": line,
+    "service_pattern": SERVICE_PATTERN_BITS[schedule_type],
+}
+current_schedule_filters = {"effective_date": current_effective_date, **line_filters}
+
+trains_per_hour_path, trains_per_hour_version = mirror_s3_parquet(
+    f"{schedule_metrics_path}/trains_per_hour/*.parquet"
+)
+trains_per_hour_data, trains_per_hour_params = build_parquet_query(
+    path=trains_per_hour_path,
+    columns=["hour", "new_trips_started"],
+    filters=current_schedule_filters,
+)
+trains_per_hour = f"""
     SELECT
-        split_part(first_arrival, ':', 1)::INTEGER AS hour,
-        COUNT(trip_id) AS new_trips_started
-    FROM trip_starts
-    GROUP BY 1
-    ORDER BY 1;
+        hour,
+        new_trips_started
+    FROM ({trains_per_hour_data})
+    ORDER BY hour;
     """
-df_trains_per_hour = duckdb.query(query=trains_per_hour).df()
-
-average_headway = """
-    WITH split_data AS (
-        SELECT
-            stop_id,
-            (split_part(arrival_time, ':', 1)::INTEGER * 3600 +
-            split_part(arrival_time, ':', 2)::INTEGER * 60 +
-            split_part(arrival_time, ':', 3)::INTEGER) AS arrival_seconds
-        FROM filtered_schedules
-    ),
-    lagged_data AS (
-        SELECT
-            stop_id,
-            arrival_seconds,
-            LAG(arrival_seconds) OVER (
-                PARTITION BY stop_id 
-                ORDER BY arrival_seconds
-            ) AS prev_seconds
-        FROM split_data
-    ),
-    headway_calc AS (
-        SELECT
-            floor((arrival_seconds / 3600) % 24) AS hour,
-            (arrival_seconds - prev_seconds) / 60.0 AS headway_minutes
-        FROM lagged_data
-        WHERE prev_seconds IS NOT NULL
-    )
+df_trains_per_hour = run_query(
+    query=trains_per_hour,
+    params=trains_per_hour_params,
+    data_version=trains_per_hour_version,
+)
+
+average_headway_path, average_headway_version = mirror_s3_parquet(
+    f"{schedule_metrics_path}/headway/*.parquet"
+)
+average_headway_data, average_headway_params = build_parquet_query(
+    path=average_headway_path,
+    columns=["hour", "avg_headway", "avg_headway_mmss"],
+    filters=current_schedule_filters,
+)
+average_headway = f"""
     SELECT
         hour,
-        AVG(headway_minutes) AS avg_headway,
-        format('{:02d}:{:02d}', 
-            (round(AVG(headway_minutes) * 60) / 60)::INTEGER, 
-            (round(AVG(headway_minutes) * 60) % 60)::INTEGER
-        ) AS avg_headway_mmss
-    FROM headway_calc
-    GROUP BY hour
+        avg_headway,
+        avg_headway_mmss
+    FROM ({average_headway_data})
     ORDER BY hour;
     """
-df_average_headway = duckdb.query(query=average_headway).df()
+df_average_headway = run_query(
+    query=average_headway,
+    params=average_headway_params,
+    data_version=average_headway_version,
+)
 
-total_trains = """
+scheduled_runs_local_path, scheduled_runs_version = mirror_s3_parquet(
+    scheduled_runs_path
+)
+scheduled_runs_data, scheduled_runs_params = build_parquet_query(
+    path=scheduled_runs_local_path,
+    columns=[
+        "effective_date",
+        "route_long_name",
+        "route_color",
+        "start_date",
+        "scheduled_runs",
+    ],
+    filters=line_filters,
+)
+# Schedule versions can share a start date, so each start date is counted from the
+# latest version only
+total_trains = f"""
     SELECT
         ROUTE_LONG_NAME AS LINE,
         strptime(CAST(START_DATE AS VARCHAR), '%Y%m%d') AS EFFECTIVE_DATE,
         CONCAT('#', ROUTE_COLOR) AS HEX_CODE,
-        CAST(COUNT(DISTINCT TRIP_ID) AS INTEGER) AS SCHEDULED_RUNS
-    FROM filtered_schedules
+        CAST(arg_max(SCHEDULED_RUNS, EFFECTIVE_DATE) AS INTEGER) AS SCHEDULED_RUNS
+    FROM ({scheduled_runs_data})
     GROUP BY
         ROUTE_LONG_NAME,
         START_DATE,
@@ -235,7 +257,13 @@ total_trains = """
     ORDER BY SCHEDULED_RUNS DESC
     """
 
-df_aggregate_scheduled_trains = duckdb.query(query=total_trains).df()
+df_aggregate_scheduled_trains = run_query(
+    query=total_trains,
+    params=scheduled_runs_params,
+    data_version=scheduled_runs_version,
+)
+
+chart_color = df_aggregate_scheduled_trains["HEX_CODE"].max()
 
 # Individual charts
 hourly_scheduled_runs_chart = create_scheduled_trains_histogram(
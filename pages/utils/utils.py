@@ -2,36 +2,384 @@
 Module containing utility functions used by Streamlit app.
 """
 
+import fnmatch
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+
+import boto3
+import botocore.exceptions
 import duckdb
 import pandas as pd
 import streamlit as st
 
+logger = logging.getLogger(__name__)
+
+# Errors from S3 after which the mirrored files are served instead
+S3_UNAVAILABLE_ERRORS = (
+    botocore.exceptions.BotoCoreError,
+    botocore.exceptions.ClientError,
+)
+
+# Upper bound on the memory held by cached query results, shared across sessions
+MAX_RESULT_CACHE_BYTES = 256 * 1024 * 1024
+
+# Local directory mirroring the S3 objects read by the app, one subdirectory per bucket
+LOCAL_MIRROR_DIRECTORY = os.path.join(tempfile.gettempdir(), "cta-analytics-mirror")
+
+# File in each bucket's mirror directory recording the ETag of each mirrored object
+LOCAL_MIRROR_MANIFEST = ".etags.json"
+
+# Serializes mirror syncs, as sessions run in separate threads of one process
+_mirror_lock = threading.Lock()
+
+
+class QueryResultCache:
+    """
+    Least recently used cache of query results, bounded by their total memory.
+
+    Results are keyed by query, parameters, and data version, so a new data version
+    misses the cache and the stale results age out. Cached dataframes are shared across
+    sessions and must not be modified by callers.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> pd.DataFrame | None:
+        """
+        Gets a cached result, marking it as the most recently used.
+
+        Args:
+            key: The (query, params, data version) key of the result
+
+        Returns:
+            pd.DataFrame | None: The cached result, or None if it is not cached
+        """
+        with self._lock:
+            if key not in self._results:
+                return None
+            self._results.move_to_end(key)
+            return self._results[key][0]
+
+    def put(self, key: tuple, df: pd.DataFrame):
+        """
+        Caches a result, evicting the least recently used results to stay within the
+        memory bound. Results larger than the bound are not cached.
+
+        Args:
+            key: The (query, params, data version) key of the result
+            df: The result to cache
+        """
+        size = int(df.memory_usage(index=True, deep=True).sum())
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._results:
+                self.total_bytes -= self._results.pop(key)[1]
+            self._results[key] = (df, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._results.popitem(last=False)
+                self.total_bytes -= evicted_size
+
+
+@st.cache_resource
+def get_duckdb_connection() -> duckdb.DuckDBPyConnection:
+    """
+    Opens the in-memory DuckDB connection shared by all sessions. Queries should run on
+    a cursor of this connection, as a connection must not be used by several threads at
+    once.
+
+    Returns:
+        duckdb.DuckDBPyConnection: The DuckDB connection
+    """
+    con = duckdb.connect(database=":memory:")
+
+    # Keep the footers of the mirrored Parquet files in memory between queries
+    con.execute("SET parquet_metadata_cache = true;")
+    return con
+
+
+@st.cache_resource
+def get_s3_client():
+    """
+    Creates the S3 client shared by all sessions, configured with the app's credentials.
+
+    Returns:
+        The boto3 S3 client
+    """
+    return boto3.client(
+        "s3",
+        aws_access_key_id=st.secrets["aws"]["aws_access_key_id"],
+        aws_secret_access_key=st.secrets["aws"]["aws_secret_access_key"],
+        region_name=st.secrets["aws"]["aws_region"],
+    )
+
+
+@st.cache_resource
+def get_query_result_cache() -> QueryResultCache:
+    """
+    Gets the query result cache shared by all sessions.
+
+    Returns:
+        QueryResultCache: The query result cache
+    """
+    return QueryResultCache(max_bytes=MAX_RESULT_CACHE_BYTES)
+
+
+def sync_s3_objects(bucket: str, key_pattern: str) -> tuple[tuple[str, str], ...]:
+    """
+    Syncs the S3 objects matching a key pattern to the local mirror directory.
+
+    Only objects whose ETag changed since the last sync are downloaded, and mirrored
+    files of objects no longer in S3 are removed. Files are replaced atomically, so
+    queries running during a sync read either the old or the new file.
+
+    If S3 cannot be listed, or an object cannot be downloaded, the files already
+    mirrored are served instead, so the app keeps working while S3 is unreachable.
+
+    Args:
+        bucket: The S3 bucket name
+        key_pattern: The object key or glob pattern, e.g., 'data/*.parquet'
+
+    Returns:
+        tuple[tuple[str, str], ...]: The sorted (key, ETag) pairs of the mirrored
+            objects matching the pattern
+
+    Raises:
+        botocore.exceptions.BotoCoreError: If S3 is unreachable and a matching object
+            has not been mirrored yet
+        botocore.exceptions.ClientError: If S3 returns an error and a matching object
+            has not been mirrored yet
+    """
+    bucket_directory = os.path.join(LOCAL_MIRROR_DIRECTORY, bucket)
+    manifest_path = os.path.join(bucket_directory, LOCAL_MIRROR_MANIFEST)
+    # List from the longest prefix of the pattern without glob characters
+    prefix = re.split(r"[*?\[]", key_pattern, maxsplit=1)[0]
+
+    with _mirror_lock:
+        os.makedirs(bucket_directory, exist_ok=True)
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            manifest = {}
+
+        mirrored_keys = [
+            key
+            for key in manifest
+            if fnmatch.fnmatchcase(key, key_pattern)
+            and os.path.exists(os.path.join(bucket_directory, key))
+        ]
+
+        s3_client = get_s3_client()
+        objects = {}
+        try:
+            paginator = s3_client.get_paginator("list_objects_v2")
+            for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+                for obj in page.get("Contents", []):
+                    if fnmatch.fnmatchcase(obj["Key"], key_pattern):
+                        objects[obj["Key"]] = obj["ETag"]
+        except S3_UNAVAILABLE_ERRORS:
+            if not mirrored_keys:
+                raise
+            logger.warning(
+                "Failed to list s3://%s/%s. Serving %d mirrored files instead.",
+                bucket,
+                key_pattern,
+                len(mirrored_keys),
+                exc_info=True,
+            )
+            return tuple(sorted((key, manifest[key]) for key in mirrored_keys))
+
+        try:
+            for key, etag in objects.items():
+                local_path = os.path.join(bucket_directory, key)
+                if manifest.get(key) == etag and os.path.exists(local_path):
+                    continue
+                os.makedirs(os.path.dirname(local_path), exist_ok=True)
+                download_path = f"{local_path}.download"
+                try:
+                    s3_client.download_file(
+                        Bucket=bucket, Key=key, Filename=download_path
+                    )
+                except S3_UNAVAILABLE_ERRORS:
+                    if key not in mirrored_keys:
+                        raise
+                    logger.warning(
+                        "Failed to download s3://%s/%s. Serving the mirrored file "
+                        "instead.",
+                        bucket,
+                        key,
+                        exc_info=True,
+                    )
+                    continue
+                os.replace(download_path, local_path)
+                manifest[key] = etag
+
+            for key in list(manifest):
+                if fnmatch.fnmatchcase(key, key_pattern) and key not in objects:
+                    local_path = os.path.join(bucket_directory, key)
+                    if os.path.exists(local_path):
+                        os.remove(local_path)
+                    del manifest[key]
+        finally:
+            # Record the files replaced so far, even if a download failed
+            with open(f"{manifest_path}.tmp", "w") as f:
+                json.dump(manifest, f)
+            os.replace(f"{manifest_path}.tmp", manifest_path)
 
-@st.cache_data(ttl="1h")
-def load_s3_parquet_data(s3_path: str) -> pd.DataFrame:
+        # Objects that failed to download keep the ETag of their mirrored file
+        return tuple(
+            sorted(
+                (key, etag)
+                for key, etag in manifest.items()
+                if fnmatch.fnmatchcase(key, key_pattern)
+            )
+        )
+
+
+@st.cache_data(ttl="5m")
+def mirror_s3_parquet(s3_path: str) -> tuple[str, tuple[tuple[str, str], ...]]:
     """
-    Queries an S3 location using DuckDB and caches the result for 1 hour.
+    Mirrors the Parquet files at an S3 location to local disk, syncing at most every 5
+    minutes, so queries read local files and a refresh downloads only changed files.
+
+    Args:
+        s3_path: The S3 path. Can either be a glob pattern, e.g., 's3://my-bucket/data/*.parquet'
+            to mirror a folder, or a file path, e.g., 's3://my-bucket/data/test.parquet'
+
+    Returns:
+        tuple[str, tuple[tuple[str, str], ...]]: The local path or glob pattern of the
+            mirrored files, and their data version as the (key, ETag) pairs of the
+            objects
+    """
+    bucket, key_pattern = s3_path.removeprefix("s3://").split("/", 1)
+    data_version = sync_s3_objects(bucket=bucket, key_pattern=key_pattern)
+    local_path = os.path.join(LOCAL_MIRROR_DIRECTORY, bucket, key_pattern)
+    return local_path, data_version
+
+
+def run_query(
+    query: str, params: list | None = None, data_version: tuple | None = None
+) -> pd.DataFrame:
+    """
+    Runs a query on the shared DuckDB connection, returning the cached result if the
+    same query has already run with the same parameters over the same data version.
+
+    Args:
+        query: The SQL query
+        params: The query parameters
+        data_version: The version of the data read by the query, e.g., from
+            mirror_s3_parquet
+
+    Returns:
+        pd.DataFrame: A pandas dataframe with the query result, which must not be
+            modified as it is shared with other sessions
+    """
+    params = params or []
+    key = (query, tuple(params), data_version)
+    result_cache = get_query_result_cache()
+    df = result_cache.get(key)
+    if df is None:
+        cursor = get_duckdb_connection().cursor()
+        df = cursor.execute(query, params).df()
+        result_cache.put(key, df)
+    return df
+
+
+def build_parquet_query(
+    path: str, columns: list[str] | None = None, filters: dict | None = None
+) -> tuple[str, list]:
+    """
+    Builds a query reading Parquet files with a column projection and equality filters.
+
+    Args:
+        path: The path or glob pattern of the Parquet files
+        columns: The columns to select, or None to select all columns
+        filters: Mapping of column name to the value it must equal, or to a list or
+            tuple of values it must be one of
+
+    Returns:
+        tuple[str, list]: The query and its parameters
+    """
+    select_list = ", ".join(f'"{column}"' for column in columns) if columns else "*"
+
+    # Files written before a column was added are read with it as NULL
+    query = f"SELECT {select_list} FROM read_parquet('{path}', union_by_name = true)"
+
+    conditions = []
+    params = []
+    for column, value in (filters or {}).items():
+        if isinstance(value, (list, tuple)):
+            conditions.append(f'"{column}" IN ({", ".join("?" for _ in value)})')
+            params.extend(value)
+        else:
+            conditions.append(f'"{column}" = ?')
+            params.append(value)
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+
+    return query, params
+
+
+def load_s3_parquet_data(
+    s3_path: str, columns: list[str] | None = None, filters: dict | None = None
+) -> pd.DataFrame:
+    """
+    Queries an S3 location using DuckDB over its local mirror, caching the result until
+    the data changes.
+
+    The column projection and filters are pushed down to the Parquet reader, so only
+    the selected columns of matching row groups are read and materialized.
 
     Args:
         s3_path: The S3 path. Can either be a glob pattern, e.g., 's3://my-bucket/data/*.parquet'
             to read a folder, or a file path, e.g., 's3://my-bucket/data/test.parquet'
+        columns: The columns to load, or None to load all columns
+        filters: Mapping of column name to the value it must equal, or to a list or
+            tuple of values it must be one of, e.g., {'route_long_name': 'Red Line'}
 
     Returns:
         pd.DataFrame: A pandas dataframe with the loaded data
     """
-    con = duckdb.connect(database=":memory:")
+    local_path, data_version = mirror_s3_parquet(s3_path)
+    query, params = build_parquet_query(
+        path=local_path, columns=columns, filters=filters
+    )
+    return run_query(query=query, params=params, data_version=data_version)
 
-    # Configure S3 credentials (or use PROVIDER CREDENTIAL_CHAIN for auto-auth)
-    con.execute(f"""
-        CREATE OR REPLACE SECRET s3_creds (
-            TYPE S3,
-            KEY_ID '{st.secrets["aws"]["aws_access_key_id"]}',
-            SECRET '{st.secrets["aws"]["aws_secret_access_key"]}',
-            REGION '{st.secrets["aws"]["aws_region"]}'
-        );
-    """)
 
-    query = f"SELECT * FROM read_parquet('{s3_path}')"
-    df = con.execute(query).df()
+def load_s3_parquet_max(s3_path: str, column: str) -> int | float | str | None:
+    """
+    Queries the maximum value of a column at an S3 location over its local mirror,
+    caching it until the data changes.
 
-    return df
+    Only the column's Parquet statistics and values are read, e.g., to find the current
+    effective date before loading data filtered to it.
+
+    Args:
+        s3_path: The S3 path or glob pattern of the Parquet files
+        column: The column to take the maximum of
+
+    Returns:
+        The maximum value of the column, or None if there are no files or rows
+    """
+    local_path, data_version = mirror_s3_parquet(s3_path)
+    if not data_version:
+        return None
+    query = f"""
+        SELECT MAX("{column}") AS max_value
+        FROM read_parquet('{local_path}', union_by_name = true)
+    """
+    df = run_query(query=query, data_version=data_version)
+    max_value = df["max_value"].tolist()[0]
+    return None if pd.isna(max_value) else max_value
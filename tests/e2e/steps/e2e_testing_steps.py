@@ -12,7 +12,7 @@ from behave import given, then, when, use_step_matcher
 from behave.runner import Context
 from dotenv import load_dotenv
 
-from lambdas.gtfs_data_fetch.main import update_last_modified_time
+from lambdas.gtfs_data_fetch.main import GTFS_MANIFEST_KEY, update_last_modified_time
 
 load_dotenv()
 
@@ -52,8 +52,9 @@ def get_object_versions_under_s3_prefix(bucket: str, prefix: str) -> dict[str, s
 def set_last_gtfs_fetch_parameter(context: Context, availability: str):
     """
     Set the value of gtfs_last_modified_time parameter in SSM Parameter Store
-    to a past date if availability = "is", else if availability = "is not" then
-    we do nothing.
+    to a past date and delete the GTFS manifest if availability = "is", else if
+    availability = "is not" then we do nothing. Without deleting the manifest, the
+    refetched files would match it and none of them would be uploaded again.
 
     Args:
         context: The Behave context object.
@@ -64,6 +65,8 @@ def set_last_gtfs_fetch_parameter(context: Context, availability: str):
         print(f"Updating gtfs_last_modified_time to {new_last_modified_time}")
         update_last_modified_time(last_modified_time=new_last_modified_time)
         print(f"Updated gtfs_last_modified_time to {new_last_modified_time}")
+        boto3.client("s3").delete_object(Bucket=BUCKET_NAME, Key=GTFS_MANIFEST_KEY)
+        print(f"Deleted GTFS manifest {GTFS_MANIFEST_KEY}")
     else:
         print(
             "No update made to gtfs_last_modified_time to simulate no new available data."
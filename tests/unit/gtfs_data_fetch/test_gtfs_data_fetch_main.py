@@ -1,17 +1,37 @@
 """Module for testing main.py in gtfs_data_fetch lambda."""
 
+import datetime
+import io
+import os
+import tempfile
 import unittest
+import zipfile
+import zlib
 from unittest.mock import MagicMock, patch
 
 import botocore.exceptions
+import duckdb
 import pytest
 import requests
 
 from lambdas.gtfs_data_fetch.main import (
+    GTFS_MANIFEST_KEY,
+    GTFS_ZIP_PATH,
+    GTFS_ZIP_URL,
+    MAX_BYTES_IN_FLIGHT,
+    REQUEST_TIMEOUT_SECONDS,
+    TRANSFER_CONFIG,
+    MemberSizeSubscriber,
+    convert_gtfs_zip_to_parquet,
+    build_gtfs_manifest,
+    download_gtfs_zip,
+    format_http_date,
     get_last_modified_time,
     update_last_modified_time,
     upload_gtfs_zip_to_s3,
+    write_gtfs_table_to_parquet,
     handler,
+    load_gtfs_manifest,
 )
 
 
@@ -128,147 +148,339 @@ class TestUpdateLastModifiedTime(unittest.TestCase):
 class TestUploadGtfsZipToS3(unittest.TestCase):
     """Class for testing upload_gtfs_zip_to_s3 function."""
 
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.zip_path = os.path.join(self.temp_dir.name, "google_transit.zip")
+        self.mock_bucket = "123456789-cta-analytics-project"
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write_zip(self, members: dict[str, bytes]):
+        """Writes a zip file with the given members to the zip path."""
+        with zipfile.ZipFile(self.zip_path, "w", zipfile.ZIP_DEFLATED) as zip_ref:
+            for filename, content in members.items():
+                zip_ref.writestr(filename, content)
+
+    @patch("lambdas.gtfs_data_fetch.main.TransferManager")
     @patch("lambdas.gtfs_data_fetch.main.boto3.client")
-    @patch("lambdas.gtfs_data_fetch.main.zipfile.ZipFile")
-    def test_upload_zip_success(self, mock_zip_file, mock_client):
+    def test_upload_zip_success(self, mock_client, mock_transfer_manager):
         """Tests successfully uploading GTFS zip to S3."""
         # Arrange
-        mock_response = MagicMock()
-        mock_response.content = b"mock zip content"
+        self.write_zip({"test_file.txt": b"file content"})
+        mock_manager = mock_transfer_manager.return_value.__enter__.return_value
 
-        mock_s3_client = MagicMock()
-        mock_client.return_value = mock_s3_client
-
-        mock_file_info = MagicMock()
-        mock_file_info.filename = "test_file.txt"
-        mock_file_info.is_dir.return_value = False
+        # Act
+        upload_gtfs_zip_to_s3(bucket_name=self.mock_bucket, zip_path=self.zip_path)
 
-        mock_zip_ref = MagicMock()
-        mock_zip_ref.infolist.return_value = [mock_file_info]
-        mock_zip_ref.__enter__.return_value = mock_zip_ref
-        mock_zip_ref.open.return_value.__enter__.return_value = b"file content"
-        mock_zip_file.return_value = mock_zip_ref
+        # Assert
+        mock_transfer_manager.assert_called_once_with(
+            mock_client.return_value, config=TRANSFER_CONFIG
+        )
+        mock_manager.upload.assert_called_once()
+        upload_kwargs = mock_manager.upload.call_args.kwargs
+        self.assertEqual(upload_kwargs["bucket"], self.mock_bucket)
+        self.assertEqual(upload_kwargs["key"], "gtfs_data/test_file.txt")
+        self.assertEqual(upload_kwargs["subscribers"][0].size, 12)
+        mock_manager.upload.return_value.result.assert_called_once()
+        self.assertTrue(upload_kwargs["fileobj"].closed)
+
+    @patch("lambdas.gtfs_data_fetch.main.TransferManager")
+    @patch("lambdas.gtfs_data_fetch.main.boto3.client")
+    def test_upload_zip_partial_success(self, mock_client, mock_transfer_manager):
+        """Tests partial success uploading GTFS zip to S3."""
+        # Arrange
+        self.write_zip({"file1.txt": b"file content", "file2.txt": b"file content"})
+        mock_manager = mock_transfer_manager.return_value.__enter__.return_value
 
-        mock_bucket = "123456789-cta-analytics-project"
+        # First file succeeds, second file fails
+        mock_failed_future = MagicMock()
+        mock_failed_future.result.side_effect = botocore.exceptions.ClientError(
+            error_response={
+                "Error": {"Code": "AccessDenied", "Message": "Access Denied"}
+            },
+            operation_name="PutObject",
+        )
+        mock_manager.upload.side_effect = [MagicMock(), mock_failed_future]
 
         # Act
-        upload_gtfs_zip_to_s3(bucket_name=mock_bucket, response=mock_response)
+        upload_gtfs_zip_to_s3(bucket_name=self.mock_bucket, zip_path=self.zip_path)
 
         # Assert
-        mock_s3_client.upload_fileobj.assert_called_once_with(
-            Fileobj=mock_zip_ref.open.return_value.__enter__.return_value,
-            Bucket=mock_bucket,
-            Key="gtfs_data/test_file.txt",
+        self.assertEqual(mock_manager.upload.call_count, 2)
+        self.assertEqual(
+            [call.kwargs["key"] for call in mock_manager.upload.call_args_list],
+            ["gtfs_data/file1.txt", "gtfs_data/file2.txt"],
         )
+        mock_failed_future.result.assert_called_once()
 
+    @patch("lambdas.gtfs_data_fetch.main.TransferManager")
     @patch("lambdas.gtfs_data_fetch.main.boto3.client")
-    @patch("lambdas.gtfs_data_fetch.main.zipfile.ZipFile")
-    def test_upload_zip_partial_success(self, mock_zip_file, mock_client):
-        """Tests partial success uploading GTFS zip to S3."""
+    def test_upload_zip_skips_directories(self, mock_client, mock_transfer_manager):
+        """Tests that directories within the zip are skipped."""
         # Arrange
-        mock_response = MagicMock()
-        mock_response.content = b"mock zip content"
+        self.write_zip({"test_directory/": b""})
+        mock_manager = mock_transfer_manager.return_value.__enter__.return_value
 
-        mock_s3_client = MagicMock()
-        mock_client.return_value = mock_s3_client
+        # Act
+        upload_gtfs_zip_to_s3(bucket_name=self.mock_bucket, zip_path=self.zip_path)
 
-        # First file succeeds, second file fails
-        mock_s3_client.upload_fileobj.side_effect = [
-            None,
-            botocore.exceptions.ClientError(
-                error_response={
-                    "Error": {"Code": "AccessDenied", "Message": "Access Denied"}
-                },
-                operation_name="PutFileObject",
-            ),
-        ]
+        # Assert
+        mock_manager.upload.assert_not_called()
 
-        mock_file_info1 = MagicMock()
-        mock_file_info1.filename = "file1.txt"
-        mock_file_info1.is_dir.return_value = False
+    @patch("lambdas.gtfs_data_fetch.main.TransferManager")
+    @patch("lambdas.gtfs_data_fetch.main.boto3.client")
+    def test_upload_zip_no_files_present(self, mock_client, mock_transfer_manager):
+        """Tests no files are uploaded to S3 when the zip is empty."""
+        # Arrange
+        self.write_zip({})
+        mock_manager = mock_transfer_manager.return_value.__enter__.return_value
 
-        mock_file_info2 = MagicMock()
-        mock_file_info2.filename = "file2.txt"
-        mock_file_info2.is_dir.return_value = False
+        # Act
+        upload_gtfs_zip_to_s3(bucket_name=self.mock_bucket, zip_path=self.zip_path)
 
-        mock_zip_ref = MagicMock()
-        mock_zip_ref.infolist.return_value = [mock_file_info1, mock_file_info2]
-        mock_zip_ref.__enter__.return_value = mock_zip_ref
-        mock_zip_ref.open.return_value.__enter__.return_value = b"file content"
-        mock_zip_file.return_value = mock_zip_ref
+        # Assert
+        mock_manager.upload.assert_not_called()
 
-        mock_bucket = "123456789-cta-analytics-project"
+    @patch("lambdas.gtfs_data_fetch.main.TransferManager")
+    @patch("lambdas.gtfs_data_fetch.main.boto3.client")
+    def test_upload_zip_only_given_files(self, mock_client, mock_transfer_manager):
+        """Tests only the given members are uploaded and reported as uploaded."""
+        # Arrange
+        self.write_zip({"stops.txt": b"stop_id", "shapes.txt": b"shape_id"})
+        mock_manager = mock_transfer_manager.return_value.__enter__.return_value
 
         # Act
-        upload_gtfs_zip_to_s3(bucket_name=mock_bucket, response=mock_response)
+        uploaded_filenames = upload_gtfs_zip_to_s3(
+            bucket_name=self.mock_bucket,
+            zip_path=self.zip_path,
+            filenames={"stops.txt"},
+        )
 
         # Assert
-        self.assertEqual(mock_s3_client.upload_fileobj.call_count, 2)
-        mock_s3_client.upload_fileobj.assert_any_call(
-            Fileobj=mock_zip_ref.open.return_value.__enter__.return_value,
-            Bucket=mock_bucket,
-            Key="gtfs_data/file1.txt",
-        )
-        mock_s3_client.upload_fileobj.assert_any_call(
-            Fileobj=mock_zip_ref.open.return_value.__enter__.return_value,
-            Bucket=mock_bucket,
-            Key="gtfs_data/file2.txt",
+        mock_manager.upload.assert_called_once()
+        self.assertEqual(
+            mock_manager.upload.call_args.kwargs["key"], "gtfs_data/stops.txt"
         )
+        self.assertEqual(uploaded_filenames, ["stops.txt"])
 
-    @patch("lambdas.gtfs_data_fetch.main.boto3.client")
-    @patch("lambdas.gtfs_data_fetch.main.zipfile.ZipFile")
-    def test_upload_zip_skips_directories(self, mock_zip_file, mock_client):
-        """Tests that directories within the zip are skipped."""
+    def test_member_size_subscriber_provides_size(self):
+        """Tests the member size is provided so the upload never seeks the member."""
         # Arrange
-        mock_response = MagicMock()
-        mock_response.content = b"mock zip content"
+        mock_future = MagicMock()
+
+        # Act
+        MemberSizeSubscriber(size=1024).on_queued(mock_future)
 
-        mock_s3_client = MagicMock()
-        mock_client.return_value = mock_s3_client
+        # Assert
+        mock_future.meta.provide_transfer_size.assert_called_once_with(1024)
 
-        mock_file_info = MagicMock()
-        mock_file_info.filename = "test_directory/"
-        mock_file_info.is_dir.return_value = True
+    def test_transfer_config_bounds_memory(self):
+        """Tests the in-memory parts of all uploads fit the bytes in flight budget."""
+        # Assert
+        self.assertLessEqual(
+            TRANSFER_CONFIG.max_in_memory_upload_chunks
+            * TRANSFER_CONFIG.multipart_chunksize,
+            MAX_BYTES_IN_FLIGHT,
+        )
 
-        mock_zip_ref = MagicMock()
-        mock_zip_ref.infolist.return_value = [mock_file_info]
-        mock_zip_ref.__enter__.return_value = mock_zip_ref
-        mock_zip_file.return_value = mock_zip_ref
 
-        mock_bucket = "123456789-cta-analytics-project"
+class TestGtfsManifest(unittest.TestCase):
+    """Class for testing the GTFS manifest functions."""
+
+    def test_build_gtfs_manifest(self):
+        """Tests the manifest holds the CRC-32 and size of each file in the zip."""
+        # Arrange
+        with tempfile.TemporaryDirectory() as temp_dir:
+            zip_path = os.path.join(temp_dir, "google_transit.zip")
+            with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zip_ref:
+                zip_ref.writestr("stops.txt", b"stop_id\n30001\n")
+                zip_ref.writestr("directory/", b"")
+
+            # Act
+            manifest = build_gtfs_manifest(zip_path=zip_path)
+
+        # Assert
+        self.assertEqual(
+            manifest,
+            {"stops.txt": {"crc": zlib.crc32(b"stop_id\n30001\n"), "size": 14}},
+        )
+
+    @patch("lambdas.gtfs_data_fetch.main.boto3.client")
+    def test_load_gtfs_manifest_success(self, mock_client):
+        """Tests loading the saved manifest."""
+        # Arrange
+        mock_client.return_value.get_object.return_value = {
+            "Body": io.BytesIO(b'{"stops.txt": {"crc": 1, "size": 14}}')
+        }
 
         # Act
-        upload_gtfs_zip_to_s3(bucket_name=mock_bucket, response=mock_response)
+        manifest = load_gtfs_manifest(bucket_name="bucket")
 
         # Assert
-        mock_s3_client.upload_fileobj.assert_not_called()
-        mock_file_info.is_dir.assert_called_once()
+        self.assertEqual(manifest, {"stops.txt": {"crc": 1, "size": 14}})
+        mock_client.return_value.get_object.assert_called_once_with(
+            Bucket="bucket", Key=GTFS_MANIFEST_KEY
+        )
 
     @patch("lambdas.gtfs_data_fetch.main.boto3.client")
-    @patch("lambdas.gtfs_data_fetch.main.zipfile.ZipFile")
-    def test_upload_zip_no_files_present(self, mock_zip_file, mock_client):
-        """Tests no files are uploaded to S3 when the zip is empty."""
+    def test_load_gtfs_manifest_missing(self, mock_client):
+        """Tests a missing manifest is treated as every file having changed."""
+        # Arrange
+        mock_client.return_value.get_object.side_effect = (
+            botocore.exceptions.ClientError(
+                error_response={"Error": {"Code": "NoSuchKey", "Message": "Not Found"}},
+                operation_name="GetObject",
+            )
+        )
+
+        # Act
+        manifest = load_gtfs_manifest(bucket_name="bucket")
+
+        # Assert
+        self.assertEqual(manifest, {})
+
+
+class TestDownloadGtfsZip(unittest.TestCase):
+    """Class for testing download_gtfs_zip and format_http_date functions."""
+
+    def test_download_gtfs_zip_writes_chunks(self):
+        """Tests the streamed response body is written to the zip path."""
         # Arrange
         mock_response = MagicMock()
-        mock_response.content = b"mock zip content"
+        mock_response.iter_content.return_value = [b"first chunk", b"second chunk"]
 
-        mock_s3_client = MagicMock()
-        mock_client.return_value = mock_s3_client
+        with tempfile.TemporaryDirectory() as temp_dir:
+            zip_path = os.path.join(temp_dir, "google_transit.zip")
 
-        mock_zip_ref = MagicMock()
-        mock_zip_ref.infolist.return_value = []  # Empty zip
-        mock_zip_ref.__enter__.return_value = mock_zip_ref
-        mock_zip_file.return_value = mock_zip_ref
+            # Act
+            bytes_written = download_gtfs_zip(response=mock_response, zip_path=zip_path)
 
-        mock_bucket = "123456789-cta-analytics-project"
+            # Assert
+            with open(zip_path, "rb") as zip_file:
+                self.assertEqual(zip_file.read(), b"first chunksecond chunk")
+        self.assertEqual(bytes_written, 23)
+        mock_response.iter_content.assert_called_once()
 
+    def test_format_http_date(self):
+        """Tests formatting a timestamp for the If-Modified-Since header."""
         # Act
-        upload_gtfs_zip_to_s3(bucket_name=mock_bucket, response=mock_response)
+        http_date = format_http_date(datetime.datetime(2026, 2, 23, 15, 0, 0))
 
         # Assert
-        mock_s3_client.upload_fileobj.assert_not_called()
+        self.assertEqual(http_date, "Mon, 23 Feb 2026 15:00:00 GMT")
+
+
+class TestConvertGtfsZipToParquet(unittest.TestCase):
+    """Class for testing GTFS text to Parquet conversion."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.con = duckdb.connect()
 
+    def tearDown(self):
+        self.con.close()
+        self.temp_dir.cleanup()
+
+    def test_write_gtfs_table_to_parquet(self):
+        """Tests a GTFS text file is written as Parquet with its declared types."""
+        # Arrange
+        csv_path = os.path.join(self.temp_dir.name, "stop_times.txt")
+        with open(csv_path, "w") as csv_file:
+            csv_file.write(
+                "trip_id,arrival_time,departure_time,stop_id,stop_sequence,"
+                "stop_headsign,pickup_type,shape_dist_traveled\n"
+                "0001,04:30:00,04:30:30,30001,1,Howard,0,0\n"
+                "0001,24:05:00,24:05:00,30002,2,,0,1520\n"
+            )
+        output_path = os.path.join(self.temp_dir.name, "stop_times.parquet")
 
+        # Act
+        write_gtfs_table_to_parquet(
+            con=self.con,
+            table="stop_times",
+            csv_path=csv_path,
+            output_path=output_path,
+        )
+
+        # Assert
+        relation = self.con.sql(f"SELECT * FROM read_parquet('{output_path}')")
+        types = dict(zip(relation.columns, (str(t) for t in relation.types)))
+        self.assertEqual(types["trip_id"], "VARCHAR")
+        self.assertEqual(types["stop_id"], "INTEGER")
+        self.assertEqual(types["arrival_time"], "INTEGER")
+        self.assertEqual(
+            relation.project("trip_id, arrival_time, stop_id").fetchall(),
+            [("0001", 16200, 30001), ("0001", 86700, 30002)],
+        )
+        compression = self.con.execute(
+            f"SELECT DISTINCT compression FROM parquet_metadata('{output_path}')"
+        ).fetchall()
+        self.assertEqual(compression, [("ZSTD",)])
+
+    @patch("lambdas.gtfs_data_fetch.main.write_gtfs_table_to_parquet")
+    @patch("lambdas.gtfs_data_fetch.main.get_db_connection")
+    def test_convert_gtfs_zip_to_parquet(self, mock_get_conn, mock_write):
+        """Tests only GTFS tables with a declared schema are converted."""
+        # Arrange
+        zip_path = os.path.join(self.temp_dir.name, "google_transit.zip")
+        with zipfile.ZipFile(zip_path, "w") as zip_ref:
+            zip_ref.writestr("stops.txt", "stop_id\n30001\n")
+            zip_ref.writestr("shapes.txt", "shape_id\n1\n")
+        extract_directory = os.path.join(self.temp_dir.name, "gtfs")
+
+        # Act
+        with patch(
+            "lambdas.gtfs_data_fetch.main.GTFS_EXTRACT_DIRECTORY", extract_directory
+        ):
+            converted_tables = convert_gtfs_zip_to_parquet(
+                bucket_name="bucket", zip_path=zip_path
+            )
+
+        # Assert
+        self.assertEqual(converted_tables, ["stops"])
+        mock_write.assert_called_once_with(
+            con=mock_get_conn.return_value,
+            table="stops",
+            csv_path=os.path.join(extract_directory, "stops.txt"),
+            output_path="s3://bucket/gtfs_parquet/stops.parquet",
+        )
+        self.assertEqual(os.listdir(extract_directory), [])
+
+    @patch("lambdas.gtfs_data_fetch.main.write_gtfs_table_to_parquet")
+    @patch("lambdas.gtfs_data_fetch.main.get_db_connection")
+    def test_convert_gtfs_zip_to_parquet_one_table_on_disk(
+        self, mock_get_conn, mock_write
+    ):
+        """Tests each extracted table is removed before the next one is extracted."""
+        # Arrange
+        zip_path = os.path.join(self.temp_dir.name, "google_transit.zip")
+        with zipfile.ZipFile(zip_path, "w") as zip_ref:
+            zip_ref.writestr("stops.txt", "stop_id\n30001\n")
+            zip_ref.writestr("stop_times.txt", "trip_id\n0001\n")
+        extract_directory = os.path.join(self.temp_dir.name, "gtfs")
+        extracted_files = []
+        mock_write.side_effect = lambda **kwargs: extracted_files.append(
+            sorted(os.listdir(extract_directory))
+        )
+
+        # Act
+        with patch(
+            "lambdas.gtfs_data_fetch.main.GTFS_EXTRACT_DIRECTORY", extract_directory
+        ):
+            convert_gtfs_zip_to_parquet(bucket_name="bucket", zip_path=zip_path)
+
+        # Assert
+        self.assertEqual(extracted_files, [["stops.txt"], ["stop_times.txt"]])
+        self.assertEqual(os.listdir(extract_directory), [])
+
+
+@patch("lambdas.gtfs_data_fetch.main.save_gtfs_manifest")
+@patch("lambdas.gtfs_data_fetch.main.load_gtfs_manifest")
+@patch("lambdas.gtfs_data_fetch.main.build_gtfs_manifest")
+@patch("lambdas.gtfs_data_fetch.main.convert_gtfs_zip_to_parquet")
+@patch("lambdas.gtfs_data_fetch.main.os.remove")
+@patch("lambdas.gtfs_data_fetch.main.download_gtfs_zip")
 class TestLambdaHandler(unittest.TestCase):
     """Class for testing handler function."""
 
@@ -284,6 +496,12 @@ class TestLambdaHandler(unittest.TestCase):
         mock_get_last_modified,
         mock_upload,
         mock_update,
+        mock_download,
+        mock_remove,
+        mock_convert,
+        mock_build_manifest,
+        mock_load_manifest,
+        mock_save_manifest,
     ):
         """Tests successful handler execution when GTFS files are updated."""
         # Arrange
@@ -291,24 +509,54 @@ class TestLambdaHandler(unittest.TestCase):
         mock_context = MagicMock()
 
         mock_response = MagicMock()
+        mock_response.status_code = 200
         mock_response.headers = {"Last-Modified": "Mon, 23 Feb 2026 15:00:00 GMT"}
         mock_response.raise_for_status.return_value = None
         mock_requests_get.return_value = mock_response
 
         mock_get_last_modified.return_value = "2026-01-01T12:00:00"
 
+        mock_build_manifest.return_value = {
+            "stops.txt": {"crc": 1, "size": 10},
+            "shapes.txt": {"crc": 2, "size": 20},
+            "trips.txt": {"crc": 3, "size": 30},
+        }
+        mock_load_manifest.return_value = {
+            "stops.txt": {"crc": 1, "size": 10},
+            "shapes.txt": {"crc": 9, "size": 20},
+        }
+        mock_upload.return_value = ["shapes.txt", "trips.txt"]
+
         # Act
         result = handler(mock_event, mock_context)
 
         # Assert
         mock_load_dotenv.assert_called_once()
         mock_requests_get.assert_called_once_with(
-            "https://www.transitchicago.com/downloads/sch_data/google_transit.zip"
+            GTFS_ZIP_URL,
+            headers={"If-Modified-Since": "Thu, 01 Jan 2026 12:00:00 GMT"},
+            stream=True,
+            timeout=REQUEST_TIMEOUT_SECONDS,
         )
         mock_get_last_modified.assert_called_once()
+        mock_download.assert_called_once_with(
+            response=mock_response, zip_path=GTFS_ZIP_PATH
+        )
+        mock_response.close.assert_called_once()
         mock_upload.assert_called_once_with(
             bucket_name="123456789012-cta-analytics-project",
-            response=mock_response,
+            zip_path=GTFS_ZIP_PATH,
+            filenames={"shapes.txt", "trips.txt"},
+        )
+        mock_convert.assert_called_once_with(
+            bucket_name="123456789012-cta-analytics-project",
+            zip_path=GTFS_ZIP_PATH,
+            tables={"shapes", "trips"},
+        )
+        mock_remove.assert_called_once_with(GTFS_ZIP_PATH)
+        mock_save_manifest.assert_called_once_with(
+            bucket_name="123456789012-cta-analytics-project",
+            manifest=mock_build_manifest.return_value,
         )
         mock_update.assert_called_once_with("2026-02-23T15:00:00")
         self.assertEqual(
@@ -316,9 +564,57 @@ class TestLambdaHandler(unittest.TestCase):
             {
                 "status": "updated",
                 "message": "GTFS data has been updated and stored in S3.",
+                "changed_tables": ["shapes", "trips"],
             },
         )
 
+    @patch("lambdas.gtfs_data_fetch.main.update_last_modified_time")
+    @patch("lambdas.gtfs_data_fetch.main.upload_gtfs_zip_to_s3")
+    @patch("lambdas.gtfs_data_fetch.main.get_last_modified_time")
+    @patch("lambdas.gtfs_data_fetch.main.requests.get")
+    @patch("lambdas.gtfs_data_fetch.main.dotenv.load_dotenv")
+    def test_handler_success_not_modified(
+        self,
+        mock_load_dotenv,
+        mock_requests_get,
+        mock_get_last_modified,
+        mock_upload,
+        mock_update,
+        mock_download,
+        mock_remove,
+        mock_convert,
+        mock_build_manifest,
+        mock_load_manifest,
+        mock_save_manifest,
+    ):
+        """Tests no data is downloaded when the server responds 304 Not Modified."""
+        # Arrange
+        mock_event = {"test": "event"}
+        mock_context = MagicMock()
+
+        mock_response = MagicMock()
+        mock_response.status_code = 304
+        mock_response.headers = {}
+        mock_requests_get.return_value = mock_response
+
+        mock_get_last_modified.return_value = "2026-02-24T15:00:00"
+
+        # Act
+        result = handler(mock_event, mock_context)
+
+        # Assert
+        mock_requests_get.assert_called_once_with(
+            GTFS_ZIP_URL,
+            headers={"If-Modified-Since": "Tue, 24 Feb 2026 15:00:00 GMT"},
+            stream=True,
+            timeout=REQUEST_TIMEOUT_SECONDS,
+        )
+        mock_response.close.assert_called_once()
+        mock_download.assert_not_called()
+        mock_upload.assert_not_called()
+        mock_update.assert_not_called()
+        self.assertEqual(result["status"], "no_update")
+
     @patch("lambdas.gtfs_data_fetch.main.update_last_modified_time")
     @patch("lambdas.gtfs_data_fetch.main.upload_gtfs_zip_to_s3")
     @patch("lambdas.gtfs_data_fetch.main.get_last_modified_time")
@@ -331,13 +627,20 @@ class TestLambdaHandler(unittest.TestCase):
         mock_get_last_modified,
         mock_upload,
         mock_update,
+        mock_download,
+        mock_remove,
+        mock_convert,
+        mock_build_manifest,
+        mock_load_manifest,
+        mock_save_manifest,
     ):
-        """Tests successful handler execution when no update occurs."""
+        """Tests the body is not read when the server ignores the conditional request."""
         # Arrange
         mock_event = {"test": "event"}
         mock_context = MagicMock()
 
         mock_response = MagicMock()
+        mock_response.status_code = 200
         mock_response.headers = {"Last-Modified": "Mon, 23 Feb 2026 15:00:00 GMT"}
         mock_response.raise_for_status.return_value = None
         mock_requests_get.return_value = mock_response
@@ -349,10 +652,9 @@ class TestLambdaHandler(unittest.TestCase):
 
         # Assert
         mock_load_dotenv.assert_called_once()
-        mock_requests_get.assert_called_once_with(
-            "https://www.transitchicago.com/downloads/sch_data/google_transit.zip"
-        )
         mock_get_last_modified.assert_called_once()
+        mock_response.close.assert_called_once()
+        mock_download.assert_not_called()
         mock_upload.assert_not_called()
         mock_update.assert_not_called()
         self.assertEqual(
@@ -363,19 +665,34 @@ class TestLambdaHandler(unittest.TestCase):
             },
         )
 
+    @patch("lambdas.gtfs_data_fetch.main.get_last_modified_time")
     @patch("lambdas.gtfs_data_fetch.main.requests.get")
     @patch("lambdas.gtfs_data_fetch.main.dotenv.load_dotenv")
-    def test_handler_no_modified_header(self, mock_load_dotenv, mock_requests_get):
+    def test_handler_no_modified_header(
+        self,
+        mock_load_dotenv,
+        mock_requests_get,
+        mock_get_last_modified,
+        mock_download,
+        mock_remove,
+        mock_convert,
+        mock_build_manifest,
+        mock_load_manifest,
+        mock_save_manifest,
+    ):
         """Tests handler fails when no Last-Modified header is present."""
         # Arrange
         mock_event = {"test": "event"}
         mock_context = MagicMock()
 
         mock_response = MagicMock()
+        mock_response.status_code = 200
         mock_response.headers = {}  # No Last-Modified header
         mock_response.raise_for_status.return_value = None
         mock_requests_get.return_value = mock_response
 
+        mock_get_last_modified.return_value = "2026-01-01T12:00:00"
+
         # Act + Assert
         with pytest.raises(
             ValueError, match="Last-Modified header not found in the response"
@@ -383,27 +700,129 @@ class TestLambdaHandler(unittest.TestCase):
             handler(mock_event, mock_context)
 
         mock_load_dotenv.assert_called_once()
-        mock_requests_get.assert_called_once_with(
-            "https://www.transitchicago.com/downloads/sch_data/google_transit.zip"
-        )
+        mock_requests_get.assert_called_once()
+        mock_response.close.assert_called_once()
+        mock_download.assert_not_called()
 
+    @patch("lambdas.gtfs_data_fetch.main.get_last_modified_time")
     @patch("lambdas.gtfs_data_fetch.main.requests.get")
     @patch("lambdas.gtfs_data_fetch.main.dotenv.load_dotenv")
-    def test_handler_request_error(self, mock_load_dotenv, mock_requests_get):
+    def test_handler_request_error(
+        self,
+        mock_load_dotenv,
+        mock_requests_get,
+        mock_get_last_modified,
+        mock_download,
+        mock_remove,
+        mock_convert,
+        mock_build_manifest,
+        mock_load_manifest,
+        mock_save_manifest,
+    ):
         """Tests handler raises error if the GET request fails."""
         # Arrange
         mock_event = {"test": "event"}
         mock_context = MagicMock()
 
+        mock_requests_get.return_value.status_code = 404
         mock_requests_get.return_value.raise_for_status.side_effect = (
             requests.exceptions.HTTPError("404 Not Found")
         )
+        mock_get_last_modified.return_value = "2026-01-01T12:00:00"
 
         # Act + Assert
         with pytest.raises(requests.exceptions.HTTPError, match="404 Not Found"):
             handler(mock_event, mock_context)
 
         mock_load_dotenv.assert_called_once()
-        mock_requests_get.assert_called_once_with(
-            "https://www.transitchicago.com/downloads/sch_data/google_transit.zip"
+        mock_requests_get.assert_called_once()
+        mock_download.assert_not_called()
+
+    @patch("lambdas.gtfs_data_fetch.main.update_last_modified_time")
+    @patch("lambdas.gtfs_data_fetch.main.upload_gtfs_zip_to_s3")
+    @patch("lambdas.gtfs_data_fetch.main.get_last_modified_time")
+    @patch("lambdas.gtfs_data_fetch.main.requests.get")
+    @patch("lambdas.gtfs_data_fetch.main.dotenv.load_dotenv")
+    def test_handler_upload_failure_removes_zip(
+        self,
+        mock_load_dotenv,
+        mock_requests_get,
+        mock_get_last_modified,
+        mock_upload,
+        mock_update,
+        mock_download,
+        mock_remove,
+        mock_convert,
+        mock_build_manifest,
+        mock_load_manifest,
+        mock_save_manifest,
+    ):
+        """Tests the downloaded zip is removed and the time not updated on failure."""
+        # Arrange
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.headers = {"Last-Modified": "Mon, 23 Feb 2026 15:00:00 GMT"}
+        mock_requests_get.return_value = mock_response
+        mock_get_last_modified.return_value = "2026-01-01T12:00:00"
+        mock_upload.side_effect = OSError("No space left on device")
+
+        # Act + Assert
+        with pytest.raises(OSError):
+            handler({"test": "event"}, MagicMock())
+
+        mock_remove.assert_called_once_with(GTFS_ZIP_PATH)
+        mock_save_manifest.assert_not_called()
+        mock_update.assert_not_called()
+
+    @patch("lambdas.gtfs_data_fetch.main.update_last_modified_time")
+    @patch("lambdas.gtfs_data_fetch.main.upload_gtfs_zip_to_s3")
+    @patch("lambdas.gtfs_data_fetch.main.get_last_modified_time")
+    @patch("lambdas.gtfs_data_fetch.main.requests.get")
+    @patch("lambdas.gtfs_data_fetch.main.dotenv.load_dotenv")
+    def test_handler_failed_upload_keeps_old_manifest_entry(
+        self,
+        mock_load_dotenv,
+        mock_requests_get,
+        mock_get_last_modified,
+        mock_upload,
+        mock_update,
+        mock_download,
+        mock_remove,
+        mock_convert,
+        mock_build_manifest,
+        mock_load_manifest,
+        mock_save_manifest,
+    ):
+        """Tests files that failed to upload are retried on the next run."""
+        # Arrange
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.headers = {"Last-Modified": "Mon, 23 Feb 2026 15:00:00 GMT"}
+        mock_requests_get.return_value = mock_response
+        mock_get_last_modified.return_value = "2026-01-01T12:00:00"
+
+        mock_build_manifest.return_value = {
+            "stops.txt": {"crc": 2, "size": 10},
+            "trips.txt": {"crc": 3, "size": 30},
+        }
+        mock_load_manifest.return_value = {"stops.txt": {"crc": 1, "size": 10}}
+        mock_upload.return_value = ["trips.txt"]
+
+        # Act
+        result = handler({"test": "event"}, MagicMock())
+
+        # Assert
+        mock_save_manifest.assert_called_once_with(
+            bucket_name="123456789012-cta-analytics-project",
+            manifest={
+                "stops.txt": {"crc": 1, "size": 10},
+                "trips.txt": {"crc": 3, "size": 30},
+            },
         )
+        mock_convert.assert_called_once_with(
+            bucket_name="123456789012-cta-analytics-project",
+            zip_path=GTFS_ZIP_PATH,
+            tables={"trips"},
+        )
+        mock_update.assert_not_called()
+        self.assertEqual(result["changed_tables"], ["trips"])
@@ -1,11 +1,21 @@
 """Module for testing main.py in gtfs_expected_schedule lambda."""
 
+import os
+import tempfile
 import unittest
 from unittest.mock import MagicMock, patch
 
+import duckdb
 import pytest
 
-from lambdas.gtfs_expected_schedule.main import get_db_connection, handler
+from lambdas.gtfs_expected_schedule.main import (
+    GTFS_TABLE_COLUMNS,
+    backfill_schedule_metrics,
+    build_expected_schedule_query,
+    build_gtfs_view_query,
+    build_schedule_metrics_queries,
+    handler,
+)
 
 
 @pytest.fixture(autouse=True)
@@ -14,24 +24,162 @@ def mock_env_vars(monkeypatch):
     monkeypatch.setenv("ACCOUNT_NUMBER", "123456789012")
 
 
-class TestGetDbConnection(unittest.TestCase):
-    """Class for testing get_db_connection function."""
+class TestBuildGtfsViewQuery(unittest.TestCase):
+    """Class for testing build_gtfs_view_query function."""
 
-    @patch("lambdas.gtfs_expected_schedule.main.duckdb.connect")
-    def test_get_db_connection(self, mock_connect):
-        """Tests successfully initializing DuckDB connection."""
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.con = duckdb.connect()
+
+    def tearDown(self):
+        self.con.close()
+        self.temp_dir.cleanup()
+
+    def test_build_gtfs_view_query_projects_and_filters(self):
+        """Tests only the required columns of train platforms are read."""
+        # Arrange
+        path = os.path.join(self.temp_dir.name, "stops.parquet")
+        self.con.execute(f"""
+            COPY (
+                SELECT * FROM (VALUES
+                    (30173, 'Howard', 'Northbound', 42.01),
+                    (40900, 'Howard', NULL, 42.01),
+                    (1106, 'Sheridan & Devon', NULL, 41.99)
+                ) t(stop_id, stop_name, stop_desc, stop_lat)
+            ) TO '{path}' (FORMAT PARQUET)
+        """)
+
+        # Act
+        relation = self.con.sql(build_gtfs_view_query(table="stops", path=path))
+
+        # Assert
+        self.assertEqual(relation.columns, GTFS_TABLE_COLUMNS["stops"])
+        self.assertEqual(relation.fetchall(), [(30173, "Howard")])
+
+
+class TestBuildExpectedScheduleQuery(unittest.TestCase):
+    """Class for testing build_expected_schedule_query function."""
+
+    def setUp(self):
+        self.con = duckdb.connect()
+        self.con.execute("""
+            CREATE TABLE routes AS
+            SELECT 'Red' AS route_id, 'Red Line' AS route_long_name,
+                'c60c30' AS route_color
+        """)
+        self.con.execute("""
+            CREATE TABLE trips AS SELECT * FROM (VALUES
+                ('Red', 'weekday', 'trip_1', 'North', 0),
+                ('Red', 'weekend', 'trip_2', 'North', 0)
+            ) t(route_id, service_id, trip_id, direction, direction_id)
+        """)
+        self.con.execute("""
+            CREATE TABLE calendar AS SELECT * FROM (VALUES
+                ('weekday', 1, 1, 1, 1, 1, 0, 0, 20260101, 20260401),
+                ('weekend', 0, 0, 0, 0, 0, 1, 1, 20260101, 20260401)
+            ) t(service_id, monday, tuesday, wednesday, thursday, friday, saturday,
+                sunday, start_date, end_date)
+        """)
+        self.con.execute("""
+            CREATE TABLE stop_times AS SELECT * FROM (VALUES
+                ('trip_1', 16200, 16230, 30173, 1),
+                ('trip_2', 90060, 90060, 30173, 1)
+            ) t(trip_id, arrival_time, departure_time, stop_id, stop_sequence)
+        """)
+        self.con.execute(
+            "CREATE TABLE stops AS SELECT 30173 AS stop_id, 'Howard' AS stop_name"
+        )
+
+    def tearDown(self):
+        self.con.close()
+
+    def test_build_expected_schedule_query_precomputes_times(self):
+        """Tests times are written both as text and as seconds, hour and pattern."""
+        # Act
+        relation = self.con.sql(build_expected_schedule_query())
+        rows = relation.project(
+            "trip_id, arrival_time, arrival_seconds, departure_seconds, hour, "
+            "service_pattern"
+        ).order("trip_id")
+
+        # Assert
+        self.assertEqual(
+            rows.fetchall(),
+            [
+                ("trip_1", "04:30:00", 16200, 16230, 4, 1),
+                ("trip_2", "25:01:00", 90060, 90060, 25, 6),
+            ],
+        )
+
+    def test_build_schedule_metrics_queries(self):
+        """Tests the summary tables are computed per day type the trips run on."""
+        # Arrange
+        self.con.execute(
+            "INSERT INTO stop_times VALUES ('trip_3', 16800, 16800, 30173, 1)"
+        )
+        self.con.execute(
+            "INSERT INTO trips VALUES ('Red', 'weekday', 'trip_3', 'North', 0)"
+        )
+        self.con.execute(
+            f"CREATE TABLE expected_schedule AS {build_expected_schedule_query()}"
+        )
+
+        # Act
+        queries = build_schedule_metrics_queries(
+            source="expected_schedule", effective_date=20260101
+        )
+        results = {
+            table: self.con.sql(query).fetchall() for table, query in queries.items()
+        }
+
+        # Assert
+        self.assertEqual(
+            results["trains_per_hour"],
+            [
+                (20260101, "Red Line", 1, 4, 2),
+                (20260101, "Red Line", 2, 25, 1),
+                (20260101, "Red Line", 4, 25, 1),
+            ],
+        )
+        self.assertEqual(
+            results["headway"], [(20260101, "Red Line", 1, 4, 10.0, "10:00")]
+        )
+        self.assertEqual(
+            results["scheduled_runs"],
+            [
+                (20260101, "Red Line", "c60c30", 1, 20260101, 2),
+                (20260101, "Red Line", "c60c30", 2, 20260101, 1),
+                (20260101, "Red Line", "c60c30", 4, 20260101, 1),
+            ],
+        )
+
+
+class TestBackfillScheduleMetrics(unittest.TestCase):
+    """Class for testing backfill_schedule_metrics function."""
+
+    @patch("lambdas.gtfs_expected_schedule.main.write_schedule_metrics")
+    def test_backfill_schedule_metrics(self, mock_write):
+        """Tests every expected schedule in S3 is summarized by its effective date."""
         # Arrange
         mock_con = MagicMock()
-        mock_connect.return_value = mock_con
+        mock_con.execute.return_value.fetchall.return_value = [
+            ("s3://bucket/gtfs_expected_cta_schedule/20250601.parquet",),
+            ("s3://bucket/gtfs_expected_cta_schedule/20260101.parquet",),
+        ]
 
         # Act
-        result = get_db_connection()
+        effective_dates = backfill_schedule_metrics(con=mock_con, bucket="bucket")
 
         # Assert
-        mock_connect.assert_called_once_with(database=":memory:")
-        args, _ = mock_con.execute.call_args
-        self.assertIn("CREATE OR REPLACE SECRET", args[0])
-        self.assertEqual(result, mock_con)
+        self.assertEqual(effective_dates, [20250601, 20260101])
+        self.assertEqual(
+            [call.kwargs["effective_date"] for call in mock_write.call_args_list],
+            [20250601, 20260101],
+        )
+        self.assertIn(
+            "read_parquet('s3://bucket/gtfs_expected_cta_schedule/20250601.parquet')",
+            mock_write.call_args_list[0].kwargs["source"],
+        )
 
 
 class TestHandler(unittest.TestCase):
@@ -50,7 +198,7 @@ class TestHandler(unittest.TestCase):
 
         # Assert
         assert response == {"status": "success", "effective_date": "20260101"}
-        assert mock_con.execute.call_count == 7
+        assert mock_con.execute.call_count == 12
         mock_con.execute.assert_any_call("SELECT MIN(start_date) FROM calendar")
 
     @patch("lambdas.gtfs_expected_schedule.main.get_db_connection")
@@ -66,3 +214,27 @@ class TestHandler(unittest.TestCase):
             handler(event={}, context={})
 
         assert mock_con.execute.call_count == 6
+
+    @patch("lambdas.gtfs_expected_schedule.main.get_db_connection")
+    def test_handler_skips_when_no_input_table_changed(self, mock_get_conn):
+        """Tests the rebuild is skipped when only tables it does not read changed."""
+        # Act
+        response = handler(event={"changed_tables": ["shapes"]}, context={})
+
+        # Assert
+        assert response == {"status": "skipped", "changed_tables": ["shapes"]}
+        mock_get_conn.assert_not_called()
+
+    @patch("lambdas.gtfs_expected_schedule.main.get_db_connection")
+    def test_handler_rebuilds_when_input_table_changed(self, mock_get_conn):
+        """Tests the rebuild runs when one of its input tables changed."""
+        # Arrange
+        mock_con = MagicMock()
+        mock_get_conn.return_value = mock_con
+        mock_con.execute.return_value.fetchone.return_value = ["20260101"]
+
+        # Act
+        response = handler(event={"changed_tables": ["shapes", "trips"]}, context={})
+
+        # Assert
+        assert response == {"status": "success", "effective_date": "20260101"}
@@ -0,0 +1,562 @@
+"""Module for testing utils.py in the Streamlit app pages."""
+
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+import botocore.exceptions
+import duckdb
+import pandas as pd
+import pytest
+
+pytest.importorskip("streamlit")
+
+from pages.utils.utils import (
+    QueryResultCache,
+    build_parquet_query,
+    load_s3_parquet_data,
+    load_s3_parquet_max,
+    mirror_s3_parquet,
+    run_query,
+    sync_s3_objects,
+)
+
+
+def make_df(rows: int) -> pd.DataFrame:
+    """Creates a dataframe of integers with the given number of rows."""
+    return pd.DataFrame({"value": range(rows)}, dtype="int64")
+
+
+def df_size(df: pd.DataFrame) -> int:
+    """Gets the memory usage the query result cache accounts for a dataframe."""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class TestQueryResultCache(unittest.TestCase):
+    """Class for testing QueryResultCache class."""
+
+    def test_get_missing_key(self):
+        """Tests a key that was never cached returns None."""
+        # Arrange
+        cache = QueryResultCache(max_bytes=1024)
+
+        # Act
+        result = cache.get(("SELECT 1", (), None))
+
+        # Assert
+        self.assertIsNone(result)
+
+    def test_put_evicts_least_recently_used(self):
+        """Tests the least recently used result is evicted first."""
+        # Arrange
+        df_a, df_b, df_c = make_df(10), make_df(10), make_df(10)
+        cache = QueryResultCache(max_bytes=2 * df_size(df_a))
+        cache.put("a", df_a)
+        cache.put("b", df_b)
+        cache.get("a")
+
+        # Act
+        cache.put("c", df_c)
+
+        # Assert
+        self.assertIs(cache.get("a"), df_a)
+        self.assertIsNone(cache.get("b"))
+        self.assertIs(cache.get("c"), df_c)
+        self.assertEqual(cache.total_bytes, df_size(df_a) + df_size(df_c))
+
+    def test_put_evicts_until_within_bound(self):
+        """Tests several results are evicted to make room for a large one."""
+        # Arrange
+        df_small = make_df(10)
+        df_large = make_df(25)
+        cache = QueryResultCache(max_bytes=df_size(df_large) + df_size(df_small))
+        cache.put("a", df_small)
+        cache.put("b", df_small)
+        cache.put("c", df_small)
+
+        # Act
+        cache.put("d", df_large)
+
+        # Assert
+        self.assertIsNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertIs(cache.get("c"), df_small)
+        self.assertIs(cache.get("d"), df_large)
+        self.assertLessEqual(cache.total_bytes, cache.max_bytes)
+
+    def test_put_oversized_result_not_cached(self):
+        """Tests a result larger than the bound is not cached or evicting others."""
+        # Arrange
+        df_small = make_df(10)
+        cache = QueryResultCache(max_bytes=df_size(df_small))
+        cache.put("a", df_small)
+
+        # Act
+        cache.put("b", make_df(1000))
+
+        # Assert
+        self.assertIsNone(cache.get("b"))
+        self.assertIs(cache.get("a"), df_small)
+        self.assertEqual(cache.total_bytes, df_size(df_small))
+
+    def test_put_existing_key_replaces_result(self):
+        """Tests caching a key again replaces its result and its accounted size."""
+        # Arrange
+        cache = QueryResultCache(max_bytes=1024 * 1024)
+        cache.put("a", make_df(10))
+        df_new = make_df(100)
+
+        # Act
+        cache.put("a", df_new)
+
+        # Assert
+        self.assertIs(cache.get("a"), df_new)
+        self.assertEqual(cache.total_bytes, df_size(df_new))
+
+
+@patch("pages.utils.utils.get_query_result_cache")
+@patch("pages.utils.utils.get_duckdb_connection")
+class TestRunQuery(unittest.TestCase):
+    """Class for testing run_query function."""
+
+    def setUp(self):
+        self.con = duckdb.connect(database=":memory:")
+        self.addCleanup(self.con.close)
+
+    def test_run_query_returns_result(self, mock_get_conn, mock_get_cache):
+        """Tests a query runs with its parameters on the shared connection."""
+        # Arrange
+        mock_get_conn.return_value = self.con
+        mock_get_cache.return_value = QueryResultCache(max_bytes=1024 * 1024)
+
+        # Act
+        result = run_query("SELECT ? + 1 AS value", params=[41])
+
+        # Assert
+        self.assertEqual(result["value"].tolist(), [42])
+
+    def test_run_query_cache_hit(self, mock_get_conn, mock_get_cache):
+        """Tests the same query over the same data version is only run once."""
+        # Arrange
+        mock_get_conn.return_value = MagicMock(wraps=self.con)
+        mock_get_cache.return_value = QueryResultCache(max_bytes=1024 * 1024)
+        data_version = (("data/a.parquet", '"etag-1"'),)
+
+        # Act
+        first = run_query("SELECT ? AS value", [1], data_version=data_version)
+        second = run_query("SELECT ? AS value", [1], data_version=data_version)
+
+        # Assert
+        self.assertIs(first, second)
+        mock_get_conn.return_value.cursor.assert_called_once()
+
+    def test_run_query_cache_miss(self, mock_get_conn, mock_get_cache):
+        """Tests new parameters or a new data version run the query again."""
+        # Arrange
+        mock_get_conn.return_value = MagicMock(wraps=self.con)
+        mock_get_cache.return_value = QueryResultCache(max_bytes=1024 * 1024)
+        old_version = (("data/a.parquet", '"etag-1"'),)
+        new_version = (("data/a.parquet", '"etag-2"'),)
+
+        # Act
+        run_query("SELECT ? AS value", [1], data_version=old_version)
+        new_params = run_query("SELECT ? AS value", [2], data_version=old_version)
+        new_data = run_query("SELECT ? AS value", [1], data_version=new_version)
+
+        # Assert
+        self.assertEqual(new_params["value"].tolist(), [2])
+        self.assertEqual(new_data["value"].tolist(), [1])
+        self.assertEqual(mock_get_conn.return_value.cursor.call_count, 3)
+
+
+class StubS3Client:
+    """S3 client serving objects from a dict of key to (ETag, body)."""
+
+    def __init__(self, objects: dict):
+        self.objects = objects
+        self.list_error = None
+        self.download_error = None
+        self.downloaded_keys = []
+
+    def get_paginator(self, operation_name: str):
+        paginator = MagicMock()
+        if self.list_error:
+            paginator.paginate.side_effect = self.list_error
+        else:
+            paginator.paginate.side_effect = lambda Bucket, Prefix: [
+                {
+                    "Contents": [
+                        {"Key": key, "ETag": etag}
+                        for key, (etag, _) in sorted(self.objects.items())
+                        if key.startswith(Prefix)
+                    ]
+                }
+            ]
+        return paginator
+
+    def download_file(self, Bucket: str, Key: str, Filename: str):
+        if self.download_error:
+            raise self.download_error
+        self.downloaded_keys.append(Key)
+        with open(Filename, "wb") as f:
+            f.write(self.objects[Key][1])
+
+
+class TestSyncS3Objects(unittest.TestCase):
+    """Class for testing sync_s3_objects and mirror_s3_parquet functions."""
+
+    def setUp(self):
+        mirror_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(mirror_directory.cleanup)
+        self.bucket_directory = os.path.join(mirror_directory.name, "bucket")
+        patcher = patch(
+            "pages.utils.utils.LOCAL_MIRROR_DIRECTORY", mirror_directory.name
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.s3_client = StubS3Client(
+            {
+                "data/a.parquet": ('"etag-a"', b"a"),
+                "data/b.parquet": ('"etag-b"', b"b"),
+                "other/c.parquet": ('"etag-c"', b"c"),
+            }
+        )
+        patcher = patch("pages.utils.utils.get_s3_client", return_value=self.s3_client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def read_mirrored_file(self, key: str) -> bytes:
+        with open(os.path.join(self.bucket_directory, key), "rb") as f:
+            return f.read()
+
+    def test_sync_downloads_matching_objects(self):
+        """Tests only objects matching the pattern are mirrored."""
+        # Act
+        result = sync_s3_objects(bucket="bucket", key_pattern="data/*.parquet")
+
+        # Assert
+        self.assertEqual(
+            result,
+            (("data/a.parquet", '"etag-a"'), ("data/b.parquet", '"etag-b"')),
+        )
+        self.assertEqual(self.read_mirrored_file("data/a.parquet"), b"a")
+        self.assertEqual(self.read_mirrored_file("data/b.parquet"), b"b")
+        self.assertFalse(
+            os.path.exists(os.path.join(self.bucket_directory, "other/c.parquet"))
+        )
+
+    def test_sync_skips_unchanged_objects(self):
+        """Tests objects with an unchanged ETag are not downloaded again."""
+        # Arrange
+        sync_s3_objects(bucket="bucket", key_pattern="data/*.parquet")
+        self.s3_client.downloaded_keys.clear()
+
+        # Act
+        result = sync_s3_objects(bucket="bucket", key_pattern="data/*.parquet")
+
+        # Assert
+        self.assertEqual(self.s3_client.downloaded_keys, [])
+        self.assertEqual(
+            result,
+            (("data/a.parquet", '"etag-a"'), ("data/b.parquet", '"etag-b"')),
+        )
+
+    def test_sync_downloads_changed_objects(self):
+        """Tests an object with a new ETag replaces its mirrored file."""
+        # Arrange
+        sync_s3_objects(bucket="bucket", key_pattern="data/*.parquet")
+        self.s3_client.downloaded_keys.clear()
+        self.s3_client.objects["data/a.parquet"] = ('"etag-a2"', b"a2")
+
+        # Act
+        result = sync_s3_objects(bucket="bucket", key_pattern="data/*.parquet")
+
+        # Assert
+        self.assertEqual(self.s3_client.downloaded_keys, ["data/a.parquet"])
+        self.assertEqual(self.read_mirrored_file("data/a.parquet"), b"a2")
+        self.assertIn(("data/a.parquet", '"etag-a2"'), result)
+        self.assertFalse(
+            os.path.exists(
+                os.path.join(self.bucket_directory, "data/a.parquet.download")
+            )
+        )
+
+    def test_sync_removes_deleted_objects(self):
+        """Tests the mirrored file of an object deleted from S3 is removed."""
+        # Arrange
+        sync_s3_objects(bucket="bucket", key_pattern="data/*.parquet")
+        del self.s3_client.objects["data/b.parquet"]
+
+        # Act
+        result = sync_s3_objects(bucket="bucket", key_pattern="data/*.parquet")
+
+        # Assert
+        self.assertEqual(result, (("data/a.parquet", '"etag-a"'),))
+        self.assertFalse(
+            os.path.exists(os.path.join(self.bucket_directory, "data/b.parquet"))
+        )
+
+    def test_sync_list_error_serves_mirrored_files(self):
+        """Tests the mirrored files are served when S3 cannot be listed."""
+        # Arrange
+        sync_s3_objects(bucket="bucket", key_pattern="data/*.parquet")
+        self.s3_client.list_error = botocore.exceptions.EndpointConnectionError(
+            endpoint_url="https://s3.amazonaws.com"
+        )
+
+        # Act
+        with self.assertLogs("pages.utils.utils", level="WARNING"):
+            result = sync_s3_objects(bucket="bucket", key_pattern="data/*.parquet")
+
+        # Assert
+        self.assertEqual(
+            result,
+            (("data/a.parquet", '"etag-a"'), ("data/b.parquet", '"etag-b"')),
+        )
+        self.assertEqual(self.read_mirrored_file("data/a.parquet"), b"a")
+
+    def test_sync_list_error_without_mirror_raises(self):
+        """Tests the error is raised when S3 cannot be listed and nothing is mirrored."""
+        # Arrange
+        self.s3_client.list_error = botocore.exceptions.ClientError(
+            {"Error": {"Code": "AccessDenied", "Message": "Access Denied"}},
+            "ListObjectsV2",
+        )
+
+        # Act & Assert
+        with self.assertRaises(botocore.exceptions.ClientError):
+            sync_s3_objects(bucket="bucket", key_pattern="data/*.parquet")
+
+    def test_sync_download_error_keeps_mirrored_file(self):
+        """Tests a changed object that fails to download keeps its mirrored file."""
+        # Arrange
+        sync_s3_objects(bucket="bucket", key_pattern="data/*.parquet")
+        self.s3_client.objects["data/a.parquet"] = ('"etag-a2"', b"a2")
+        self.s3_client.download_error = botocore.exceptions.EndpointConnectionError(
+            endpoint_url="https://s3.amazonaws.com"
+        )
+
+        # Act
+        with self.assertLogs("pages.utils.utils", level="WARNING"):
+            result = sync_s3_objects(bucket="bucket", key_pattern="data/*.parquet")
+
+        # Assert
+        self.assertIn(("data/a.parquet", '"etag-a"'), result)
+        self.assertEqual(self.read_mirrored_file("data/a.parquet"), b"a")
+
+        # The object is downloaded once S3 is reachable again
+        self.s3_client.download_error = None
+        result = sync_s3_objects(bucket="bucket", key_pattern="data/*.parquet")
+        self.assertIn(("data/a.parquet", '"etag-a2"'), result)
+        self.assertEqual(self.read_mirrored_file("data/a.parquet"), b"a2")
+
+    def test_mirror_s3_parquet(self):
+        """Tests an S3 path is mirrored to the matching local path."""
+        # Arrange
+        mirror_s3_parquet.clear()
+        self.addCleanup(mirror_s3_parquet.clear)
+
+        # Act
+        local_path, data_version = mirror_s3_parquet("s3://bucket/data/*.parquet")
+
+        # Assert
+        self.assertEqual(
+            local_path, os.path.join(self.bucket_directory, "data/*.parquet")
+        )
+        self.assertEqual(
+            data_version,
+            (("data/a.parquet", '"etag-a"'), ("data/b.parquet", '"etag-b"')),
+        )
+
+
+class TestBuildParquetQuery(unittest.TestCase):
+    """Class for testing build_parquet_query function."""
+
+    def test_build_parquet_query_all_columns(self):
+        """Tests all columns are selected without filters or parameters."""
+        # Act
+        query, params = build_parquet_query(path="/data/*.parquet")
+
+        # Assert
+        self.assertEqual(
+            query,
+            "SELECT * FROM read_parquet('/data/*.parquet', union_by_name = true)",
+        )
+        self.assertEqual(params, [])
+
+    def test_build_parquet_query_filters_are_parameters(self):
+        """Tests equality and IN filters are bound as parameters, not interpolated."""
+        # Act
+        query, params = build_parquet_query(
+            path="/data/*.parquet",
+            columns=["route_long_name", "hour"],
+            filters={"route_long_name": "O'Hare", "hour": [7, 8]},
+        )
+
+        # Assert
+        self.assertEqual(
+            query,
+            'SELECT "route_long_name", "hour" '
+            "FROM read_parquet('/data/*.parquet', union_by_name = true) "
+            'WHERE "route_long_name" = ? AND "hour" IN (?, ?)',
+        )
+        self.assertEqual(params, ["O'Hare", 7, 8])
+
+
+@patch("pages.utils.utils.get_query_result_cache")
+@patch("pages.utils.utils.get_duckdb_connection")
+@patch("pages.utils.utils.mirror_s3_parquet")
+class TestLoadS3ParquetData(unittest.TestCase):
+    """Class for testing load_s3_parquet_data and load_s3_parquet_max functions."""
+
+    def setUp(self):
+        data_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(data_directory.cleanup)
+        self.data_directory = data_directory.name
+        self.con = duckdb.connect(database=":memory:")
+        self.addCleanup(self.con.close)
+
+        # The newer file has a column the older one was written without
+        self.write_parquet(
+            "schedule_1.parquet",
+            """
+            SELECT * FROM (VALUES
+                (20260101, 'Red Line', 7, 10),
+                (20260101, 'Blue Line', 7, 8)
+            ) AS t(effective_date, route_long_name, hour, trips)
+            """,
+        )
+        self.write_parquet(
+            "schedule_2.parquet",
+            """
+            SELECT * FROM (VALUES
+                (20260201, 'Red Line', 7, 12, 'FF0000'),
+                (20260201, 'Red Line', 8, 14, 'FF0000'),
+                (20260201, 'O''Hare', 9, 3, '0000FF')
+            ) AS t(effective_date, route_long_name, hour, trips, route_color)
+            """,
+        )
+
+    def write_parquet(self, filename: str, query: str):
+        path = os.path.join(self.data_directory, filename)
+        self.con.execute(f"COPY ({query}) TO '{path}' (FORMAT PARQUET)")
+
+    def mock_mirror(self, mock_mirror, mock_get_conn, mock_get_cache):
+        mock_mirror.return_value = (
+            os.path.join(self.data_directory, "*.parquet"),
+            (("data/schedule_1.parquet", '"etag-1"'),),
+        )
+        mock_get_conn.return_value = self.con
+        mock_get_cache.return_value = QueryResultCache(max_bytes=1024 * 1024)
+
+    def test_load_s3_parquet_data_projection(
+        self, mock_mirror, mock_get_conn, mock_get_cache
+    ):
+        """Tests only the selected columns are loaded."""
+        # Arrange
+        self.mock_mirror(mock_mirror, mock_get_conn, mock_get_cache)
+
+        # Act
+        df = load_s3_parquet_data(
+            s3_path="s3://bucket/data/*.parquet", columns=["route_long_name", "hour"]
+        )
+
+        # Assert
+        mock_mirror.assert_called_once_with("s3://bucket/data/*.parquet")
+        self.assertEqual(list(df.columns), ["route_long_name", "hour"])
+        self.assertEqual(len(df), 5)
+
+    def test_load_s3_parquet_data_filters(
+        self, mock_mirror, mock_get_conn, mock_get_cache
+    ):
+        """Tests equality and IN filters select the matching rows."""
+        # Arrange
+        self.mock_mirror(mock_mirror, mock_get_conn, mock_get_cache)
+
+        # Act
+        df = load_s3_parquet_data(
+            s3_path="s3://bucket/data/*.parquet",
+            columns=["route_long_name", "hour"],
+            filters={"effective_date": 20260201, "route_long_name": ["O'Hare"]},
+        )
+
+        # Assert
+        self.assertEqual(
+            df.to_dict("records"), [{"route_long_name": "O'Hare", "hour": 9}]
+        )
+
+    def test_load_s3_parquet_data_union_by_name(
+        self, mock_mirror, mock_get_conn, mock_get_cache
+    ):
+        """Tests files without a column are read with it as NULL."""
+        # Arrange
+        self.mock_mirror(mock_mirror, mock_get_conn, mock_get_cache)
+
+        # Act
+        df = load_s3_parquet_data(
+            s3_path="s3://bucket/data/*.parquet",
+            columns=["effective_date", "route_color"],
+            filters={"route_long_name": "Red Line", "hour": 7},
+        ).sort_values("effective_date")
+
+        # Assert
+        self.assertEqual(df["effective_date"].tolist(), [20260101, 20260201])
+        self.assertTrue(pd.isna(df["route_color"].iloc[0]))
+        self.assertEqual(df["route_color"].iloc[1], "FF0000")
+
+    def test_load_s3_parquet_max(self, mock_mirror, mock_get_conn, mock_get_cache):
+        """Tests the maximum value of a column is returned."""
+        # Arrange
+        self.mock_mirror(mock_mirror, mock_get_conn, mock_get_cache)
+
+        # Act
+        result = load_s3_parquet_max(
+            s3_path="s3://bucket/data/*.parquet", column="effective_date"
+        )
+
+        # Assert
+        self.assertEqual(result, 20260201)
+
+    def test_load_s3_parquet_max_no_files(
+        self, mock_mirror, mock_get_conn, mock_get_cache
+    ):
+        """Tests None is returned when no files match the path."""
+        # Arrange
+        self.mock_mirror(mock_mirror, mock_get_conn, mock_get_cache)
+        mock_mirror.return_value = (
+            os.path.join(self.data_directory, "missing", "*.parquet"),
+            (),
+        )
+
+        # Act
+        result = load_s3_parquet_max(
+            s3_path="s3://bucket/missing/*.parquet", column="effective_date"
+        )
+
+        # Assert
+        self.assertIsNone(result)
+
+    def test_load_s3_parquet_max_no_rows(
+        self, mock_mirror, mock_get_conn, mock_get_cache
+    ):
+        """Tests None is returned when the files have no rows."""
+        # Arrange
+        self.mock_mirror(mock_mirror, mock_get_conn, mock_get_cache)
+        self.write_parquet(
+            "empty.parquet",
+            "SELECT 20260101 AS effective_date WHERE false",
+        )
+        mock_mirror.return_value = (
+            os.path.join(self.data_directory, "empty.parquet"),
+            (("data/empty.parquet", '"etag-empty"'),),
+        )
+
+        # Act
+        result = load_s3_parquet_max(
+            s3_path="s3://bucket/data/empty.parquet", column="effective_date"
+        )
+
+        # Assert
+        self.assertIsNone(result)
@@ -0,0 +1,1106 @@
+"""Module for testing main.py in process_raw_cta_data lambda."""
+
+import datetime
+import gzip
+import io
+import json
+import pathlib
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+import botocore.exceptions
+import duckdb
+import pandas as pd
+
+from lambdas.process_raw_cta_data.main import (
+    ACTUAL_ARRIVAL_COLUMNS,
+    PROCESSING_STATE_KEY,
+    RUN_STATE_COLUMNS,
+    TRAIN_RECORD_SCHEMA,
+    TrainRecordColumns,
+    build_partition_path,
+    extract_cta_data_from_s3,
+    extract_new_cta_data_from_s3,
+    get_snapshot_parser,
+    handler,
+    infer_actual_arrivals,
+    infer_actual_arrivals_incremental,
+    iter_decompressed_lines,
+    iter_partition_snapshots,
+    list_s3_partition,
+    list_s3_partitions,
+    load_processing_state,
+    process_new_train_locations,
+    read_s3_partition,
+    save_processing_state,
+    write_df_to_s3,
+    write_train_locations_to_s3,
+)
+from lambdas.shared.snapshot_encoding import SnapshotDeltaEncoder
+
+
+def build_snapshot(timestamp: str, trains: list[dict]) -> dict:
+    """Builds a raw Firehose snapshot containing a single Red Line route."""
+    return {
+        "timestamp": timestamp,
+        "data": [
+            {
+                "ctatt": {
+                    "tmst": "2026-02-27T14:03:12",
+                    "errCd": "0",
+                    "errNm": None,
+                    "route": [{"@name": "red", "train": trains}],
+                }
+            }
+        ],
+    }
+
+
+def build_train(run_number: str, next_station_name: str) -> dict:
+    """Builds a single train entry as returned by the CTA API."""
+    return {
+        "rn": run_number,
+        "destSt": "30173",
+        "destNm": "Howard",
+        "trDr": "1",
+        "nextStaId": "40900",
+        "nextStpId": "30173",
+        "nextStaNm": next_station_name,
+        "prdt": "2026-02-27T14:02:40",
+        "arrT": "2026-02-27T14:03:40",
+        "isApp": "0",
+        "isDly": "0",
+    }
+
+
+def gzip_lines(lines: list[str]) -> bytes:
+    """Gzips newline-delimited lines the same way Firehose writes them."""
+    return gzip.compress("".join(line + "\n" for line in lines).encode("utf-8"))
+
+
+class TestReadS3Partition(unittest.TestCase):
+    """Class for testing read_s3_partition function."""
+
+    @patch("lambdas.process_raw_cta_data.main.boto3.client")
+    def test_read_s3_partition_streams_bodies(self, mock_client):
+        """Tests each object body is yielded lazily and closed after use."""
+        # Arrange
+        mock_s3_client = MagicMock()
+        mock_client.return_value = mock_s3_client
+        mock_s3_client.get_paginator.return_value.paginate.return_value = [
+            {"Contents": [{"Key": "prefix/file1.gz"}, {"Key": "prefix/file2.gz"}]}
+        ]
+        bodies = [MagicMock(), MagicMock()]
+        mock_s3_client.get_object.side_effect = [{"Body": body} for body in bodies]
+
+        # Act
+        files = read_s3_partition(
+            bucket_name="bucket", partition_path="prefix/", max_workers=1
+        )
+        first_key, first_body = next(files)
+
+        # Assert
+        self.assertEqual(first_key, "prefix/file1.gz")
+        self.assertIs(first_body, bodies[0])
+        self.assertEqual(mock_s3_client.get_object.call_count, 1)
+        self.assertEqual([key for key, _ in files], ["prefix/file2.gz"])
+        bodies[0].close.assert_called_once()
+        bodies[1].close.assert_called_once()
+
+    @patch("lambdas.process_raw_cta_data.main.boto3.client")
+    def test_read_s3_partition_skips_failed_downloads(self, mock_client):
+        """Tests a failed download is skipped without stopping the partition."""
+        # Arrange
+        mock_s3_client = MagicMock()
+        mock_client.return_value = mock_s3_client
+        mock_s3_client.get_paginator.return_value.paginate.return_value = [
+            {"Contents": [{"Key": "prefix/file1.gz"}, {"Key": "prefix/file2.gz"}]}
+        ]
+        mock_s3_client.get_object.side_effect = [
+            botocore.exceptions.ClientError(
+                error_response={"Error": {"Code": "NoSuchKey", "Message": "Missing"}},
+                operation_name="GetObject",
+            ),
+            {"Body": MagicMock()},
+        ]
+
+        # Act
+        keys = [key for key, _ in read_s3_partition("bucket", "prefix/", max_workers=1)]
+
+        # Assert
+        self.assertEqual(keys, ["prefix/file2.gz"])
+
+    @patch("lambdas.process_raw_cta_data.main.boto3.client")
+    def test_read_s3_partition_concurrent_preserves_key_order(self, mock_client):
+        """Tests concurrent downloads are yielded in S3 key order."""
+        # Arrange
+        mock_s3_client = MagicMock()
+        mock_client.return_value = mock_s3_client
+        keys = [f"prefix/file{i}.gz" for i in range(10)]
+        mock_s3_client.get_paginator.return_value.paginate.return_value = [
+            {"Contents": [{"Key": key, "Size": 1} for key in keys]}
+        ]
+
+        def get_object(Bucket, Key):
+            body = MagicMock()
+            body.read.return_value = Key.encode()
+            return {"Body": body}
+
+        mock_s3_client.get_object.side_effect = get_object
+
+        # Act
+        files = [
+            (key, body.read())
+            for key, body in read_s3_partition("bucket", "prefix/", max_workers=4)
+        ]
+
+        # Assert
+        self.assertEqual(files, [(key, key.encode()) for key in keys])
+        self.assertEqual(mock_client.call_args.kwargs["config"].max_pool_connections, 4)
+
+    @patch("lambdas.process_raw_cta_data.main.boto3.client")
+    def test_read_s3_partition_concurrent_respects_byte_cap(self, mock_client):
+        """Tests read-ahead stops once the in-flight byte cap is reached."""
+        # Arrange
+        mock_s3_client = MagicMock()
+        mock_client.return_value = mock_s3_client
+        mock_s3_client.get_paginator.return_value.paginate.return_value = [
+            {"Contents": [{"Key": str(i), "Size": 10} for i in range(6)]}
+        ]
+        consumed = []
+        consumed_at_download = {}
+
+        def get_object(Bucket, Key):
+            consumed_at_download[int(Key)] = len(consumed)
+            return {"Body": MagicMock(read=MagicMock(return_value=b"data"))}
+
+        mock_s3_client.get_object.side_effect = get_object
+
+        # Act
+        for key, _ in read_s3_partition(
+            "bucket", "prefix/", max_workers=4, max_in_flight_bytes=25
+        ):
+            consumed.append(key)
+
+        # Assert
+        # With a 25 byte cap only two 10 byte files may be held at once, so file i can
+        # only start downloading after the consumer has received file i - 2
+        self.assertEqual(consumed, [str(i) for i in range(6)])
+        for index, consumed_count in consumed_at_download.items():
+            self.assertGreaterEqual(consumed_count, index - 1)
+
+    @patch("lambdas.process_raw_cta_data.main.boto3.client")
+    def test_read_s3_partition_concurrent_skips_failed_downloads(self, mock_client):
+        """Tests a failed concurrent download is skipped without stopping the partition."""
+        # Arrange
+        mock_s3_client = MagicMock()
+        mock_client.return_value = mock_s3_client
+        mock_s3_client.get_paginator.return_value.paginate.return_value = [
+            {"Contents": [{"Key": "prefix/file1.gz"}, {"Key": "prefix/file2.gz"}]}
+        ]
+
+        def get_object(Bucket, Key):
+            if Key == "prefix/file1.gz":
+                raise botocore.exceptions.ClientError(
+                    error_response={
+                        "Error": {"Code": "NoSuchKey", "Message": "Missing"}
+                    },
+                    operation_name="GetObject",
+                )
+            return {"Body": MagicMock(read=MagicMock(return_value=b"data"))}
+
+        mock_s3_client.get_object.side_effect = get_object
+
+        # Act
+        keys = [key for key, _ in read_s3_partition("bucket", "prefix/", max_workers=2)]
+
+        # Assert
+        self.assertEqual(keys, ["prefix/file2.gz"])
+
+    @patch("lambdas.process_raw_cta_data.main.boto3.client")
+    def test_read_s3_partition_empty(self, mock_client):
+        """Tests an empty partition yields no files."""
+        # Arrange
+        mock_client.return_value.get_paginator.return_value.paginate.return_value = [{}]
+
+        # Act + Assert
+        self.assertEqual(list(read_s3_partition("bucket", "prefix/")), [])
+
+
+class TestBuildPartitionPath(unittest.TestCase):
+    """Class for testing build_partition_path function."""
+
+    def test_build_partition_path_zero_pads(self):
+        """Tests month and day are zero padded to match the Firehose prefix."""
+        # Act
+        result = build_partition_path(datetime.date(2026, 3, 7))
+
+        # Assert
+        self.assertEqual(result, "raw-api-data/success/year=2026/month=03/day=07/")
+
+
+class TestListS3Partitions(unittest.TestCase):
+    """Class for testing list_s3_partition and list_s3_partitions functions."""
+
+    def test_list_s3_partition_follows_pages(self):
+        """Tests every page of a paginated listing is returned."""
+        # Arrange
+        mock_s3_client = MagicMock()
+        mock_s3_client.get_paginator.return_value.paginate.return_value = [
+            {"Contents": [{"Key": f"prefix/{i}"} for i in range(1000)]},
+            {"Contents": [{"Key": "prefix/1000"}]},
+        ]
+
+        # Act
+        objects = list_s3_partition(mock_s3_client, "bucket", "prefix/")
+
+        # Assert
+        self.assertEqual(len(objects), 1001)
+        mock_s3_client.get_paginator.assert_called_once_with("list_objects_v2")
+        mock_s3_client.get_paginator.return_value.paginate.assert_called_once_with(
+            Bucket="bucket", Prefix="prefix/"
+        )
+
+    def test_list_s3_partition_error(self):
+        """Tests a listing error returns no objects."""
+        # Arrange
+        mock_s3_client = MagicMock()
+        mock_s3_client.get_paginator.return_value.paginate.side_effect = (
+            botocore.exceptions.ClientError(
+                error_response={"Error": {"Code": "AccessDenied", "Message": "Denied"}},
+                operation_name="ListObjectsV2",
+            )
+        )
+
+        # Act + Assert
+        self.assertEqual(list_s3_partition(mock_s3_client, "bucket", "prefix/"), [])
+
+    def test_list_s3_partitions_merges_in_key_order(self):
+        """Tests listings from several prefixes are merged into one ordered manifest."""
+        # Arrange
+        pages = {
+            "day=28/": [{"Contents": [{"Key": "day=28/b"}, {"Key": "day=28/a"}]}],
+            "day=27/": [{"Contents": [{"Key": "day=27/z"}]}],
+        }
+        mock_s3_client = MagicMock()
+        mock_s3_client.get_paginator.return_value.paginate.side_effect = (
+            lambda Bucket, Prefix: pages[Prefix]
+        )
+
+        # Act
+        objects = list_s3_partitions(
+            mock_s3_client, "bucket", ["day=28/", "day=27/", "day=28/"]
+        )
+
+        # Assert
+        self.assertEqual(
+            [obj["Key"] for obj in objects], ["day=27/z", "day=28/a", "day=28/b"]
+        )
+
+
+class TestIterDecompressedLines(unittest.TestCase):
+    """Class for testing iter_decompressed_lines function."""
+
+    def test_iter_decompressed_lines(self):
+        """Tests gzipped content is decoded line by line."""
+        # Arrange
+        file_obj = io.BytesIO(gzip_lines(['{"a": 1}', "", '{"b": 2}']))
+
+        # Act
+        lines = list(iter_decompressed_lines(file_obj))
+
+        # Assert
+        self.assertEqual(lines, [b'{"a": 1}', b"", b'{"b": 2}'])
+
+
+class TestTrainRecordColumns(unittest.TestCase):
+    """Class for testing TrainRecordColumns class."""
+
+    def test_append_snapshot_typed_columns(self):
+        """Tests trains are appended into typed, dictionary-encoded columns."""
+        # Arrange
+        columns = TrainRecordColumns()
+        snapshot = build_snapshot(
+            timestamp="2026-02-27T20:03:15+00:00",
+            trains=[build_train("801", "Howard"), build_train("802", "Belmont")],
+        )
+
+        # Act
+        appended = columns.append_snapshot(snapshot)
+        appended += columns.append_snapshot(snapshot)
+        df = columns.to_dataframe()
+
+        # Assert
+        self.assertEqual(appended, 4)
+        self.assertEqual(list(df.columns), list(TRAIN_RECORD_SCHEMA))
+        self.assertEqual(df["run_number"].tolist(), [801, 802, 801, 802])
+        self.assertEqual(str(df["run_number"].dtype), "Int32")
+        self.assertEqual(str(df["route_name"].dtype), "category")
+        self.assertEqual(
+            list(df["next_station_name"].cat.categories), ["Howard", "Belmont"]
+        )
+        self.assertEqual(
+            df["predicted_arrival"].iloc[0], pd.Timestamp("2026-02-27T14:03:40")
+        )
+        self.assertEqual(
+            df["ingestion_timestamp"].iloc[0],
+            pd.Timestamp("2026-02-27T20:03:15", tz="UTC"),
+        )
+        self.assertFalse(df["is_delayed"].iloc[0])
+        self.assertTrue(df["error_number"].isna().all())
+
+    def test_append_snapshot_single_train_object(self):
+        """Tests a route with a single train returned as a bare object is handled."""
+        # Arrange
+        columns = TrainRecordColumns()
+        snapshot = build_snapshot(
+            timestamp="2026-02-27T20:03:15+00:00", trains=build_train("801", "Howard")
+        )
+
+        # Act
+        columns.append_snapshot(snapshot)
+
+        # Assert
+        self.assertEqual(columns.to_dataframe()["run_number"].tolist(), [801])
+
+    def test_append_snapshot_rolls_back_malformed_snapshot(self):
+        """Tests a malformed snapshot leaves no partially appended rows."""
+        # Arrange
+        columns = TrainRecordColumns()
+        snapshot = build_snapshot(
+            timestamp="2026-02-27T20:03:15+00:00",
+            trains=[build_train("801", "Howard"), "not a train"],
+        )
+
+        # Act + Assert
+        with self.assertRaises(AttributeError):
+            columns.append_snapshot(snapshot)
+        self.assertEqual(len(columns), 0)
+        self.assertTrue(all(len(column) == 0 for column in columns.columns.values()))
+
+    def test_to_dataframe_empty(self):
+        """Tests an empty accumulator produces an empty DataFrame with all columns."""
+        # Act
+        df = TrainRecordColumns().to_dataframe()
+
+        # Assert
+        self.assertTrue(df.empty)
+        self.assertEqual(list(df.columns), list(TRAIN_RECORD_SCHEMA))
+
+
+class TestGetSnapshotParser(unittest.TestCase):
+    """Class for testing get_snapshot_parser function."""
+
+    def test_backends_produce_identical_columns(self):
+        """Tests every installed backend decodes lines into the same records."""
+        # Arrange
+        snapshot = build_snapshot(
+            timestamp="2026-02-27T20:03:15+00:00",
+            trains=[build_train("801", "Howard"), build_train("802", "Belmont")],
+        )
+        single_train_snapshot = build_snapshot(
+            timestamp="2026-02-27T20:04:15+00:00", trains=build_train("803", "Clark")
+        )
+        lines = [
+            json.dumps(snapshot).encode(),
+            json.dumps(single_train_snapshot).encode(),
+        ]
+        expected = None
+
+        for backend in ["json", "orjson", "msgspec"]:
+            with self.subTest(backend=backend):
+                try:
+                    parser = get_snapshot_parser(backend)
+                except ValueError:
+                    self.skipTest(f"{backend} is not installed")
+                columns = TrainRecordColumns()
+
+                # Act
+                for line in lines:
+                    columns.append_snapshot(parser.decode(line))
+                df = columns.to_dataframe()
+
+                # Assert
+                self.assertEqual(parser.name, backend)
+                self.assertEqual(df["run_number"].tolist(), [801, 802, 803])
+                if expected is None:
+                    expected = df
+                pd.testing.assert_frame_equal(df, expected)
+
+    def test_backends_raise_declared_errors(self):
+        """Tests malformed lines raise one of the backend's declared error types."""
+        for backend in ["json", "orjson", "msgspec"]:
+            with self.subTest(backend=backend):
+                try:
+                    parser = get_snapshot_parser(backend)
+                except ValueError:
+                    self.skipTest(f"{backend} is not installed")
+
+                # Act + Assert
+                with self.assertRaises(parser.errors):
+                    parser.decode(b"{not json")
+
+    def test_auto_backend(self):
+        """Tests the auto backend resolves to an installed backend."""
+        # Act
+        parser = get_snapshot_parser("auto")
+
+        # Assert
+        self.assertIn(parser.name, ["json", "orjson", "msgspec"])
+
+    def test_unknown_backend(self):
+        """Tests an unknown backend raises an error."""
+        # Act + Assert
+        with self.assertRaises(ValueError):
+            get_snapshot_parser("simdjson")
+
+
+class TestIterPartitionSnapshots(unittest.TestCase):
+    """Class for testing iter_partition_snapshots function."""
+
+    @patch("lambdas.process_raw_cta_data.main.read_s3_partition")
+    def test_iter_partition_snapshots_skips_bad_lines(self, mock_read):
+        """Tests malformed lines are skipped and valid snapshots are parsed."""
+        # Arrange
+        snapshot = build_snapshot(
+            timestamp="2026-02-27T20:03:15+00:00",
+            trains=[build_train("801", "Howard"), build_train("802", "Belmont")],
+        )
+        mock_read.return_value = iter(
+            [("key1", io.BytesIO(gzip_lines([json.dumps(snapshot), "{not json"])))]
+        )
+
+        # Act
+        snapshots = list(
+            iter_partition_snapshots(
+                "bucket", "prefix/", parser=get_snapshot_parser("json")
+            )
+        )
+
+        # Assert
+        self.assertEqual(snapshots, [snapshot])
+
+    @patch("lambdas.process_raw_cta_data.main.read_s3_partition")
+    def test_iter_partition_snapshots_skips_corrupt_files(self, mock_read):
+        """Tests a file that is not valid gzip does not stop later files."""
+        # Arrange
+        snapshot = build_snapshot(
+            timestamp="2026-02-27T20:03:15+00:00", trains=[build_train("801", "Howard")]
+        )
+        mock_read.return_value = iter(
+            [
+                ("key1", io.BytesIO(b"not gzip")),
+                ("key2", io.BytesIO(gzip_lines([json.dumps(snapshot)]))),
+            ]
+        )
+
+        # Act
+        snapshots = list(
+            iter_partition_snapshots(
+                "bucket", "prefix/", parser=get_snapshot_parser("json")
+            )
+        )
+
+        # Assert
+        self.assertEqual(snapshots, [snapshot])
+
+    @patch("lambdas.process_raw_cta_data.main.read_s3_partition")
+    def test_iter_partition_snapshots_decodes_delta_snapshots(self, mock_read):
+        """Tests delta-encoded snapshots are rebuilt, across files, as full snapshots."""
+        # Arrange
+        snapshots = [
+            build_snapshot(
+                timestamp=f"2026-02-27T20:0{minute}:15+00:00",
+                trains=[
+                    build_train("801", station),
+                    build_train("802", "Belmont"),
+                ],
+            )
+            for minute, station in enumerate(["Howard", "Howard", "Jarvis", "Morse"])
+        ]
+        encoder = SnapshotDeltaEncoder(keyframe_interval=3)
+        lines = [json.dumps(encoder.encode(snapshot)) for snapshot in snapshots]
+        orphan = SnapshotDeltaEncoder()
+        orphan.encode(snapshots[0])
+        mock_read.return_value = iter(
+            [
+                ("key1", io.BytesIO(gzip_lines(lines[:2]))),
+                ("key2", io.BytesIO(gzip_lines(lines[2:]))),
+                # A delta whose keyframe was never read cannot be rebuilt
+                (
+                    "key3",
+                    io.BytesIO(gzip_lines([json.dumps(orphan.encode(snapshots[1]))])),
+                ),
+            ]
+        )
+
+        # Act
+        decoded = list(
+            iter_partition_snapshots(
+                "bucket", "prefix/", parser=get_snapshot_parser("json")
+            )
+        )
+
+        # Assert
+        self.assertEqual(len(decoded), 4)
+        for decoded_snapshot, snapshot in zip(decoded, snapshots):
+            columns = [TrainRecordColumns(), TrainRecordColumns()]
+            columns[0].append_snapshot(decoded_snapshot)
+            columns[1].append_snapshot(snapshot)
+            pd.testing.assert_frame_equal(
+                columns[0].to_dataframe(), columns[1].to_dataframe()
+            )
+
+
+class TestExtractCtaDataFromS3(unittest.TestCase):
+    """Class for testing extract_cta_data_from_s3 function."""
+
+    @patch("lambdas.process_raw_cta_data.main.read_s3_partition")
+    def test_extract_cta_data_from_s3(self, mock_read):
+        """Tests streamed records are collected into a DataFrame."""
+        # Arrange
+        snapshot = build_snapshot(
+            timestamp="2026-02-27T20:03:15+00:00",
+            trains=[build_train("801", "Howard"), build_train("802", "Belmont")],
+        )
+        mock_read.return_value = iter(
+            [("key1", io.BytesIO(gzip_lines([json.dumps(snapshot)] * 3)))]
+        )
+
+        # Act
+        df = extract_cta_data_from_s3(bucket_name="bucket", partition_path="prefix/")
+
+        # Assert
+        self.assertEqual(len(df), 6)
+        self.assertEqual(sorted(df["run_number"].unique()), [801, 802])
+
+    @patch("lambdas.process_raw_cta_data.main.read_s3_partition")
+    def test_extract_cta_data_from_s3_no_files(self, mock_read):
+        """Tests an empty partition returns an empty DataFrame."""
+        # Arrange
+        mock_read.return_value = iter([])
+
+        # Act
+        df = extract_cta_data_from_s3(bucket_name="bucket", partition_path="prefix/")
+
+        # Assert
+        self.assertTrue(df.empty)
+
+
+class TestExtractNewCtaDataFromS3(unittest.TestCase):
+    """Class for testing extract_new_cta_data_from_s3 function."""
+
+    @patch("lambdas.process_raw_cta_data.main.boto3.client")
+    def test_extract_new_cta_data_stops_at_failed_download(self, mock_client):
+        """Tests the watermark stops before the first file that cannot be downloaded."""
+        # Arrange
+        snapshot = build_snapshot(
+            timestamp="2026-02-27T20:03:15+00:00",
+            trains=[build_train("801", "Howard")],
+        )
+        mock_s3_client = MagicMock()
+        mock_client.return_value = mock_s3_client
+        mock_s3_client.get_paginator.return_value.paginate.return_value = [
+            {
+                "Contents": [
+                    {"Key": "prefix/file1.gz"},
+                    {"Key": "prefix/file2.gz"},
+                    {"Key": "prefix/file3.gz"},
+                ]
+            }
+        ]
+        responses = {
+            "prefix/file1.gz": {"Body": io.BytesIO(gzip_lines([json.dumps(snapshot)]))},
+            "prefix/file2.gz": botocore.exceptions.ClientError(
+                error_response={"Error": {"Code": "SlowDown", "Message": "Slow"}},
+                operation_name="GetObject",
+            ),
+            "prefix/file3.gz": {"Body": io.BytesIO(gzip_lines([json.dumps(snapshot)]))},
+        }
+
+        def get_object(Bucket, Key):
+            if isinstance(responses[Key], Exception):
+                raise responses[Key]
+            return responses[Key]
+
+        mock_s3_client.get_object.side_effect = get_object
+
+        # Act
+        df, watermark = extract_new_cta_data_from_s3(
+            bucket_name="bucket", partition_paths=["prefix/"], watermark=None
+        )
+
+        # Assert
+        self.assertEqual(watermark, "prefix/file1.gz")
+        self.assertEqual(len(df), 1)
+
+    @patch("lambdas.process_raw_cta_data.main.boto3.client")
+    def test_extract_new_cta_data_raises_on_listing_error(self, mock_client):
+        """Tests a failed listing raises instead of moving the watermark past it."""
+        # Arrange
+        mock_s3_client = MagicMock()
+        mock_client.return_value = mock_s3_client
+        mock_s3_client.get_paginator.return_value.paginate.side_effect = (
+            botocore.exceptions.ClientError(
+                error_response={"Error": {"Code": "AccessDenied", "Message": "Denied"}},
+                operation_name="ListObjectsV2",
+            )
+        )
+
+        # Act + Assert
+        with self.assertRaises(botocore.exceptions.ClientError):
+            extract_new_cta_data_from_s3(
+                bucket_name="bucket",
+                partition_paths=["prefix/day=27/", "prefix/day=28/"],
+                watermark="prefix/day=27/file1.gz",
+            )
+        mock_s3_client.get_object.assert_not_called()
+
+
+def build_locations(rows: list[tuple]) -> pd.DataFrame:
+    """Builds flattened train locations from (route, run, ingested, station, arrival)."""
+    return pd.DataFrame(
+        {
+            "ingestion_timestamp": pd.to_datetime([row[2] for row in rows], utc=True),
+            "route_name": pd.Categorical([row[0] for row in rows]),
+            "run_number": pd.array([row[1] for row in rows], dtype="Int32"),
+            "train_direction": pd.array([1] * len(rows), dtype="Int32"),
+            "next_stop_id": pd.array([30000] * len(rows), dtype="Int32"),
+            "next_station_name": pd.Categorical([row[3] for row in rows]),
+            "predicted_arrival": pd.to_datetime(
+                [row[4] for row in rows], format="ISO8601"
+            ),
+        }
+    )
+
+
+class TestWriteDfToS3(unittest.TestCase):
+    """Class for testing write_df_to_s3 and write_train_locations_to_s3 functions."""
+
+    @patch("lambdas.process_raw_cta_data.main.get_db_connection")
+    def test_write_df_to_s3_single_file(self, mock_get_conn):
+        """Tests an unpartitioned frame is written as one zstd Parquet file."""
+        # Arrange
+        df = pd.DataFrame({"a": [1]})
+
+        # Act
+        write_df_to_s3(df=df, bucket_name="bucket", key="out/file.parquet")
+
+        # Assert
+        mock_get_conn.return_value.register.assert_called_once_with("write_input", df)
+        mock_get_conn.return_value.unregister.assert_called_once_with("write_input")
+        query = mock_get_conn.return_value.execute.call_args.args[0]
+        self.assertIn("TO 's3://bucket/out/file.parquet'", query)
+        self.assertIn("COMPRESSION ZSTD", query)
+        self.assertNotIn("PARTITION_BY", query)
+
+    @patch("lambdas.process_raw_cta_data.main.get_db_connection")
+    def test_write_df_to_s3_unregisters_on_failure(self, mock_get_conn):
+        """Tests the registered frame is released even if the write fails."""
+        # Arrange
+        mock_get_conn.return_value.execute.side_effect = duckdb.IOException("denied")
+
+        # Act & Assert
+        with self.assertRaises(duckdb.IOException):
+            write_df_to_s3(
+                df=pd.DataFrame({"a": [1]}), bucket_name="bucket", key="file.parquet"
+            )
+        mock_get_conn.return_value.unregister.assert_called_once_with("write_input")
+
+    @patch("lambdas.process_raw_cta_data.main.get_db_connection")
+    def test_write_train_locations_to_s3_partitions(self, mock_get_conn):
+        """Tests train locations are written partitioned by service day and route."""
+        # Arrange
+        con = duckdb.connect(database=":memory:")
+        output_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(output_dir.cleanup)
+        # Redirect the S3 output to a local directory
+        mock_get_conn.return_value.register.side_effect = con.register
+        mock_get_conn.return_value.unregister.side_effect = con.unregister
+        mock_get_conn.return_value.execute.side_effect = lambda query: con.execute(
+            query.replace("s3://bucket", output_dir.name)
+        )
+        df = build_locations(
+            [
+                ("red", 802, "2026-02-27T14:00", "Howard", "2026-02-27T08:05"),
+                ("red", 801, "2026-02-27T14:01", "Belmont", "2026-02-27T08:03"),
+                ("red", 801, "2026-02-27T14:00", "Addison", "2026-02-27T08:01"),
+                ("blue", 801, "2026-02-27T14:00", "Clark", "2026-02-27T08:02"),
+                ("red", 803, "2026-02-28T09:00", "Howard", "2026-02-28T03:05"),
+            ]
+        ).assign(
+            current_timestamp=lambda df: (
+                df["predicted_arrival"] - pd.Timedelta(minutes=1)
+            )
+        )
+
+        # Act
+        write_train_locations_to_s3(df=df, bucket_name="bucket")
+
+        # Assert
+        root = pathlib.Path(output_dir.name, "train_locations")
+        files = sorted(str(path.relative_to(root)) for path in root.rglob("*.parquet"))
+        self.assertEqual(
+            files,
+            [
+                "service_date=2026-02-27/route_name=blue/data_0.parquet",
+                "service_date=2026-02-27/route_name=red/data_0.parquet",
+            ],
+        )
+        red = con.execute(
+            f"SELECT run_number, next_station_name FROM '{root}/service_date=2026-02-27/route_name=red/data_0.parquet'"
+        ).fetchall()
+        self.assertEqual(
+            red, [(801, "Addison"), (801, "Belmont"), (802, "Howard"), (803, "Howard")]
+        )
+        compression = con.execute(
+            f"SELECT DISTINCT compression FROM parquet_metadata('{root}/**/*.parquet')"
+        ).fetchall()
+        self.assertEqual(compression, [("ZSTD",)])
+
+
+class TestInferActualArrivals(unittest.TestCase):
+    """Class for testing infer_actual_arrivals function."""
+
+    def test_infer_actual_arrivals_station_transitions(self):
+        """Tests the last snapshot before each station change is kept as the arrival."""
+        # Arrange
+        # Rows are deliberately out of order and interleave two runs and two routes
+        df = build_locations(
+            [
+                ("red", 801, "2026-02-27T14:02", "Belmont", "2026-02-27T08:03"),
+                ("red", 801, "2026-02-27T14:00", "Addison", "2026-02-27T08:01"),
+                ("red", 802, "2026-02-27T14:00", "Howard", "2026-02-27T08:05"),
+                ("red", 801, "2026-02-27T14:01", "Addison", "2026-02-27T08:01:30"),
+                ("blue", 801, "2026-02-27T14:00", "Clark", "2026-02-27T08:02"),
+                ("red", 801, "2026-02-27T14:03", "Belmont", "2026-02-27T08:03:10"),
+            ]
+        )
+
+        # Act
+        arrivals = infer_actual_arrivals(df)
+
+        # Assert
+        self.assertEqual(list(arrivals.columns), ACTUAL_ARRIVAL_COLUMNS)
+        self.assertEqual(
+            [
+                (
+                    row.route_name,
+                    row.run_number,
+                    row.station_name,
+                    str(row.arrival_time),
+                )
+                for row in arrivals.itertuples()
+            ],
+            [
+                ("blue", 801, "Clark", "2026-02-27 08:02:00"),
+                ("red", 801, "Addison", "2026-02-27 08:01:30"),
+                ("red", 801, "Belmont", "2026-02-27 08:03:10"),
+                ("red", 802, "Howard", "2026-02-27 08:05:00"),
+            ],
+        )
+
+    def test_infer_actual_arrivals_service_date(self):
+        """Tests arrivals shortly after midnight belong to the previous service day."""
+        # Arrange
+        df = build_locations(
+            [
+                ("red", 801, "2026-02-28T07:00", "Addison", "2026-02-28T01:00"),
+                ("red", 801, "2026-02-28T11:00", "Belmont", "2026-02-28T05:00"),
+            ]
+        )
+
+        # Act
+        arrivals = infer_actual_arrivals(df)
+
+        # Assert
+        self.assertEqual(
+            arrivals["service_date"].tolist(),
+            [datetime.date(2026, 2, 27), datetime.date(2026, 2, 28)],
+        )
+
+    def test_infer_actual_arrivals_null_station(self):
+        """Tests a snapshot followed by a missing station is kept, matching LEAD semantics."""
+        # Arrange
+        df = build_locations(
+            [
+                ("red", 801, "2026-02-27T14:00", "Addison", "2026-02-27T08:01"),
+                ("red", 801, "2026-02-27T14:01", None, "2026-02-27T08:02"),
+                ("red", 801, "2026-02-27T14:02", "Addison", "2026-02-27T08:03"),
+            ]
+        )
+
+        # Act
+        arrivals = infer_actual_arrivals(df)
+
+        # Assert
+        self.assertEqual(
+            arrivals["arrival_time"].astype(str).tolist(),
+            ["2026-02-27 08:01:00", "2026-02-27 08:03:00"],
+        )
+
+    def test_infer_actual_arrivals_empty(self):
+        """Tests an empty input returns an empty result with the output columns and types."""
+        # Act
+        arrivals = infer_actual_arrivals(pd.DataFrame())
+
+        # Assert
+        self.assertTrue(arrivals.empty)
+        self.assertEqual(list(arrivals.columns), ACTUAL_ARRIVAL_COLUMNS)
+        for column in ["run_number", "train_direction", "stop_id"]:
+            self.assertEqual(arrivals[column].dtype, "Int32")
+        for column in ["route_name", "station_name"]:
+            self.assertIsInstance(arrivals[column].dtype, pd.CategoricalDtype)
+        self.assertTrue(pd.api.types.is_datetime64_dtype(arrivals["arrival_time"]))
+
+
+class TestInferActualArrivalsIncremental(unittest.TestCase):
+    """Class for testing infer_actual_arrivals_incremental function."""
+
+    def test_incremental_batches_match_full_inference(self):
+        """Tests carrying run state across batches matches inference over all data."""
+        # Arrange
+        stations = ["Addison", "Belmont", "Fullerton"]
+        rows = [
+            (
+                route,
+                run,
+                f"2026-02-27T14:{minute:02d}",
+                stations[(minute + run) // 3 % 3],
+                f"2026-02-27T08:{minute:02d}:30",
+            )
+            for minute in range(12)
+            for route in ["red", "blue"]
+            for run in [801, 802]
+        ]
+        df = build_locations(rows)
+        expected = infer_actual_arrivals(df)
+        run_state = pd.DataFrame(columns=RUN_STATE_COLUMNS)
+        confirmed = []
+
+        # Act
+        for start in range(0, len(df), 10):
+            arrivals, run_state = infer_actual_arrivals_incremental(
+                df=df.iloc[start : start + 10],
+                run_state=run_state,
+                run_state_ttl=pd.Timedelta(days=1),
+            )
+            confirmed.append(arrivals)
+
+        # Assert
+        def as_rows(arrivals):
+            return sorted(
+                (str(r.route_name), int(r.run_number), str(r.arrival_time))
+                for r in arrivals.itertuples()
+            )
+
+        # Runs still pending at the end arrived at their final station
+        self.assertEqual(len(run_state), 4)
+        self.assertEqual(as_rows(pd.concat(confirmed + [run_state])), as_rows(expected))
+
+    def test_incremental_keeps_last_station_pending(self):
+        """Tests the last station of a run is carried over rather than emitted."""
+        # Arrange
+        df = build_locations(
+            [
+                ("red", 801, "2026-02-27T14:00", "Addison", "2026-02-27T08:01"),
+                ("red", 801, "2026-02-27T14:01", "Belmont", "2026-02-27T08:03"),
+            ]
+        )
+
+        # Act
+        arrivals, run_state = infer_actual_arrivals_incremental(
+            df=df, run_state=pd.DataFrame(columns=RUN_STATE_COLUMNS)
+        )
+
+        # Assert
+        self.assertEqual(arrivals["station_name"].tolist(), ["Addison"])
+        self.assertEqual(list(run_state.columns), RUN_STATE_COLUMNS)
+        self.assertEqual(run_state["station_name"].tolist(), ["Belmont"])
+
+    def test_incremental_expires_stale_runs(self):
+        """Tests a run unseen for longer than the TTL is confirmed at its last station."""
+        # Arrange
+        df = build_locations(
+            [
+                ("red", 801, "2026-02-27T14:00", "Addison", "2026-02-27T08:01"),
+                ("red", 802, "2026-02-27T15:00", "Howard", "2026-02-27T09:01"),
+            ]
+        )
+
+        # Act
+        arrivals, run_state = infer_actual_arrivals_incremental(
+            df=df,
+            run_state=pd.DataFrame(columns=RUN_STATE_COLUMNS),
+            run_state_ttl=pd.Timedelta(minutes=30),
+        )
+
+        # Assert
+        self.assertEqual(arrivals["run_number"].tolist(), [801])
+        self.assertEqual(run_state["run_number"].tolist(), [802])
+
+
+class TestProcessingState(unittest.TestCase):
+    """Class for testing load_processing_state and save_processing_state functions."""
+
+    @patch("lambdas.process_raw_cta_data.main.boto3.client")
+    def test_processing_state_round_trip(self, mock_client):
+        """Tests a saved watermark and run state can be loaded back."""
+        # Arrange
+        df = build_locations(
+            [("red", 801, "2026-02-27T14:00", "Addison", "2026-02-27T08:01")]
+        )
+        _, run_state = infer_actual_arrivals_incremental(
+            df=df, run_state=pd.DataFrame(columns=RUN_STATE_COLUMNS)
+        )
+
+        # Act
+        save_processing_state(
+            bucket_name="bucket", watermark="raw/key1", run_state=run_state
+        )
+        body = mock_client.return_value.put_object.call_args.kwargs["Body"]
+        mock_client.return_value.get_object.return_value = {
+            "Body": io.BytesIO(body.encode())
+        }
+        watermark, loaded_run_state = load_processing_state(bucket_name="bucket")
+
+        # Assert
+        mock_client.return_value.put_object.assert_called_once_with(
+            Bucket="bucket", Key=PROCESSING_STATE_KEY, Body=body
+        )
+        self.assertEqual(watermark, "raw/key1")
+        self.assertEqual(loaded_run_state["run_number"].tolist(), [801])
+        self.assertEqual(loaded_run_state["station_name"].tolist(), ["Addison"])
+        self.assertEqual(
+            loaded_run_state["arrival_time"].iloc[0], pd.Timestamp("2026-02-27T08:01")
+        )
+        self.assertEqual(
+            loaded_run_state["ingestion_timestamp"].iloc[0],
+            pd.Timestamp("2026-02-27T14:00", tz="UTC"),
+        )
+
+    @patch("lambdas.process_raw_cta_data.main.boto3.client")
+    def test_load_processing_state_missing(self, mock_client):
+        """Tests a missing state object starts from scratch."""
+        # Arrange
+        mock_client.return_value.get_object.side_effect = (
+            botocore.exceptions.ClientError(
+                error_response={"Error": {"Code": "NoSuchKey", "Message": "Missing"}},
+                operation_name="GetObject",
+            )
+        )
+
+        # Act
+        watermark, run_state = load_processing_state(bucket_name="bucket")
+
+        # Assert
+        self.assertIsNone(watermark)
+        self.assertTrue(run_state.empty)
+
+
+class TestProcessNewTrainLocations(unittest.TestCase):
+    """Class for testing process_new_train_locations function."""
+
+    @patch("lambdas.process_raw_cta_data.main.save_snapshot_decoder")
+    @patch("lambdas.process_raw_cta_data.main.load_snapshot_decoder")
+    @patch("lambdas.process_raw_cta_data.main.save_processing_state")
+    @patch("lambdas.process_raw_cta_data.main.write_df_to_s3")
+    @patch("lambdas.process_raw_cta_data.main.extract_new_cta_data_from_s3")
+    @patch("lambdas.process_raw_cta_data.main.load_processing_state")
+    def test_process_new_train_locations(
+        self,
+        mock_load,
+        mock_extract,
+        mock_write,
+        mock_save,
+        mock_load_decoder,
+        mock_save_decoder,
+    ):
+        """Tests new files after the watermark are processed and the state advanced."""
+        # Arrange
+        watermark = "raw-api-data/success/year=2026/month=02/day=26/file-1.gz"
+        mock_load.return_value = (watermark, pd.DataFrame(columns=RUN_STATE_COLUMNS))
+        df = build_locations(
+            [
+                ("red", 801, "2026-02-28T14:00", "Addison", "2026-02-28T08:01"),
+                ("red", 801, "2026-02-28T14:01", "Belmont", "2026-02-28T08:03"),
+            ]
+        )
+        new_watermark = "raw-api-data/success/year=2026/month=02/day=28/file-9.gz"
+        mock_extract.return_value = (df, new_watermark)
+
+        # Act
+        result = process_new_train_locations(
+            bucket_name="bucket", today_date=datetime.date(2026, 2, 28)
+        )
+
+        # Assert
+        self.assertEqual(result["arrivals"], 1)
+        mock_extract.assert_called_once_with(
+            bucket_name="bucket",
+            partition_paths=[
+                "raw-api-data/success/year=2026/month=02/day=26/",
+                "raw-api-data/success/year=2026/month=02/day=27/",
+                "raw-api-data/success/year=2026/month=02/day=28/",
+            ],
+            watermark=watermark,
+            decoder=mock_load_decoder.return_value,
+        )
+        mock_save_decoder.assert_called_once_with(
+            bucket_name="bucket", decoder=mock_load_decoder.return_value
+        )
+        self.assertEqual(
+            mock_write.call_args.kwargs["key"],
+            "actual_arrivals/service_date=2026-02-28/file-9.parquet",
+        )
+        self.assertEqual(mock_save.call_args.kwargs["watermark"], new_watermark)
+        self.assertEqual(
+            mock_save.call_args.kwargs["run_state"]["station_name"].tolist(),
+            ["Belmont"],
+        )
+
+    @patch("lambdas.process_raw_cta_data.main.load_snapshot_decoder")
+    @patch("lambdas.process_raw_cta_data.main.save_processing_state")
+    @patch("lambdas.process_raw_cta_data.main.extract_new_cta_data_from_s3")
+    @patch("lambdas.process_raw_cta_data.main.load_processing_state")
+    def test_process_new_train_locations_no_new_files(
+        self, mock_load, mock_extract, mock_save, mock_load_decoder
+    ):
+        """Tests nothing is written when there are no new files."""
+        # Arrange
+        mock_load.return_value = ("key", pd.DataFrame(columns=RUN_STATE_COLUMNS))
+        mock_extract.return_value = (pd.DataFrame(), "key")
+
+        # Act
+        result = process_new_train_locations(
+            bucket_name="bucket", today_date=datetime.date(2026, 2, 28)
+        )
+
+        # Assert
+        self.assertEqual(result["arrivals"], 0)
+        mock_save.assert_not_called()
+
+
+class TestHandler(unittest.TestCase):
+    """Class for testing handler function in full mode."""
+
+    @patch.dict("os.environ", {"ACCOUNT_NUMBER": "123456789012"})
+    @patch("lambdas.process_raw_cta_data.main.write_df_to_s3")
+    @patch("lambdas.process_raw_cta_data.main.write_train_locations_to_s3")
+    @patch("lambdas.process_raw_cta_data.main.extract_cta_data_from_s3")
+    @patch("lambdas.process_raw_cta_data.main.dotenv.load_dotenv")
+    def test_handler_no_arrivals_skips_write(
+        self, mock_load_dotenv, mock_extract, mock_write_locations, mock_write
+    ):
+        """Tests a service day without arrivals does not write an arrivals file."""
+        # Arrange
+        mock_extract.return_value = TrainRecordColumns().to_dataframe()
+
+        # Act
+        result = handler({"mode": "full"}, MagicMock())
+
+        # Assert
+        self.assertEqual(result["status"], "success")
+        mock_write_locations.assert_called_once()
+        mock_write.assert_not_called()
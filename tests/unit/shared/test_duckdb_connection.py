@@ -0,0 +1,71 @@
+"""Module for testing duckdb_connection.py in shared lambda code."""
+
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from lambdas.shared.duckdb_connection import (
+    DOWNLOADED_EXTENSION_DIRECTORY,
+    get_db_connection,
+)
+
+
+class TestGetDbConnection(unittest.TestCase):
+    """Class for testing get_db_connection function."""
+
+    @patch("lambdas.shared.duckdb_connection._db_connection", None)
+    @patch.dict("os.environ", {"DUCKDB_EXTENSION_DIRECTORY": "/does/not/exist"})
+    @patch("lambdas.shared.duckdb_connection.duckdb.connect")
+    def test_get_db_connection_installs_extensions(self, mock_connect):
+        """Tests httpfs is installed to /tmp when it is not bundled."""
+        # Act
+        result = get_db_connection()
+
+        # Assert
+        mock_connect.assert_called_once_with(database=":memory:")
+        mock_con = mock_connect.return_value
+        mock_con.execute.assert_any_call(
+            f"SET extension_directory='{DOWNLOADED_EXTENSION_DIRECTORY}';"
+        )
+        mock_con.execute.assert_any_call("INSTALL httpfs;")
+        mock_con.execute.assert_any_call("LOAD httpfs;")
+        args, _ = mock_con.execute.call_args
+        self.assertIn("CREATE OR REPLACE SECRET", args[0])
+        self.assertEqual(result, mock_con)
+
+    @patch("lambdas.shared.duckdb_connection._db_connection", None)
+    @patch("lambdas.shared.duckdb_connection.duckdb.connect")
+    def test_get_db_connection_loads_bundled_extensions(self, mock_connect):
+        """Tests a bundled httpfs is loaded without installing it."""
+        # Arrange
+        extension_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(extension_directory.cleanup)
+
+        # Act
+        with patch.dict(
+            "os.environ", {"DUCKDB_EXTENSION_DIRECTORY": extension_directory.name}
+        ):
+            get_db_connection()
+
+        # Assert
+        mock_con = mock_connect.return_value
+        mock_con.execute.assert_any_call(
+            f"SET extension_directory='{extension_directory.name}';"
+        )
+        mock_con.execute.assert_any_call("LOAD httpfs;")
+        self.assertNotIn(
+            "INSTALL httpfs;",
+            [call.args[0] for call in mock_con.execute.call_args_list],
+        )
+
+    @patch("lambdas.shared.duckdb_connection._db_connection", None)
+    @patch("lambdas.shared.duckdb_connection.duckdb.connect")
+    def test_get_db_connection_reused(self, mock_connect):
+        """Tests the connection is created once and then reused."""
+        # Act
+        first = get_db_connection()
+        second = get_db_connection()
+
+        # Assert
+        mock_connect.assert_called_once_with(database=":memory:")
+        self.assertIs(first, second)
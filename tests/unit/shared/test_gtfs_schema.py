@@ -0,0 +1,75 @@
+"""Module for testing gtfs_schema.py in shared lambda code."""
+
+import unittest
+
+import duckdb
+
+from lambdas.shared.gtfs_schema import (
+    GTFS_TABLE_SCHEMAS,
+    build_gtfs_select_list,
+    gtfs_time_to_seconds_sql,
+    seconds_to_gtfs_time_sql,
+)
+
+
+class TestGtfsSchema(unittest.TestCase):
+    """Class for testing the GTFS schema SQL builders."""
+
+    def setUp(self):
+        self.con = duckdb.connect()
+
+    def tearDown(self):
+        self.con.close()
+
+    def test_gtfs_time_round_trip(self):
+        """Tests GTFS times parse to seconds and format back, including past 24 hours."""
+        # Arrange
+        times = ["05:30:00", " 9:05:07", "24:10:30"]
+
+        for time_text in times:
+            with self.subTest(time_text=time_text):
+                # Act
+                seconds, formatted = self.con.execute(
+                    f"SELECT {gtfs_time_to_seconds_sql('$time')}, "
+                    f"{seconds_to_gtfs_time_sql(gtfs_time_to_seconds_sql('$time'))}",
+                    {"time": time_text},
+                ).fetchone()
+
+                # Assert
+                hours, minutes, secs = (int(part) for part in time_text.split(":"))
+                self.assertEqual(seconds, hours * 3600 + minutes * 60 + secs)
+                self.assertEqual(formatted, f"{hours:02d}:{minutes:02d}:{secs:02d}")
+
+    def test_build_gtfs_select_list_types_columns(self):
+        """Tests text columns are cast to the declared types in declared order."""
+        # Arrange
+        self.con.execute("""
+            CREATE TABLE stop_times_text AS SELECT * FROM (VALUES
+                ('trip_1', '25:01:00', '25:01:30', '30001', '1', 'extra')
+            ) t(trip_id, arrival_time, departure_time, stop_id, stop_sequence, extra)
+        """)
+        source_columns = [
+            "trip_id",
+            "arrival_time",
+            "departure_time",
+            "stop_id",
+            "stop_sequence",
+            "extra",
+        ]
+
+        # Act
+        select_list = build_gtfs_select_list(
+            table="stop_times", source_columns=source_columns
+        )
+        relation = self.con.sql(f"SELECT {select_list} FROM stop_times_text")
+
+        # Assert
+        self.assertEqual(relation.columns, list(GTFS_TABLE_SCHEMAS["stop_times"]))
+        types = dict(zip(relation.columns, (str(t) for t in relation.types)))
+        self.assertEqual(types["arrival_time"], "INTEGER")
+        self.assertEqual(types["stop_id"], "INTEGER")
+        self.assertEqual(types["shape_dist_traveled"], "DOUBLE")
+        row = dict(zip(relation.columns, relation.fetchone()))
+        self.assertEqual(row["arrival_time"], 90060)
+        self.assertEqual(row["stop_id"], 30001)
+        self.assertIsNone(row["stop_headsign"])
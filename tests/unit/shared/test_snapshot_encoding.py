@@ -0,0 +1,186 @@
+"""Module for testing snapshot_encoding.py in shared lambda code."""
+
+import datetime
+import json
+import unittest
+
+from lambdas.shared.snapshot_encoding import SnapshotDecoder, SnapshotDeltaEncoder
+
+
+def build_snapshot(minute: int, trains: dict[str, list[dict]]) -> dict:
+    """Builds a snapshot with one API response per route."""
+    return {
+        "timestamp": f"2026-02-27T20:{minute:02d}:15+00:00",
+        "data": [
+            {
+                "ctatt": {
+                    "tmst": f"2026-02-27T14:{minute:02d}:12",
+                    "errCd": "0",
+                    "errNm": None,
+                    "route": [{"@name": route_name, "train": route_trains}],
+                }
+            }
+            for route_name, route_trains in trains.items()
+        ],
+    }
+
+
+def build_train(run_number: str, next_station_name: str, minute: int) -> dict:
+    """Builds a single train entry as returned by the CTA API."""
+    return {
+        "rn": run_number,
+        "destSt": "30173",
+        "destNm": "Howard",
+        "trDr": "1",
+        "nextStaNm": next_station_name,
+        "arrT": f"2026-02-27T14:{minute:02d}:40",
+        "lat": "41.97",
+    }
+
+
+class TestSnapshotDeltaEncoding(unittest.TestCase):
+    """Class for testing SnapshotDeltaEncoder and SnapshotDecoder classes."""
+
+    def setUp(self):
+        self.snapshots = [
+            build_snapshot(0, {"red": [build_train("801", "Howard", 0)]}),
+            build_snapshot(
+                1,
+                {
+                    "red": [
+                        build_train("801", "Howard", 1),
+                        build_train("802", "Belmont", 1),
+                    ],
+                    "y": [build_train("601", "Dempster", 1)],
+                },
+            ),
+            build_snapshot(2, {"red": [build_train("802", "Addison", 2)]}),
+            build_snapshot(3, {"red": [build_train("802", "Sheridan", 3)]}),
+        ]
+
+    def test_round_trip(self):
+        """Tests decoding the encoded snapshots gives back the full snapshots."""
+        # Arrange
+        encoder = SnapshotDeltaEncoder(keyframe_interval=3)
+        decoder = SnapshotDecoder()
+
+        # Act
+        encoded = [
+            json.loads(json.dumps(encoder.encode(snapshot)))
+            for snapshot in self.snapshots
+        ]
+        decoded = [decoder.decode(snapshot) for snapshot in encoded]
+
+        # Assert
+        self.assertEqual(
+            [snapshot.get("keyframe", False) for snapshot in encoded],
+            [True, False, False, True],
+        )
+        for decoded_snapshot, snapshot in zip(decoded, self.snapshots):
+            self.assertEqual(decoded_snapshot["data"], snapshot["data"])
+
+    def test_delta_holds_only_changed_fields(self):
+        """Tests a delta only repeats the fields that differ from the keyframe."""
+        # Arrange
+        encoder = SnapshotDeltaEncoder()
+        encoder.encode(self.snapshots[0])
+
+        # Act
+        delta = encoder.encode(self.snapshots[1])
+
+        # Assert
+        routes = [response["ctatt"]["route"][0] for response in delta["data"]]
+        self.assertNotIn("train", routes[0])
+        self.assertEqual(
+            routes[0]["trainDelta"],
+            [
+                {"rn": "801", "arrT": "2026-02-27T14:01:40"},
+                build_train("802", "Belmont", 1),
+            ],
+        )
+        self.assertEqual(delta["base"], 0)
+
+    def test_decoder_skips_delta_without_keyframe(self):
+        """Tests a delta whose keyframe has not been seen cannot be decoded."""
+        # Arrange
+        encoder = SnapshotDeltaEncoder()
+        encoder.encode(self.snapshots[0])
+
+        # Act
+        result = SnapshotDecoder().decode(encoder.encode(self.snapshots[1]))
+
+        # Assert
+        self.assertIsNone(result)
+
+    def test_decoder_keyframes_carry_over(self):
+        """Tests keyframes from one decoder let another decode later deltas."""
+        # Arrange
+        encoder = SnapshotDeltaEncoder()
+        first_decoder = SnapshotDecoder()
+        first_decoder.decode(encoder.encode(self.snapshots[0]))
+
+        # Act
+        keyframes = first_decoder.get_keyframes(max_age=datetime.timedelta(hours=1))
+        second_decoder = SnapshotDecoder(keyframes=json.loads(json.dumps(keyframes)))
+        result = second_decoder.decode(encoder.encode(self.snapshots[1]))
+
+        # Assert
+        self.assertEqual(result["data"], self.snapshots[1]["data"])
+
+    def test_get_keyframes_drops_finished_streams(self):
+        """Tests keyframes much older than the newest one are not carried over."""
+        # Arrange
+        decoder = SnapshotDecoder()
+        old_encoder = SnapshotDeltaEncoder()
+        decoder.decode(old_encoder.encode(self.snapshots[0]))
+        new_encoder = SnapshotDeltaEncoder()
+        decoder.decode(new_encoder.encode(self.snapshots[3]))
+
+        # Act
+        keyframes = decoder.get_keyframes(max_age=datetime.timedelta(minutes=2))
+
+        # Assert
+        self.assertEqual(
+            [keyframe["stream"] for keyframe in keyframes], [new_encoder.stream_id]
+        )
+
+    def test_decoder_decodes_delta_after_newer_keyframe(self):
+        """Tests a delta read after a newer keyframe of its stream still decodes."""
+        # Arrange
+        encoder = SnapshotDeltaEncoder(keyframe_interval=2)
+        encoded = [encoder.encode(snapshot) for snapshot in self.snapshots]
+        decoder = SnapshotDecoder()
+
+        # Act
+        # Keyframe 0, then keyframe 2 delivered before delta 1 based on keyframe 0
+        decoded = [decoder.decode(encoded[index]) for index in [0, 2, 1, 3]]
+
+        # Assert
+        self.assertEqual(
+            [encoded[index]["seq"] for index in [0, 2, 1, 3]], [0, 2, 1, 3]
+        )
+        self.assertEqual(encoded[1]["base"], 0)
+        self.assertEqual(decoded[2]["data"], self.snapshots[1]["data"])
+        self.assertEqual(decoded[3]["data"], self.snapshots[3]["data"])
+
+    def test_decoder_drops_oldest_keyframes(self):
+        """Tests only the newest keyframes of a stream are kept and carried over."""
+        # Arrange
+        encoder = SnapshotDeltaEncoder(keyframe_interval=1)
+        encoded = [encoder.encode(snapshot) for snapshot in self.snapshots]
+        decoder = SnapshotDecoder(max_keyframes_per_stream=2)
+        delta_on_first = {
+            **encoded[1],
+            "keyframe": False,
+            "base": 0,
+            "data": [],
+        }
+
+        # Act
+        for snapshot in [encoded[3], encoded[0], encoded[2]]:
+            decoder.decode(snapshot)
+        keyframes = decoder.get_keyframes(max_age=datetime.timedelta(hours=1))
+
+        # Assert
+        self.assertEqual([keyframe["seq"] for keyframe in keyframes], [2, 3])
+        self.assertIsNone(decoder.decode(delta_on_first))
@@ -1,23 +1,113 @@
 """Module for testing main.py in train_location_fetch lambda."""
 
+import asyncio
+import http.server
+import json
 import os
+import threading
+import time
 import unittest
+import urllib.parse
 from unittest.mock import MagicMock, patch
 
 import botocore.exceptions
 import pytest
 import requests
 
-from lambdas.train_location_fetch.main import fetch_cta_data, write_to_firehose, handler
+from lambdas.train_location_fetch import main
+from lambdas.train_location_fetch.main import (
+    TRAIN_LINES,
+    FirehoseSink,
+    aiohttp,
+    fetch_all_lines,
+    fetch_cta_data,
+    fetch_cta_data_async,
+    get_firehose_client,
+    get_http_session,
+    handler,
+    poll_snapshots,
+    write_to_firehose,
+)
+
+
+class MockCtaApiServer:
+    """Local HTTP server standing in for the CTA train positions API."""
+
+    def __init__(
+        self,
+        failures: dict | None = None,
+        delays: dict | None = None,
+        invalid_responses: dict | None = None,
+    ):
+        """
+        Start the server on a free local port.
+
+        Args:
+            failures: Number of 503 responses to return for each line before succeeding.
+            delays: Seconds to wait before responding for each line.
+            invalid_responses: Number of truncated JSON bodies to return for each line
+                before succeeding.
+        """
+        self.failures = dict(failures or {})
+        self.delays = dict(delays or {})
+        self.invalid_responses = dict(invalid_responses or {})
+        self.requests = []
+        server = self
+
+        class RequestHandler(http.server.BaseHTTPRequestHandler):
+            # Keep connections alive like the real API
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                params = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+                line = params["rt"][0]
+                server.requests.append(line)
+                time.sleep(server.delays.get(line, 0))
+                if server.failures.get(line, 0) > 0:
+                    server.failures[line] -= 1
+                    self.send_response(503)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body = json.dumps({"ctatt": {"route": [{"@name": line}]}}).encode()
+                if server.invalid_responses.get(line, 0) > 0:
+                    server.invalid_responses[line] -= 1
+                    body = body[: len(body) // 2]
+                # The real API labels its JSON responses as text/plain
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        class Server(http.server.ThreadingHTTPServer):
+            # Room for every line to connect at once without the client backing off
+            request_queue_size = 64
+
+        self.httpd = Server(("127.0.0.1", 0), RequestHandler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}/api/1.0/ttpositions.aspx"
+        self.thread = threading.Thread(
+            target=self.httpd.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True
+        )
+        self.thread.start()
+
+    def close(self):
+        """Stop the server."""
+        self.httpd.shutdown()
+        self.httpd.server_close()
 
 
 class TestFetchCtaData(unittest.TestCase):
     """Class for testing fetch_cta_data function."""
 
-    @patch("lambdas.train_location_fetch.main.requests.get")
-    def test_fetch_cta_data_success(self, mock_get):
+    @patch("lambdas.train_location_fetch.main.get_http_session")
+    def test_fetch_cta_data_success(self, mock_get_session):
         """Tests successful API request to CTA API to get train locations."""
         # Arrange
+        mock_get = mock_get_session.return_value.get
         mock_response = MagicMock()
         mock_response.raise_for_status.return_value = None
         mock_response.json.return_value = {"data": "test"}
@@ -38,11 +128,18 @@ class TestFetchCtaData(unittest.TestCase):
         )
         self.assertEqual(result, {"data": "test"})
 
-    @patch("lambdas.train_location_fetch.main.requests.get")
+    @patch("lambdas.train_location_fetch.main.get_http_session")
     @patch("lambdas.train_location_fetch.main.time.sleep")
-    def test_fetch_cta_data_http_error_exhaust_retries(self, mock_sleep, mock_get):
+    @patch(
+        "lambdas.train_location_fetch.main.random.uniform",
+        side_effect=lambda low, high: high,
+    )
+    def test_fetch_cta_data_http_error_exhaust_retries(
+        self, mock_uniform, mock_sleep, mock_get_session
+    ):
         """Tests HTTP error with max retries exhausted."""
         # Arrange
+        mock_get = mock_get_session.return_value.get
         mock_get.return_value.raise_for_status.side_effect = (
             requests.exceptions.HTTPError("404 Not Found")
         )
@@ -55,11 +152,18 @@ class TestFetchCtaData(unittest.TestCase):
         mock_sleep.assert_any_call(1)
         mock_sleep.assert_any_call(2)
 
-    @patch("lambdas.train_location_fetch.main.requests.get")
+    @patch("lambdas.train_location_fetch.main.get_http_session")
     @patch("lambdas.train_location_fetch.main.time.sleep")
-    def test_fetch_cta_data_timeout_retry_success(self, mock_sleep, mock_get):
+    @patch(
+        "lambdas.train_location_fetch.main.random.uniform",
+        side_effect=lambda low, high: high,
+    )
+    def test_fetch_cta_data_timeout_retry_success(
+        self, mock_uniform, mock_sleep, mock_get_session
+    ):
         """Tests timeout followed by successful retry."""
         # Arrange
+        mock_get = mock_get_session.return_value.get
         mock_response = MagicMock()
         mock_response.raise_for_status.return_value = None
         mock_response.json.return_value = {"data": "retry_success"}
@@ -73,51 +177,426 @@ class TestFetchCtaData(unittest.TestCase):
         mock_sleep.assert_called_once_with(1)
         self.assertEqual(result, {"data": "retry_success"})
 
+    @patch("lambdas.train_location_fetch.main.get_http_session")
+    @patch("lambdas.train_location_fetch.main.time.sleep")
+    def test_fetch_cta_data_no_retry_past_deadline(self, mock_sleep, mock_get_session):
+        """Tests a retry that could time out after the deadline is not made."""
+        # Arrange
+        mock_get = mock_get_session.return_value.get
+        mock_get.side_effect = requests.exceptions.Timeout("Timeout")
 
-class TestWriteToFirehose(unittest.TestCase):
-    """Class for testing write_to_firehose function."""
+        # Act & Assert
+        with pytest.raises(requests.exceptions.Timeout):
+            fetch_cta_data(
+                line="test",
+                api_key="test_key",
+                max_retries=2,
+                deadline=time.monotonic() + 4,
+            )
 
-    @patch("lambdas.train_location_fetch.main.boto3.client")
-    def test_firehose_write_success(self, mock_client):
-        """Tests successfully writing payload to Firehose."""
+        self.assertEqual(mock_get.call_count, 1)
+        mock_sleep.assert_not_called()
+
+
+@unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+class TestFetchCtaDataAsync(unittest.IsolatedAsyncioTestCase):
+    """Class for testing fetch_cta_data_async function."""
+
+    def setUp(self):
+        self.server = MockCtaApiServer(failures={"red": 1}, delays={"y": 0.5})
+        self.addCleanup(self.server.close)
+        url_patcher = patch(
+            "lambdas.train_location_fetch.main.API_BASE_URL", self.server.url
+        )
+        url_patcher.start()
+        self.addCleanup(url_patcher.stop)
+
+    async def test_fetch_cta_data_async_success(self):
+        """Tests successful API request to the mock CTA API."""
+        # Arrange
+        async with aiohttp.ClientSession() as session:
+            # Act
+            result = await fetch_cta_data_async(
+                session=session, line="blue", api_key="test_key"
+            )
+
+        # Assert
+        self.assertEqual(result, {"ctatt": {"route": [{"@name": "blue"}]}})
+
+    @patch("lambdas.train_location_fetch.main.random.uniform", return_value=0)
+    async def test_fetch_cta_data_async_retry_success(self, mock_uniform):
+        """Tests a failed request is retried after a jittered wait."""
+        # Arrange
+        async with aiohttp.ClientSession() as session:
+            # Act
+            result = await fetch_cta_data_async(
+                session=session, line="red", api_key="test_key"
+            )
+
+        # Assert
+        self.assertEqual(self.server.requests, ["red", "red"])
+        mock_uniform.assert_called_once_with(0, 1)
+        self.assertEqual(result["ctatt"]["route"][0]["@name"], "red")
+
+    @patch("lambdas.train_location_fetch.main.random.uniform", return_value=0)
+    async def test_fetch_cta_data_async_timeout_exhaust_retries(self, mock_uniform):
+        """Tests a request slower than its timeout fails after all retries."""
+        # Arrange
+        timeout = aiohttp.ClientTimeout(total=0.1)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            # Act & Assert
+            with pytest.raises(asyncio.TimeoutError):
+                await fetch_cta_data_async(
+                    session=session, line="y", api_key="test_key", max_retries=1
+                )
+
+        self.assertEqual(self.server.requests, ["y", "y"])
+
+
+class TestFetchAllLines(unittest.TestCase):
+    """Class for testing fetch_all_lines function."""
+
+    def setUp(self):
+        self.server = MockCtaApiServer(failures={"red": 3})
+        self.addCleanup(self.server.close)
+        url_patcher = patch(
+            "lambdas.train_location_fetch.main.API_BASE_URL", self.server.url
+        )
+        url_patcher.start()
+        self.addCleanup(url_patcher.stop)
+
+    @patch("lambdas.train_location_fetch.main.time.sleep")
+    def test_fetch_all_lines_threads(self, mock_sleep):
+        """Tests the thread engine fetches every line, skipping one that keeps failing."""
+        # Act
+        result = fetch_all_lines(api_key="test_key", engine="threads")
+
+        # Assert
+        fetched = sorted(data["ctatt"]["route"][0]["@name"] for data in result)
+        self.assertEqual(fetched, sorted(set(TRAIN_LINES) - {"red"}))
+
+    @unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+    @patch("lambdas.train_location_fetch.main.random.uniform", return_value=0)
+    @patch("lambdas.train_location_fetch.main._async_http_session", None)
+    @patch("lambdas.train_location_fetch.main._event_loop", None)
+    def test_fetch_all_lines_asyncio(self, mock_uniform):
+        """Tests the asyncio engine returns the same lines as the thread engine."""
+        # Act
+        result = fetch_all_lines(api_key="test_key", engine="asyncio")
+        event_loop = main._event_loop
+        event_loop.run_until_complete(main._async_http_session.close())
+        event_loop.close()
+
+        # Assert
+        fetched = sorted(data["ctatt"]["route"][0]["@name"] for data in result)
+        self.assertEqual(fetched, sorted(set(TRAIN_LINES) - {"red"}))
+
+    @patch("lambdas.train_location_fetch.main.time.sleep")
+    @patch("lambdas.train_location_fetch.main.random.uniform", return_value=0)
+    @patch("lambdas.train_location_fetch.main._async_http_session", None)
+    @patch("lambdas.train_location_fetch.main._event_loop", None)
+    def test_fetch_all_lines_engines_retry_invalid_json(self, mock_uniform, mock_sleep):
+        """Tests both engines retry a response that is not valid JSON."""
+        engines = ["threads", "asyncio"] if aiohttp is not None else ["threads"]
+        for engine in engines:
+            with self.subTest(engine=engine):
+                # Arrange
+                self.server.invalid_responses = {"blue": 1}
+
+                # Act
+                result = fetch_all_lines(api_key="test_key", engine=engine)
+
+                # Assert
+                fetched = sorted(data["ctatt"]["route"][0]["@name"] for data in result)
+                self.assertIn("blue", fetched)
+                self.assertEqual(self.server.invalid_responses, {"blue": 0})
+        if main._event_loop is not None:
+            main._event_loop.run_until_complete(main._async_http_session.close())
+            main._event_loop.close()
+
+    @patch("lambdas.train_location_fetch.main.aiohttp", None)
+    def test_fetch_all_lines_asyncio_not_installed(self):
+        """Tests selecting the asyncio engine without aiohttp raises an error."""
+        # Act & Assert
+        with pytest.raises(ValueError, match="requires aiohttp"):
+            fetch_all_lines(api_key="test_key", engine="asyncio")
+
+    def test_fetch_all_lines_unknown_engine(self):
+        """Tests selecting an unknown engine raises an error."""
+        # Act & Assert
+        with pytest.raises(ValueError, match="Unknown fetch engine"):
+            fetch_all_lines(api_key="test_key", engine="processes")
+
+
+class FakeClock:
+    """Monotonic clock that only advances when slept on or told to."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestPollSnapshots(unittest.TestCase):
+    """Class for testing poll_snapshots function."""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        for name in ["monotonic", "sleep"]:
+            patcher = patch(
+                f"lambdas.train_location_fetch.main.time.{name}",
+                getattr(self.clock, name),
+            )
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.context = MagicMock()
+        self.context.get_remaining_time_in_millis.side_effect = lambda: (
+            60_000 - self.clock.now * 1000
+        )
+
+    @patch("lambdas.train_location_fetch.main.poll_snapshot")
+    def test_poll_snapshots_corrects_drift(self, mock_poll):
+        """Tests polls start on a fixed cadence regardless of how long each takes."""
+        # Arrange
+        poll_times = []
+
+        def poll(api_key, engine, deadline):
+            poll_times.append(self.clock.now)
+            self.clock.now += 2.5
+            return {"timestamp": str(self.clock.now), "data": []}
+
+        mock_poll.side_effect = poll
+
+        # Act
+        result = poll_snapshots(
+            context=self.context,
+            api_key="test_key",
+            engine="threads",
+            interval_seconds=15,
+            duration_seconds=55,
+        )
+
+        # Assert
+        self.assertEqual(len(result), 4)
+        self.assertEqual(poll_times, [0, 15, 30, 45])
+        self.assertEqual(self.clock.sleeps, [12.5, 12.5, 12.5])
+
+    @patch("lambdas.train_location_fetch.main.poll_snapshot")
+    def test_poll_snapshots_skips_missed_slots(self, mock_poll):
+        """Tests a poll overrunning the next slot waits for the following one."""
+        # Arrange
+        poll_times = []
+        durations = iter([20, 1, 1])
+
+        def poll(api_key, engine, deadline):
+            poll_times.append(self.clock.now)
+            self.clock.now += next(durations)
+            return {"timestamp": str(self.clock.now), "data": []}
+
+        mock_poll.side_effect = poll
+
+        # Act
+        result = poll_snapshots(
+            context=self.context,
+            api_key="test_key",
+            engine="threads",
+            interval_seconds=15,
+            duration_seconds=55,
+        )
+
+        # Assert
+        self.assertEqual(len(result), 3)
+        self.assertEqual(poll_times, [0, 30, 45])
+
+    @patch("lambdas.train_location_fetch.main.poll_snapshot")
+    def test_poll_snapshots_stops_before_deadline(self, mock_poll):
+        """Tests polling stops when too little invocation time would be left."""
+        # Arrange
+        self.context.get_remaining_time_in_millis.side_effect = lambda: (
+            35_000 - self.clock.now * 1000
+        )
+        mock_poll.return_value = {"timestamp": "now", "data": []}
+
+        # Act
+        result = poll_snapshots(
+            context=self.context,
+            api_key="test_key",
+            engine="threads",
+            interval_seconds=15,
+            duration_seconds=55,
+        )
+
+        # Assert
+        self.assertEqual(len(result), 2)
+        self.assertEqual(self.clock.sleeps, [15])
+
+    @patch("lambdas.train_location_fetch.main.poll_snapshot")
+    def test_poll_snapshots_retry_deadline_reserves_publish(self, mock_poll):
+        """Tests each poll's retries must finish before the time kept for publishing."""
         # Arrange
-        mock_client.return_value = MagicMock()
-        mock_client.return_value.put_record.return_value = None
+        deadlines = []
+
+        def poll(api_key, engine, deadline):
+            deadlines.append(deadline)
+            self.clock.now += 2.5
+            return {"timestamp": str(self.clock.now), "data": []}
+
+        mock_poll.side_effect = poll
+
+        # Act
+        poll_snapshots(
+            context=self.context,
+            api_key="test_key",
+            engine="threads",
+            interval_seconds=15,
+            duration_seconds=55,
+        )
+
+        # Assert
+        self.assertEqual(deadlines, [55.0, 55.0, 55.0, 55.0])
 
+
+class TestGetHttpSession(unittest.TestCase):
+    """Class for testing get_http_session function."""
+
+    @patch("lambdas.train_location_fetch.main._http_session", None)
+    def test_get_http_session_reused(self):
+        """Tests the session is created once and pools a connection per worker."""
         # Act
-        write_to_firehose(payload="test")
+        first = get_http_session()
+        second = get_http_session()
 
         # Assert
-        mock_client.return_value.put_record.assert_called_with(
+        self.assertIs(first, second)
+        adapter = first.get_adapter(
+            "http://lapi.transitchicago.com/api/1.0/ttpositions.aspx"
+        )
+        self.assertEqual(adapter._pool_maxsize, 8)
+
+
+class TestFirehoseSink(unittest.TestCase):
+    """Class for testing FirehoseSink class and write_to_firehose function."""
+
+    def setUp(self):
+        patcher = patch("lambdas.train_location_fetch.main.get_firehose_client")
+        self.mock_client = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.mock_client.put_record_batch.return_value = {
+            "FailedPutCount": 0,
+            "RequestResponses": [],
+        }
+
+    def test_firehose_write_success(self):
+        """Tests payloads are sent in a single batch."""
+        # Act
+        write_to_firehose(payloads=["one\n", "two\n"])
+
+        # Assert
+        self.mock_client.put_record_batch.assert_called_once_with(
             DeliveryStreamName="cta-train-locations-stream",
-            Record={"Data": "test"},
+            Records=[{"Data": b"one\n"}, {"Data": b"two\n"}],
         )
 
-    @patch("lambdas.train_location_fetch.main.boto3.client")
-    def test_firehose_write_failure(self, mock_client):
-        """Tests failure in writing payload to Firehose."""
-        # Arrange
-        mock_client.return_value = MagicMock()
-        mock_client.return_value.put_record.side_effect = (
-            botocore.exceptions.ClientError(
-                error_response={
-                    "Error": {
-                        "Code": "InternalServerError",
-                        "Message": "InternalServerError",
-                    }
-                },
-                operation_name="GetParameter",
-            )
+    def test_firehose_write_failure(self):
+        """Tests failure in writing payloads to Firehose."""
+        # Arrange
+        self.mock_client.put_record_batch.side_effect = botocore.exceptions.ClientError(
+            error_response={
+                "Error": {
+                    "Code": "InternalServerError",
+                    "Message": "InternalServerError",
+                }
+            },
+            operation_name="PutRecordBatch",
         )
 
         # Act + Assert
         with pytest.raises(botocore.exceptions.ClientError):
-            write_to_firehose(payload="test")
+            write_to_firehose(payloads=["test"])
 
-        mock_client.return_value.put_record.assert_called_with(
-            DeliveryStreamName="cta-train-locations-stream",
-            Record={"Data": "test"},
+    @patch("lambdas.train_location_fetch.main.FIREHOSE_MAX_BATCH_RECORDS", 2)
+    @patch("lambdas.train_location_fetch.main.FIREHOSE_MAX_BATCH_BYTES", 10)
+    def test_firehose_sink_respects_batch_limits(self):
+        """Tests batches are cut at the record count and byte limits."""
+        # Arrange
+        sink = FirehoseSink()
+
+        # Act
+        for record in ["a", "b", "c", "dddddd", "eeee", "f"]:
+            sink.add(record)
+        sink.flush()
+
+        # Assert
+        batches = [
+            [record["Data"] for record in call.kwargs["Records"]]
+            for call in self.mock_client.put_record_batch.call_args_list
+        ]
+        self.assertEqual(batches, [[b"a", b"b"], [b"c", b"dddddd"], [b"eeee", b"f"]])
+
+    def test_firehose_sink_rejects_oversized_record(self):
+        """Tests a record larger than Firehose accepts raises an error."""
+        # Act & Assert
+        with pytest.raises(ValueError, match="exceeds the Firehose limit"):
+            FirehoseSink().add(b"x" * (1000 * 1024 + 1))
+
+    @patch("lambdas.train_location_fetch.main.time.sleep")
+    def test_firehose_sink_resends_failed_records(self, mock_sleep):
+        """Tests only the records Firehose failed to put are resent."""
+        # Arrange
+        self.mock_client.put_record_batch.side_effect = [
+            {
+                "FailedPutCount": 1,
+                "RequestResponses": [
+                    {"RecordId": "1"},
+                    {"ErrorCode": "ServiceUnavailableException"},
+                    {"RecordId": "3"},
+                ],
+            },
+            {"FailedPutCount": 0, "RequestResponses": [{"RecordId": "2"}]},
+        ]
+
+        # Act
+        write_to_firehose(payloads=["one", "two", "three"])
+
+        # Assert
+        self.assertEqual(self.mock_client.put_record_batch.call_count, 2)
+        self.assertEqual(
+            self.mock_client.put_record_batch.call_args.kwargs["Records"],
+            [{"Data": b"two"}],
         )
+        mock_sleep.assert_called_once()
+
+    @patch("lambdas.train_location_fetch.main.time.sleep")
+    def test_firehose_sink_gives_up_after_max_attempts(self, mock_sleep):
+        """Tests records still failing after every attempt raise an error."""
+        # Arrange
+        self.mock_client.put_record_batch.return_value = {
+            "FailedPutCount": 1,
+            "RequestResponses": [{"ErrorCode": "ServiceUnavailableException"}],
+        }
+
+        # Act & Assert
+        with pytest.raises(RuntimeError, match="failed to put 1 records"):
+            write_to_firehose(payloads=["one"])
+        self.assertEqual(self.mock_client.put_record_batch.call_count, 3)
+
+    @patch("lambdas.train_location_fetch.main._firehose_client", None)
+    @patch("lambdas.train_location_fetch.main.boto3.client")
+    def test_get_firehose_client_reused(self, mock_client):
+        """Tests the Firehose client is created once and then reused."""
+        # Act
+        first = get_firehose_client()
+        second = get_firehose_client()
+
+        # Assert
+        mock_client.assert_called_once_with("firehose")
+        self.assertIs(first, second)
 
 
 class TestLambdaHandler(unittest.TestCase):
@@ -166,8 +645,7 @@ class TestLambdaHandler(unittest.TestCase):
         self.assertEqual(result["count"], 8)
         self.assertTrue(mock_firehose.called)
 
-        args, kwargs = mock_firehose.call_args
-        sent_payload = kwargs.get("payload") or args[0]
+        (sent_payload,) = mock_firehose.call_args.kwargs["payloads"]
         self.assertIn("timestamp", sent_payload)
         self.assertTrue(sent_payload.endswith("\n"))
 
@@ -196,3 +674,111 @@ class TestLambdaHandler(unittest.TestCase):
         self.assertEqual(result["count"], 7)
         self.assertEqual(result["status"], "success")
         self.assertTrue(mock_firehose.called)
+
+    @patch("lambdas.train_location_fetch.main.write_to_firehose")
+    @patch("lambdas.train_location_fetch.main.fetch_all_lines")
+    def test_handler_engine_from_event(self, mock_fetch_all, mock_firehose):
+        """Tests the fetch engine can be selected in the event."""
+        # Arrange
+        mock_fetch_all.return_value = [{"data": "ok"}]
+        context = MagicMock()
+        context.function_name = "live-function"
+
+        # Act
+        result = handler(event={"engine": "asyncio"}, context=context)
+
+        # Assert
+        mock_fetch_all.assert_called_once_with(
+            api_key="test_key", engine="asyncio", deadline=None
+        )
+        self.assertEqual(result["count"], 1)
+
+    @patch("lambdas.train_location_fetch.main.write_to_firehose")
+    @patch("lambdas.train_location_fetch.main.poll_snapshots")
+    def test_handler_polling_loop(self, mock_poll_snapshots, mock_firehose):
+        """Tests snapshots polled in a loop are sent together, one record each."""
+        # Arrange
+        mock_poll_snapshots.return_value = [
+            {"timestamp": "t1", "data": [{"data": "ok"}] * 8},
+            {"timestamp": "t2", "data": [{"data": "ok"}] * 7},
+        ]
+        context = MagicMock()
+        context.function_name = "live-function"
+
+        # Act
+        result = handler(
+            event={"poll_interval_seconds": 15, "poll_duration_seconds": 55},
+            context=context,
+        )
+
+        # Assert
+        self.assertEqual(mock_poll_snapshots.call_args.kwargs["interval_seconds"], 15)
+        self.assertEqual(result["count"], 15)
+        self.assertEqual(result["snapshots"], 2)
+        mock_firehose.assert_called_once()
+        payloads = mock_firehose.call_args.kwargs["payloads"]
+        self.assertEqual(
+            [json.loads(payload)["timestamp"] for payload in payloads], ["t1", "t2"]
+        )
+
+    @patch("lambdas.train_location_fetch.main.write_to_firehose")
+    @patch("lambdas.train_location_fetch.main.poll_snapshots")
+    def test_handler_delta_encoding(self, mock_poll_snapshots, mock_firehose):
+        """Tests the first snapshot is sent as a keyframe and later ones as deltas."""
+        # Arrange
+        route = {"@name": "red", "train": [{"rn": "801", "nextStaNm": "Howard"}]}
+        mock_poll_snapshots.return_value = [
+            {"timestamp": "t1", "data": [{"ctatt": {"route": [route]}}]},
+            {"timestamp": "t2", "data": [{"ctatt": {"route": [route]}}]},
+        ]
+        context = MagicMock()
+        context.function_name = "live-function"
+
+        # Act
+        with patch.object(main, "_delta_encoder", None):
+            handler(
+                event={"payload_encoding": "delta", "poll_interval_seconds": 15},
+                context=context,
+            )
+
+        # Assert
+        payloads = [
+            json.loads(payload)
+            for payload in mock_firehose.call_args.kwargs["payloads"]
+        ]
+        self.assertTrue(payloads[0]["keyframe"])
+        self.assertEqual(payloads[1]["base"], payloads[0]["seq"])
+        self.assertEqual(
+            payloads[1]["data"][0]["ctatt"]["route"][0]["trainDelta"], [{"rn": "801"}]
+        )
+
+    @patch("lambdas.train_location_fetch.main.write_to_firehose")
+    @patch("lambdas.train_location_fetch.main.poll_snapshots")
+    def test_handler_delta_encoding_resets_after_failure(
+        self, mock_poll_snapshots, mock_firehose
+    ):
+        """Tests a failed send makes the next snapshot a keyframe again."""
+        # Arrange
+        route = {"@name": "red", "train": [{"rn": "801", "nextStaNm": "Howard"}]}
+        mock_poll_snapshots.return_value = [
+            {"timestamp": "t1", "data": [{"ctatt": {"route": [route]}}]}
+        ]
+        mock_firehose.side_effect = [RuntimeError("Firehose down"), None]
+        context = MagicMock()
+        context.function_name = "live-function"
+
+        # Act
+        with patch.object(main, "_delta_encoder", None):
+            with self.assertRaises(RuntimeError):
+                handler(
+                    event={"payload_encoding": "delta", "poll_interval_seconds": 15},
+                    context=context,
+                )
+            handler(
+                event={"payload_encoding": "delta", "poll_interval_seconds": 15},
+                context=context,
+            )
+
+        # Assert
+        (payload,) = mock_firehose.call_args.kwargs["payloads"]
+        self.assertTrue(json.loads(payload)["keyframe"])